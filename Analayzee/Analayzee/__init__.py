@@ -0,0 +1,7 @@
+try:
+    # Celery is only installed in production (requirements-prod.txt)
+    from .celery import app as celery_app
+except ImportError:
+    celery_app = None
+
+__all__ = ('celery_app',)
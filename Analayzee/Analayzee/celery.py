@@ -0,0 +1,15 @@
+"""
+Celery application for background ingestion when INGEST_BACKEND is 'celery'.
+
+Start a worker with:
+    celery -A Analayzee worker -l info
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Analayzee.settings')
+
+app = Celery('Analayzee')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
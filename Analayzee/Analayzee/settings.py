@@ -162,6 +162,13 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploaded datasets are written to disk as Feather files; the session only keeps their ID
+DATASET_STORE_ROOT = Path(os.environ.get('DATASET_STORE_ROOT', MEDIA_ROOT / 'datasets'))
+# Versions of a dataset kept for undo/redo; cleaning steps only store the columns they change
+DATASET_MAX_VERSIONS = int(os.environ.get('DATASET_MAX_VERSIONS', '20'))
+# Memory budget for decoded DataFrames cached in each worker process
+DATASET_CACHE_MAX_BYTES = int(os.environ.get('DATASET_CACHE_MAX_MB', '256')) * 1024 * 1024
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -221,6 +228,45 @@ SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 1000
+# Rows parsed per chunk when streaming an upload into the dataset store
+INGEST_CHUNK_ROWS = int(os.environ.get('INGEST_CHUNK_ROWS', '50000'))
+# CSV parser: 'auto' (pyarrow, retried with the C engine if it fails), 'pyarrow', 'c' or 'python'
+CSV_PARSER_ENGINE = os.environ.get('CSV_PARSER_ENGINE', 'auto')
+# Downcast numbers, turn repetitive text into categories and parse ISO dates at ingest
+INGEST_COMPACT_DTYPES = os.environ.get('INGEST_COMPACT_DTYPES', 'True').lower() == 'true'
+# Where uploads are parsed: 'thread' (pool inside each web worker), 'celery' or 'sync'
+INGEST_BACKEND = os.environ.get('INGEST_BACKEND', 'thread')
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', '2'))
+# Seconds without progress before a job is considered dead
+INGEST_JOB_TIMEOUT = int(os.environ.get('INGEST_JOB_TIMEOUT', '600'))
+# Most rows a single /api/rows/ request may return
+ROWS_API_MAX_LIMIT = int(os.environ.get('ROWS_API_MAX_LIMIT', '10000'))
+# Build an inverted index of the text columns whenever a dataset version is written
+SEARCH_INDEX_ENABLED = os.environ.get('SEARCH_INDEX_ENABLED', 'True').lower() == 'true'
+# Per-worker memory for cached sort orders and filtered row sets of the table view
+QUERY_CACHE_MAX_BYTES = int(os.environ.get('QUERY_CACHE_MAX_MB', '64')) * 1024 * 1024
+# Most frequent values kept per text/category column in the /api/profile/ profile
+PROFILE_TOP_K = int(os.environ.get('PROFILE_TOP_K', '20'))
+# Most buckets (bars, bins, slices) /api/aggregate/ returns for one chart
+AGGREGATE_MAX_BUCKETS = int(os.environ.get('AGGREGATE_MAX_BUCKETS', '500'))
+# Most points a downsampled line/scatter series from /api/charts-data/ may ask for
+CHART_MAX_POINTS = int(os.environ.get('CHART_MAX_POINTS', '10000'))
+# Build t-digest/HyperLogLog sketches of every column while a dataset is written
+COLUMN_SKETCHES_ENABLED = os.environ.get('COLUMN_SKETCHES_ENABLED', 'True').lower() == 'true'
+# Store a 64-bit fingerprint of every row with each version, used to find duplicate rows
+ROW_FINGERPRINTS_ENABLED = os.environ.get('ROW_FINGERPRINTS_ENABLED', 'True').lower() == 'true'
+# From this many rows, cleaning takes quantiles from the sketches instead of sorting the column
+SKETCH_QUANTILES_MIN_ROWS = int(os.environ.get('SKETCH_QUANTILES_MIN_ROWS', '1000000'))
+# Rows sampled (per dataset version and column) to preview a cleaning step before applying it
+CLEANING_PREVIEW_SAMPLE_ROWS = int(os.environ.get('CLEANING_PREVIEW_SAMPLE_ROWS', '5000'))
+# Versions larger than this (in Arrow bytes) are cleaned out of core, CLEANING_CHUNK_ROWS rows at a time
+CLEANING_IN_MEMORY_MAX_BYTES = int(os.environ.get('CLEANING_IN_MEMORY_MAX_MB', '1024')) * 1024 * 1024
+CLEANING_CHUNK_ROWS = int(os.environ.get('CLEANING_CHUNK_ROWS', '1000000'))
+# Processes each web worker may use to profile wide datasets in parallel (1 profiles in-process)
+PROFILE_MAX_WORKERS = int(os.environ.get('PROFILE_MAX_WORKERS', '4'))
+
+# Celery (only used when INGEST_BACKEND = 'celery')
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
 
 # Logging Configuration
 LOGGING = {
@@ -0,0 +1,131 @@
+"""Ingest-time dtype compaction for Arrow tables.
+
+Statistics are gathered chunk by chunk, then every chunk is cast to the
+smallest schema that still holds all of the data: integers are downcast by
+their range, floats go to float32 only when that is lossless, low-cardinality
+text becomes a dictionary (pandas ``category``) and ISO-formatted text becomes
+timestamps.
+"""
+import pyarrow as pa
+import pyarrow.compute as pc
+
+CATEGORY_MAX_UNIQUE = 1000
+# Only worth it when values repeat; at most one distinct value per two rows
+CATEGORY_MAX_RATIO = 0.5
+ISO_DATETIME_PATTERN = r'^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d{1,9})?)?)?$'
+INTEGER_TYPES = [
+    (pa.int8(), -2 ** 7, 2 ** 7 - 1),
+    (pa.int16(), -2 ** 15, 2 ** 15 - 1),
+    (pa.int32(), -2 ** 31, 2 ** 31 - 1),
+]
+DATETIME_TYPE = pa.timestamp('ns')
+
+
+class ColumnStats:
+    """Running statistics for one column, fed one chunk at a time."""
+
+    def __init__(self, data_type):
+        self.type = data_type
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.float32_exact = pa.types.is_floating(data_type)
+        self.datetime_like = pa.types.is_string(data_type) or pa.types.is_large_string(data_type)
+        self.uniques = set() if self.datetime_like else None
+
+    def update(self, values):
+        valid = pc.drop_null(values)
+        self.count += len(valid)
+        if not len(valid):
+            return
+
+        if pa.types.is_integer(self.type) or pa.types.is_floating(self.type):
+            min_max = pc.min_max(valid).as_py()
+            self.min = min_max['min'] if self.min is None else min(self.min, min_max['min'])
+            self.max = min_max['max'] if self.max is None else max(self.max, min_max['max'])
+            if self.float32_exact:
+                roundtrip = pc.cast(pc.cast(valid, pa.float32(), safe=False), pa.float64())
+                self.float32_exact = bool(pc.all(pc.equal(roundtrip, valid)).as_py())
+            return
+
+        if self.datetime_like:
+            self.datetime_like = bool(pc.all(pc.match_substring_regex(valid, ISO_DATETIME_PATTERN)).as_py())
+            if self.datetime_like:
+                try:
+                    pc.cast(valid, DATETIME_TYPE)
+                except pa.ArrowInvalid:
+                    # Looks like a date but is not one (e.g. 2021-13-45) or is out of range
+                    self.datetime_like = False
+
+        if self.uniques is not None:
+            self.uniques.update(pc.unique(valid).to_pylist())
+            if len(self.uniques) > CATEGORY_MAX_UNIQUE:
+                self.uniques = None
+
+    def target(self):
+        """Return ``(arrow_type, dictionary_or_None)`` this column should be stored as."""
+        if not self.count:
+            return self.type, None
+
+        if pa.types.is_integer(self.type):
+            for int_type, low, high in INTEGER_TYPES:
+                if low <= self.min and self.max <= high:
+                    return int_type, None
+            return self.type, None
+
+        if pa.types.is_floating(self.type):
+            return (pa.float32() if self.float32_exact else self.type), None
+
+        if self.datetime_like:
+            return DATETIME_TYPE, None
+
+        if self.uniques is not None and len(self.uniques) <= self.count * CATEGORY_MAX_RATIO:
+            dictionary = pa.array(sorted(self.uniques), type=self.type)
+            index_type = next(int_type for int_type, _, high in INTEGER_TYPES if len(dictionary) <= high)
+            return pa.dictionary(index_type, self.type), dictionary
+
+        return self.type, None
+
+
+class Compactor:
+    """Collects statistics for a schema, then casts tables to the compacted schema."""
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.stats = {field.name: ColumnStats(field.type) for field in schema}
+        self.target_schema = None
+        self.dictionaries = {}
+
+    def update(self, table):
+        for name, column in zip(table.column_names, table.columns):
+            self.stats[name].update(column)
+
+    def finish(self):
+        """Settle the compacted schema once every chunk has been seen."""
+        fields = []
+        for field in self.schema:
+            target_type, dictionary = self.stats[field.name].target()
+            fields.append(pa.field(field.name, target_type))
+            if dictionary is not None:
+                self.dictionaries[field.name] = dictionary
+        self.target_schema = pa.schema(fields)
+        return self.target_schema
+
+    def compact(self, table):
+        """Cast a table from the original schema to the compacted one."""
+        columns = []
+        for field, column in zip(self.target_schema, table.columns):
+            dictionary = self.dictionaries.get(field.name)
+            if dictionary is not None:
+                # One shared dictionary keeps every record batch in the file compatible
+                column = pa.chunked_array([
+                    pa.DictionaryArray.from_arrays(
+                        pc.index_in(chunk, value_set=dictionary).cast(field.type.index_type),
+                        dictionary,
+                    )
+                    for chunk in column.chunks
+                ], type=field.type)
+            elif not column.type.equals(field.type):
+                column = column.cast(field.type)
+            columns.append(column)
+        return pa.Table.from_arrays(columns, schema=self.target_schema)
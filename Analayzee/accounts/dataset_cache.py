@@ -0,0 +1,120 @@
+"""Per-process LRU caches of decoded DataFrames and derived arrays.
+
+Entries are keyed by tuples starting with ``(dataset_id, version)`` so a new
+version written by any worker is picked up as a miss, and each cache is
+bounded by the memory held by its values rather than by entry count.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def _nbytes(value):
+    """Memory held by a DataFrame/Series (deep), a numpy array or a bytes payload."""
+    if hasattr(value, 'memory_usage'):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, 'sum') else int(usage)
+    if isinstance(value, bytes):
+        return len(value)
+    return int(value.nbytes)
+
+
+class DataFrameCache:
+    """Thread-safe LRU of DataFrames (or arrays, bytes) evicted by a byte budget."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached frame for ``key`` or None, updating hit/miss counters."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, df):
+        """Cache ``df`` under ``key``, evicting least recently used frames to fit."""
+        nbytes = _nbytes(df)
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (df, nbytes)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._discard(oldest_key)
+                self.evictions += 1
+
+    def invalidate(self, dataset_id):
+        """Drop every cached version of a dataset."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == dataset_id]:
+                self._discard(key)
+
+    def clear(self):
+        """Drop every cached frame."""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Counters for monitoring and the debug store page."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+
+
+_cache = None
+_query_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_dataframe_cache():
+    """Return this worker's cache, sized by ``DATASET_CACHE_MAX_BYTES``."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = DataFrameCache(getattr(settings, 'DATASET_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+    return _cache
+
+
+def get_query_cache():
+    """Return this worker's cache of sort keys, row orders and profiles, sized by ``QUERY_CACHE_MAX_BYTES``."""
+    global _query_cache
+    if _query_cache is None:
+        with _cache_lock:
+            if _query_cache is None:
+                _query_cache = DataFrameCache(
+                    getattr(settings, 'QUERY_CACHE_MAX_BYTES', DEFAULT_QUERY_CACHE_MAX_BYTES)
+                )
+    return _query_cache
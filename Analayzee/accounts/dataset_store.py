@@ -0,0 +1,859 @@
+"""On-disk columnar store for uploaded datasets.
+
+Every dataset gets its own directory under ``DATASET_STORE_ROOT`` holding
+uncompressed Arrow/Feather files and a small ``manifest.json`` pointing at
+the current version. Only the dataset ID travels in the session; frames are
+read back through a memory map so repeated loads are served from the OS page
+cache.
+
+Versions are copy-on-write: a version derived from another (a cleaning step)
+writes only the columns it changed and reads the rest from its parent's
+files. Up to ``DATASET_MAX_VERSIONS`` versions are kept, each with its own
+``v{n}.manifest.json``, so undo, redo and checkout only rewrite the manifest.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from django.conf import settings
+from django.utils import timezone
+
+from .compaction import Compactor
+from .dataset_cache import get_query_cache
+from .fingerprints import (
+    fingerprints_enabled, fingerprints_file_name, load_fingerprints, open_fingerprints, table_fingerprints,
+    update_fingerprints, write_fingerprints,
+)
+from .search_index import build_search_index, is_indexable, load_search_index
+from .sketches import load_column_sketches, new_sketch_builder, write_sketches
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+# Held by whoever is numbering, writing or publishing a version of the dataset (or moving its head)
+WRITE_LOCK_NAME = '.write.lock'
+# Files that belong to one version: v{n}.feather, v{n}.manifest.json, v{n}.search/, ...
+VERSION_FILE_RE = re.compile(r'^v(\d+)\.')
+DATASET_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+TIMESTAMP_UNITS = ('s', 'ms', 'us', 'ns')
+
+
+def get_store_root():
+    """Directory that holds all datasets."""
+    root = getattr(settings, 'DATASET_STORE_ROOT', None)
+    return Path(root) if root else Path(settings.MEDIA_ROOT) / 'datasets'
+
+
+def new_dataset_id():
+    """Generate a new random dataset ID."""
+    return uuid.uuid4().hex
+
+
+def is_valid_dataset_id(dataset_id):
+    """Dataset IDs double as directory names, so only accept uuid hex."""
+    return isinstance(dataset_id, str) and bool(DATASET_ID_RE.match(dataset_id))
+
+
+def get_dataset_dir(dataset_id):
+    """Directory for a single dataset."""
+    if not is_valid_dataset_id(dataset_id):
+        raise ValueError(f'Invalid dataset id: {dataset_id!r}')
+    return get_store_root() / dataset_id
+
+
+def _write_json_atomic(path, payload):
+    """Write JSON next to ``path`` and swap it in so readers never see half a file."""
+    tmp_path = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+
+def read_manifest(dataset_id):
+    """Return the manifest dict of a dataset, or None if it does not exist."""
+    try:
+        path = get_dataset_dir(dataset_id) / MANIFEST_NAME
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        return None
+
+
+def _normalize_for_arrow(df):
+    """Return a frame Arrow can write: string column names and no mixed-type object columns."""
+    df = df.reset_index(drop=True)
+    df.columns = [str(col) for col in df.columns]
+
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed values (e.g. numbers and text in one Excel column): keep them as text
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def column_files(manifest):
+    """``{column: data file name}`` of a version; older manifests keep every column in ``file``."""
+    return manifest.get('column_files') or dict.fromkeys(manifest['columns'], manifest['file'])
+
+
+def version_manifest_name(version):
+    return f'v{version}.manifest.json'
+
+
+def _version_of(file_name):
+    match = VERSION_FILE_RE.match(file_name)
+    return int(match.group(1)) if match else None
+
+
+def _read_version_manifests(dataset_dir):
+    """``{version: manifest}`` of every version still kept in a dataset directory."""
+    manifests = {}
+    for path in dataset_dir.glob(version_manifest_name('*')):
+        try:
+            with open(path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (ValueError, OSError):
+            continue
+        manifests[manifest['version']] = manifest
+    # Datasets written before versions were kept only have the current manifest
+    head = read_manifest(dataset_dir.name)
+    if head is not None:
+        manifests.setdefault(head['version'], head)
+    return manifests
+
+
+@contextmanager
+def _write_lock(dataset_dir):
+    """Hold a dataset's writer lock, waiting for the worker or thread that has it.
+
+    Readers take no lock: they only see manifests, which are swapped in
+    whole, and the files those point at, which never change.
+    """
+    dataset_dir.mkdir(parents=True, exist_ok=True)
+    with open(dataset_dir / WRITE_LOCK_NAME, 'a+b') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        else:
+            handle.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ten seconds
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def _next_version(dataset_id):
+    """Yield ``(dataset_dir, previous_manifest, version)`` for the next write, under the writer lock.
+
+    The version is numbered, written and published before the lock is
+    released, so concurrent writers never take the same number or prune
+    each other's files while they are being written.
+    """
+    dataset_dir = get_dataset_dir(dataset_id)
+    with _write_lock(dataset_dir):
+        previous = read_manifest(dataset_id)
+        # Numbers are never reused, even for versions that were undone and dropped, since caches key on them
+        version = previous.get('last_version', previous['version']) + 1 if previous else 1
+        yield dataset_dir, previous, version
+
+
+def _delete_path(path):
+    try:
+        if path.is_dir():
+            shutil.rmtree(path)
+        else:
+            path.unlink()
+    except OSError:
+        # Another process may still have it mapped on platforms that lock open files
+        pass
+
+
+def _prune_versions(dataset_dir, keep):
+    """Remove every version not in ``keep`` with everything derived from it (index, profile, ...).
+
+    A data file or search index outlives its version while a kept version
+    still reads columns from it or shares it.
+    """
+    kept = [manifest for version, manifest in _read_version_manifests(dataset_dir).items() if version in keep]
+    referenced = {name for manifest in kept for name in column_files(manifest).values()}
+    referenced.update(manifest['search_index'] for manifest in kept if manifest.get('search_index'))
+    for path in dataset_dir.glob('v*.*'):
+        version = _version_of(path.name)
+        if version is not None and version not in keep and path.name not in referenced:
+            _delete_path(path)
+
+
+def _publish_version(
+    dataset_id, dataset_dir, previous, version, tmp_path, table=None, base=None, shared_index=None, **metadata,
+):
+    """Move a fully written file into place, index it, then point the manifest at it.
+
+    ``base`` is the version this one was derived from; the new version joins
+    its history, replacing any versions that were undone past it, and at
+    most ``DATASET_MAX_VERSIONS`` are kept. Without ``base`` the version
+    starts a new history and all older versions are removed. ``table`` is
+    the version's full Arrow table when the caller has it at hand.
+    ``shared_index`` is the search index of ``base`` when the version has
+    the same rows and text columns; it is shared instead of rebuilt.
+    """
+    file_name = f'v{version}.feather'
+    if tmp_path is not None:
+        os.replace(tmp_path, dataset_dir / file_name)
+    if table is None and shared_index is None:
+        table = feather.read_table(dataset_dir / file_name, memory_map=True)
+
+    try:
+        search_index = shared_index or build_search_index(dataset_dir, version, table)
+    except Exception:
+        # Search falls back to scanning the columns
+        logger.exception('Could not build the search index of %s v%s', dataset_id, version)
+        search_index = None
+
+    manifest = {
+        'dataset_id': dataset_id,
+        'version': version,
+        'parent': base['version'] if base else None,
+        'file': file_name,
+        **metadata,
+        'search_index': search_index,
+        'updated_at': timezone.now().isoformat(),
+    }
+    _write_json_atomic(dataset_dir / version_manifest_name(version), manifest)
+    head = {**manifest, 'last_version': version}
+    _write_json_atomic(dataset_dir / MANIFEST_NAME, head)
+
+    if base is None:
+        keep = {version}
+    else:
+        history = sorted(v for v in _read_version_manifests(dataset_dir) if not base['version'] < v < version)
+        keep = set(history[-getattr(settings, 'DATASET_MAX_VERSIONS', 20):])
+    if previous:
+        _prune_versions(dataset_dir, keep)
+
+    return head
+
+
+def _assemble_table(parts, columns):
+    """One table of ``columns`` out of tables holding disjoint sets of them.
+
+    The pandas metadata of the parts is merged so ``to_pandas`` restores
+    the same dtypes as for a single file.
+    """
+    if len(parts) == 1 and parts[0].column_names == columns:
+        return parts[0]
+
+    arrays, fields, entries, pandas_metadata = {}, {}, {}, None
+    for part in parts:
+        for name, field in zip(part.column_names, part.schema):
+            arrays[name] = part.column(name)
+            fields[name] = field
+        metadata = part.schema.pandas_metadata
+        if metadata:
+            pandas_metadata = pandas_metadata or dict(metadata)
+            # A file's metadata may still list columns a later version rewrote; only trust its own
+            entries.update({
+                entry['field_name']: entry for entry in metadata['columns']
+                if entry['field_name'] in part.column_names
+            })
+
+    schema = pa.schema([fields[name] for name in columns])
+    if pandas_metadata is not None and all(name in entries for name in columns):
+        pandas_metadata['columns'] = [entries[name] for name in columns]
+        schema = schema.with_metadata({b'pandas': json.dumps(pandas_metadata).encode()})
+    return pa.Table.from_arrays([arrays[name] for name in columns], schema=schema)
+
+
+def _shared_search_index(dataset_id, base, written_schema, replaced):
+    """``base``'s search index if neither its ``replaced`` columns nor the written ones are text, else None."""
+    if base is None or not base.get('search_index'):
+        return None
+    changed = list(written_schema) + list(read_dataset_table(dataset_id, base, columns=replaced).schema)
+    return None if any(is_indexable(field.type) for field in changed) else base['search_index']
+
+
+def write_dataset(dataset_id, df, base=None, changed_columns=None, label=None):
+    """Write ``df`` as the next version of a dataset and return the new manifest.
+
+    Without ``base`` the version starts a new history. With ``base``, the
+    manifest of the version ``df`` was derived from, it is added to that
+    version's history; if ``changed_columns`` lists the columns that differ
+    from ``base`` and no rows were added or dropped, only those columns are
+    written and the rest stay in (and are shared with) the files of
+    ``base``. ``label`` describes the change for the version list. If
+    nothing changed at all, ``base`` is returned and no version is written.
+    """
+    with _next_version(dataset_id) as (dataset_dir, previous, version):
+
+        df = _normalize_for_arrow(df)
+        columns = list(df.columns)
+        base_files, shared = {}, []
+        if base is not None and changed_columns is not None and len(df) == base['rows']:
+            base_files = column_files(base)
+            shared = [col for col in columns if col in base_files and col not in changed_columns]
+            if shared == columns == base['columns']:
+                return base
+        written = [col for col in columns if col not in shared]
+
+        table = pa.Table.from_pandas(df[written], preserve_index=False)
+        # Uncompressed so the file can be memory-mapped without a decode step
+        tmp_path = dataset_dir / f'.v{version}.feather.tmp'
+        feather.write_feather(table, tmp_path, compression='uncompressed')
+
+        parts = [table]
+        if shared:
+            parts.append(read_dataset_table(dataset_id, base, columns=shared))
+        full_table = _assemble_table(parts, columns)
+
+        sketches = new_sketch_builder(full_table.schema)
+        if sketches is not None:
+            base_sketches = load_column_sketches(dataset_id, dataset_dir, base) if shared else None
+            if base_sketches is not None:
+                # Unchanged columns keep their parent's sketches; only the written ones are scanned
+                sketches.adopt(base_sketches, shared)
+                sketches.update(table)
+            else:
+                sketches.update(full_table)
+
+        # Replaced or dropped columns of ``base``; only meaningful while rows are shared
+        replaced = [col for col in base['columns'] if col not in shared] if shared else []
+
+        fingerprints = None
+        if fingerprints_enabled():
+            base_fingerprints = load_fingerprints(dataset_dir, base) if shared else None
+            if base_fingerprints is not None:
+                # Only the replaced, dropped and added columns are hashed
+                fingerprints = update_fingerprints(
+                    base_fingerprints, read_dataset_table(dataset_id, base, columns=replaced), table,
+                )
+            else:
+                fingerprints = table_fingerprints(full_table)
+
+        missing_values = {col: base['missing_values'][col] for col in shared}
+        missing_values.update({col: int(count) for col, count in df[written].isnull().sum().items()})
+        # The dtypes the written columns read back with (object columns of text come back as str)
+        data_types = {col: base['data_types'][col] for col in shared}
+        data_types.update(_pandas_dtypes(table.slice(0, 1), missing_values))
+
+        return _publish_version(
+            dataset_id, dataset_dir, previous, version, tmp_path,
+            table=full_table,
+            base=base,
+            shared_index=_shared_search_index(dataset_id, base, table.schema, replaced) if shared else None,
+            label=label,
+            sketches=write_sketches(sketches, dataset_dir, version),
+            fingerprints=write_fingerprints(fingerprints, dataset_dir, version),
+            rows=len(df),
+            columns=columns,
+            column_files={**{col: base_files[col] for col in shared}, **dict.fromkeys(written, f'v{version}.feather')},
+            data_types={col: data_types[col] for col in columns},
+            missing_values={col: missing_values[col] for col in columns},
+        )
+
+
+def _promote_type(current, new):
+    """Smallest Arrow type that holds values of both ``current`` and ``new``."""
+    if current.equals(new) or pa.types.is_null(new):
+        return current
+    if pa.types.is_null(current):
+        return new
+    if pa.types.is_integer(current) and pa.types.is_integer(new):
+        return pa.int64()
+    if pa.types.is_timestamp(current) and pa.types.is_timestamp(new) and current.tz == new.tz:
+        # The finer unit holds both (chunks parsed separately may infer different resolutions)
+        return max(current, new, key=lambda data_type: TIMESTAMP_UNITS.index(data_type.unit))
+    numeric = (pa.types.is_integer, pa.types.is_floating)
+    if any(check(current) for check in numeric) and any(check(new) for check in numeric):
+        return pa.float64()
+    # Anything else (numbers vs text, dates vs text, ...) falls back to text
+    return pa.large_string()
+
+
+def _promote_schema(current, new):
+    if current is None:
+        return new
+    return pa.schema([
+        pa.field(field.name, _promote_type(field.type, new.field(field.name).type))
+        for field in current
+    ])
+
+
+def _chunk_to_table(chunk):
+    """Arrow table for a DataFrame or Arrow chunk."""
+    if isinstance(chunk, pa.RecordBatch):
+        table = pa.Table.from_batches([chunk])
+    elif isinstance(chunk, pa.Table):
+        table = chunk
+    else:
+        # Column names are already strings, so the table keeps its pandas metadata
+        table = pa.Table.from_pandas(_normalize_for_arrow(chunk), preserve_index=False)
+    return table
+
+
+def _pandas_dtypes(row, missing):
+    """``{column: dtype}`` that ``to_pandas`` gives a table starting with ``row``, converting only that row.
+
+    Integer and boolean columns with nulls come back as float and object, so
+    every column ``missing`` counts nulls in is converted as a null.
+    """
+    arrays = [
+        pa.nulls(len(row), column.type) if missing.get(name) else column
+        for name, column in zip(row.column_names, row.columns)
+    ]
+    return pa.Table.from_arrays(arrays, schema=row.schema).to_pandas().dtypes.astype(str).to_dict()
+
+
+def _pandas_memory_usage(table):
+    return int(table.to_pandas().memory_usage(deep=True).sum())
+
+
+def _spool_chunks(chunks, spool_dir):
+    """Write chunks to ``spool_dir`` one file each while widening their column types.
+
+    Returns ``(schema, columns, rows, missing, spool_paths, pandas_entries)``
+    where ``schema`` holds every chunk's values, ``missing`` counts the
+    nulls of each column and ``pandas_entries`` maps ``(column, Arrow
+    type)`` to the pandas metadata of the first DataFrame chunk with that
+    column type. Spooled files carry no pandas metadata.
+    """
+    schema = None
+    columns = None
+    rows = 0
+    missing = {}
+    spool_paths = []
+    pandas_entries = {}
+
+    for chunk in chunks:
+        table = _chunk_to_table(chunk)
+        metadata = table.schema.pandas_metadata
+        table = table.replace_schema_metadata()
+        if columns is None:
+            columns = table.column_names
+            missing = dict.fromkeys(columns, 0)
+        elif table.column_names != columns:
+            raise ValueError('All chunks must have the same columns')
+
+        schema = _promote_schema(schema, table.schema)
+        rows += table.num_rows
+        for col, column in zip(columns, table.columns):
+            missing[col] += column.null_count
+        for entry in metadata['columns'] if metadata else []:
+            if entry['field_name'] in columns:
+                key = (entry['field_name'], str(table.schema.field(entry['field_name']).type))
+                pandas_entries.setdefault(key, entry)
+
+        spool_path = spool_dir / f'{len(spool_paths):06d}.arrow'
+        feather.write_feather(table, spool_path, compression='uncompressed')
+        spool_paths.append(spool_path)
+
+    if schema is None:
+        raise ValueError('No data found in file')
+    return schema, columns, rows, missing, spool_paths, pandas_entries
+
+
+def _with_pandas_metadata(schema, pandas_entries):
+    """``schema`` with pandas metadata restoring the dtypes ``_spool_chunks`` saw for each column's type.
+
+    A column whose (promoted) type no chunk had gets the entry pandas writes
+    for that Arrow type.
+    """
+    metadata = pa.Schema.from_pandas(schema.empty_table().to_pandas(), preserve_index=False).pandas_metadata
+    metadata['columns'] = [
+        pandas_entries.get((entry['field_name'], str(schema.field(entry['field_name']).type)), entry)
+        for entry in metadata['columns']
+    ]
+    return schema.with_metadata({b'pandas': json.dumps(metadata).encode()})
+
+
+def write_dataset_chunks(dataset_id, chunks, compact=False):
+    """Write an iterable of chunks as the next version of a dataset.
+
+    Chunks may be DataFrames or Arrow record batches/tables, and only one is
+    held in memory at a time. Chunks are first spooled to disk while their
+    column types are widened to a common schema (an int column that later
+    shows a NaN becomes float, a numeric column that later shows text becomes
+    text), then streamed once more into the final file with every chunk cast
+    to that settled schema.
+
+    With ``compact=True`` an extra pass over the spool collects column
+    statistics and the final file uses the compacted dtypes from
+    ``accounts.compaction``; the manifest then records the pandas memory
+    usage before and after.
+    """
+    with _next_version(dataset_id) as (dataset_dir, previous, version):
+        spool_dir = dataset_dir / f'.spool-{uuid.uuid4().hex}'
+        spool_dir.mkdir()
+        tmp_path = dataset_dir / f'.v{version}.feather.tmp'
+
+        try:
+            schema, columns, rows, missing, spool_paths, _ = _spool_chunks(chunks, spool_dir)
+
+            target_schema = schema
+            compactor = None
+            memory_usage = {'before': 0, 'after': 0}
+            if compact:
+                compactor = Compactor(schema)
+                for spool_path in spool_paths:
+                    table = feather.read_table(spool_path, memory_map=True).cast(schema)
+                    compactor.update(table)
+                    memory_usage['before'] += _pandas_memory_usage(table)
+                target_schema = compactor.finish()
+
+            # Column sketches and row fingerprints are fed the same chunks as they are written
+            sketches = new_sketch_builder(target_schema)
+            fingerprints = [] if fingerprints_enabled() else None
+            first_row = target_schema.empty_table()
+            with pa.OSFile(str(tmp_path), 'wb') as sink:
+                with pa.ipc.new_file(sink, target_schema) as writer:
+                    for spool_path in spool_paths:
+                        table = feather.read_table(spool_path, memory_map=True).cast(schema)
+                        if compactor is not None:
+                            table = compactor.compact(table)
+                            memory_usage['after'] += _pandas_memory_usage(table)
+                        writer.write_table(table)
+                        if not first_row.num_rows:
+                            first_row = table.slice(0, 1)
+                        if sketches is not None:
+                            sketches.update(table)
+                        if fingerprints is not None:
+                            fingerprints.append(table_fingerprints(table))
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        finally:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+        if compactor is not None:
+            logger.info(
+                'Compacted dataset %s: %d -> %d bytes in memory',
+                dataset_id, memory_usage['before'], memory_usage['after'],
+            )
+
+        return _publish_version(
+            dataset_id, dataset_dir, previous, version, tmp_path,
+            sketches=write_sketches(sketches, dataset_dir, version),
+            fingerprints=write_fingerprints(
+                np.concatenate(fingerprints) if fingerprints else None, dataset_dir, version,
+            ),
+            rows=rows,
+            columns=columns,
+            data_types=_pandas_dtypes(first_row, missing),
+            missing_values=missing,
+            memory_usage=memory_usage if compactor is not None else None,
+        )
+
+
+def write_column_chunks(dataset_id, base, chunks, label=None):
+    """Write a version derived from ``base`` whose columns in ``chunks`` replace or add to its own.
+
+    ``chunks`` yields DataFrames or Arrow tables with the same columns,
+    whose rows follow ``base``'s rows in order. As in
+    ``write_dataset_chunks`` only one chunk is held in memory at a time and
+    the column types are widened to a common schema; every other column is
+    shared with ``base``. Sketches and row fingerprints are updated chunk by
+    chunk, so columns of datasets larger than memory can be rewritten.
+    """
+    with _next_version(dataset_id) as (dataset_dir, previous, version):
+        spool_dir = dataset_dir / f'.spool-{uuid.uuid4().hex}'
+        spool_dir.mkdir()
+        file_name = f'v{version}.feather'
+        tmp_path = dataset_dir / f'.{file_name}.tmp'
+        fingerprints = None
+
+        try:
+            schema, written, rows, missing, spool_paths, pandas_entries = _spool_chunks(chunks, spool_dir)
+            if rows != base['rows']:
+                raise ValueError(f'Chunks hold {rows} rows, the base version {base["rows"]}')
+            columns = base['columns'] + [col for col in written if col not in base['columns']]
+            shared = [col for col in base['columns'] if col not in written]
+            replaced = [col for col in base['columns'] if col in written]
+            shared_table = read_dataset_table(dataset_id, base, columns=shared)
+            # The written columns read back with the dtypes the chunks had, and the shared ones keep theirs
+            schema = _with_pandas_metadata(schema, pandas_entries)
+
+            sketches = new_sketch_builder(
+                _assemble_table([schema.empty_table(), shared_table.slice(0, 0)], columns).schema,
+            )
+            base_sketches = load_column_sketches(dataset_id, dataset_dir, base) if sketches is not None else None
+            if base_sketches is not None:
+                sketches.adopt(base_sketches, shared)
+
+            base_fingerprints = None
+            if fingerprints_enabled():
+                base_fingerprints = load_fingerprints(dataset_dir, base)
+                replaced_table = read_dataset_table(dataset_id, base, columns=replaced)
+                fingerprints = open_fingerprints(dataset_dir, version, rows)
+
+            offset = 0
+            with pa.OSFile(str(tmp_path), 'wb') as sink:
+                with pa.ipc.new_file(sink, schema) as writer:
+                    for spool_path in spool_paths:
+                        table = feather.read_table(spool_path, memory_map=True).cast(schema)
+                        writer.write_table(table)
+                        stop = offset + table.num_rows
+                        if sketches is not None:
+                            sketches.update(table)
+                            if base_sketches is None:
+                                sketches.update(shared_table.slice(offset, table.num_rows))
+                        if fingerprints is not None:
+                            if base_fingerprints is not None:
+                                fingerprints[offset:stop] = update_fingerprints(
+                                    base_fingerprints[offset:stop], replaced_table.slice(offset, table.num_rows), table,
+                                )
+                            else:
+                                fingerprints[offset:stop] = (
+                                    table_fingerprints(shared_table.slice(offset, table.num_rows))
+                                    ^ table_fingerprints(table)
+                                )
+                        offset = stop
+            if fingerprints is not None:
+                fingerprints.flush()
+            os.replace(tmp_path, dataset_dir / file_name)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            if fingerprints is not None:
+                (dataset_dir / fingerprints_file_name(version)).unlink(missing_ok=True)
+            raise
+        finally:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+        written_table = feather.read_table(dataset_dir / file_name, memory_map=True)
+        full_table = _assemble_table([written_table, shared_table], columns)
+        missing_values = {**{col: base['missing_values'][col] for col in shared}, **missing}
+        data_types = {**base['data_types'], **_pandas_dtypes(written_table.slice(0, 1), missing)}
+        return _publish_version(
+            dataset_id, dataset_dir, previous, version, None,
+            table=full_table,
+            base=base,
+            shared_index=_shared_search_index(dataset_id, base, schema, replaced),
+            label=label,
+            sketches=write_sketches(sketches, dataset_dir, version),
+            fingerprints=fingerprints_file_name(version) if fingerprints is not None else None,
+            rows=rows,
+            columns=columns,
+            column_files={**{col: column_files(base)[col] for col in shared}, **dict.fromkeys(written, file_name)},
+            data_types={col: data_types[col] for col in columns},
+            missing_values={col: missing_values[col] for col in columns},
+        )
+
+
+def read_dataset_table(dataset_id, manifest, columns=None):
+    """Memory-mapped Arrow table of a dataset version, limited to ``columns`` if given.
+
+    Columns a version shares with earlier versions are read from the files
+    that hold them.
+    """
+    columns = manifest['columns'] if columns is None else list(columns)
+    dataset_dir = get_dataset_dir(dataset_id)
+    if not columns:
+        # feather reads every column for ``columns=[]``; select keeps the row count only
+        return feather.read_table(dataset_dir / manifest['file'], memory_map=True).select([])
+
+    files = column_files(manifest)
+    groups = {}
+    for column in columns:
+        groups.setdefault(files[column], []).append(column)
+    # Selecting from the mapped table stays zero-copy; feather's ``columns=`` reads the whole file into memory
+    parts = [
+        feather.read_table(dataset_dir / file_name, memory_map=True).select(names)
+        for file_name, names in groups.items()
+    ]
+    return _assemble_table(parts, columns)
+
+
+def read_dataset(dataset_id, manifest=None, columns=None):
+    """Load the current version of a dataset as a DataFrame, or None if missing.
+
+    ``columns`` restricts the read to those columns; only their buffers are
+    paged in from the memory-mapped files.
+    """
+    manifest = manifest or read_manifest(dataset_id)
+    if manifest is None:
+        return None
+    return read_dataset_table(dataset_id, manifest, columns).to_pandas()
+
+
+def read_dataset_rows(dataset_id, manifest, offset, limit, columns=None):
+    """Load ``limit`` rows starting at ``offset`` without decoding the rest of the file.
+
+    The slice is taken on the memory-mapped Arrow table, so only the pages
+    holding the requested rows and columns are touched.
+    """
+    return read_dataset_table(dataset_id, manifest, columns).slice(offset, limit).to_pandas()
+
+
+def read_dataset_sample(dataset_id, manifest, positions, columns=None):
+    """Load the rows at ``positions`` (ascending), indexed by those positions.
+
+    Rows are gathered from the memory-mapped Arrow table, so only the pages
+    holding them are touched.
+    """
+    df = read_dataset_table(dataset_id, manifest, columns).take(positions).to_pandas()
+    df.index = pd.Index(positions)
+    return df
+
+
+def list_versions(dataset_id):
+    """Summaries of the kept versions of a dataset, oldest first."""
+    manifests = _read_version_manifests(get_dataset_dir(dataset_id))
+    return [
+        {
+            'version': version,
+            'parent': manifest.get('parent'),
+            'label': manifest.get('label'),
+            'rows': manifest['rows'],
+            'columns': len(manifest['columns']),
+            'updated_at': manifest.get('updated_at'),
+        }
+        for version, manifest in sorted(manifests.items())
+    ]
+
+
+def checkout_version(dataset_id, version):
+    """Make a kept version the current one; returns its manifest, or None if it is gone.
+
+    Only the manifest is rewritten: versions never change once written, so
+    their files, indexes and cached frames are used as they are.
+    """
+    if read_manifest(dataset_id) is None:
+        return None
+    dataset_dir = get_dataset_dir(dataset_id)
+    with _write_lock(dataset_dir):
+        return _checkout(dataset_dir, read_manifest(dataset_id), version)
+
+
+def _checkout(dataset_dir, head, version):
+    """``checkout_version`` for a caller holding the writer lock that has read ``head``."""
+    manifest = _read_version_manifests(dataset_dir).get(version)
+    if head is None or manifest is None:
+        return None
+    # ``last_version`` is read under the lock, so a version published meanwhile is not forgotten
+    head = {**manifest, 'last_version': head.get('last_version', head['version'])}
+    _write_json_atomic(dataset_dir / MANIFEST_NAME, head)
+    return head
+
+
+def undo_version(dataset_id):
+    """Step back to the parent of the current version; None if there is none left."""
+    if read_manifest(dataset_id) is None:
+        return None
+    dataset_dir = get_dataset_dir(dataset_id)
+    with _write_lock(dataset_dir):
+        head = read_manifest(dataset_id)
+        if head is None or head.get('parent') is None:
+            return None
+        return _checkout(dataset_dir, head, head['parent'])
+
+
+def redo_version(dataset_id):
+    """Step forward to the version undone last; None if there is none."""
+    if read_manifest(dataset_id) is None:
+        return None
+    dataset_dir = get_dataset_dir(dataset_id)
+    with _write_lock(dataset_dir):
+        head = read_manifest(dataset_id)
+        if head is None:
+            return None
+        later = [version for version in _read_version_manifests(dataset_dir) if version > head['version']]
+        return _checkout(dataset_dir, head, min(later)) if later else None
+
+
+def read_version_artifact(dataset_id, manifest, name):
+    """Bytes of a file derived from one dataset version (e.g. its profile), or None."""
+    try:
+        return (get_dataset_dir(dataset_id) / f'v{manifest["version"]}.{name}').read_bytes()
+    except (ValueError, OSError):
+        return None
+
+
+def write_version_artifact(dataset_id, manifest, name, data):
+    """Store bytes derived from one dataset version; removed along with the version."""
+    path = get_dataset_dir(dataset_id) / f'v{manifest["version"]}.{name}'
+    tmp_path = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def get_search_index(dataset_id, manifest):
+    """The loaded search index of a dataset version, or None if it was not indexed."""
+    return load_search_index(dataset_id, get_dataset_dir(dataset_id), manifest)
+
+
+def get_column_sketches(dataset_id, manifest):
+    """Quantile and distinct-count sketches of a dataset version, or None if it has none."""
+    return load_column_sketches(dataset_id, get_dataset_dir(dataset_id), manifest)
+
+
+def get_row_fingerprints(dataset_id, manifest, columns=None):
+    """64-bit fingerprint of every row of a dataset version over ``columns`` (default all).
+
+    Whole-row fingerprints are stored with the version; those of other
+    column sets are computed from the stored columns once and cached per
+    worker.
+    """
+    if columns is None or set(columns) == set(manifest['columns']):
+        stored = load_fingerprints(get_dataset_dir(dataset_id), manifest)
+        if stored is not None:
+            return stored
+        columns = manifest['columns']
+
+    columns = sorted(set(columns))
+    cache = get_query_cache()
+    key = (dataset_id, manifest['version'], 'fingerprints', *columns)
+    fingerprints = cache.get(key)
+    if fingerprints is None:
+        fingerprints = table_fingerprints(read_dataset_table(dataset_id, manifest, columns))
+        cache.put(key, fingerprints)
+    return fingerprints
+
+
+def get_dataset_metadata(manifest):
+    """Shape, dtypes and missing counts recorded at write time, without reading any data."""
+    return {
+        'dataset_id': manifest['dataset_id'],
+        'version': manifest['version'],
+        'rows': manifest['rows'],
+        'columns': len(manifest['columns']),
+        'column_names': manifest['columns'],
+        'data_types': manifest['data_types'],
+        'missing_values': manifest['missing_values'],
+        'memory_usage': manifest.get('memory_usage'),
+    }
+
+
+def delete_dataset(dataset_id):
+    """Remove a dataset and all its files."""
+    try:
+        shutil.rmtree(get_dataset_dir(dataset_id), ignore_errors=True)
+    except ValueError:
+        pass
@@ -0,0 +1,146 @@
+"""64-bit row fingerprints for hash-based duplicate detection.
+
+A row's fingerprint is the XOR of one hash per column, each mixing the
+value's hash with a key derived from the column name, so equal rows get
+equal fingerprints and the same values in swapped columns do not. Nulls and
+NaN share one hash, and -0.0 hashes like 0.0, as ``drop_duplicates`` treats
+them as equal.
+
+Because the combination is an XOR, a version that rewrites a few columns
+gets its fingerprints from its parent's by XOR-ing out the old columns'
+hashes and XOR-ing in the new ones, without touching the other columns.
+The whole-row fingerprints are stored as ``v{n}.fingerprints.npy`` beside
+the version; two different rows collide with probability about 2**-64.
+"""
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+NULL_HASH = np.uint64(0x9E3779B97F4A7C15)
+
+
+def fingerprints_file_name(version):
+    return f'v{version}.fingerprints.npy'
+
+
+def fingerprints_enabled():
+    return getattr(settings, 'ROW_FINGERPRINTS_ENABLED', True)
+
+
+def _is_text(data_type):
+    return pa.types.is_string(data_type) or pa.types.is_large_string(data_type) or pa.types.is_binary(data_type)
+
+
+def _plain_hashes(values):
+    """Hashes of an Arrow array without nulls."""
+    if _is_text(values.type):
+        return pd.util.hash_array(values.to_numpy(zero_copy_only=False).astype(object), categorize=False)
+    array = values.to_numpy(zero_copy_only=False)
+    if array.dtype.kind == 'f':
+        # -0.0 and 0.0 are the same value
+        array = array + 0.0
+    try:
+        return pd.util.hash_array(array, categorize=False)
+    except TypeError:
+        # Nested values (lists, structs) are hashed by their string form
+        return pd.util.hash_array(np.array([str(value) for value in values.to_pylist()], dtype=object), categorize=False)
+
+
+def _value_hashes(chunk):
+    """64-bit hash of every value of an Arrow array."""
+    hashes = np.full(len(chunk), NULL_HASH, dtype=np.uint64)
+    valid = ~pc.is_null(chunk, nan_is_null=True).to_numpy(zero_copy_only=False)
+    if not valid.any():
+        return hashes
+
+    if _is_text(chunk.type):
+        chunk = pc.dictionary_encode(chunk)
+    if pa.types.is_dictionary(chunk.type):
+        # Hash the distinct values once and look hashes up by index
+        codes = chunk.indices.to_numpy(zero_copy_only=False)[valid].astype(np.intp)
+        hashes[valid] = _plain_hashes(chunk.dictionary)[codes]
+    else:
+        hashes[valid] = _plain_hashes(chunk.filter(pa.array(valid)))
+    return hashes
+
+
+def _column_key(name):
+    return np.uint64(int.from_bytes(hashlib.blake2b(str(name).encode(), digest_size=8).digest(), 'little'))
+
+
+def _mix(hashes):
+    """SplitMix64 finalizer: every input bit affects every output bit."""
+    hashes = hashes ^ (hashes >> np.uint64(30))
+    hashes = hashes * np.uint64(0xBF58476D1CE4E5B9)
+    hashes = hashes ^ (hashes >> np.uint64(27))
+    hashes = hashes * np.uint64(0x94D049BB133111EB)
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+def hash_column(column, name):
+    """Per-row hashes of an Arrow (chunked) array stored as column ``name``."""
+    chunks = column.chunks if isinstance(column, pa.ChunkedArray) else [column]
+    if not chunks:
+        return np.empty(0, dtype=np.uint64)
+    return _mix(np.concatenate([_value_hashes(chunk) for chunk in chunks]) ^ _column_key(name))
+
+
+def table_fingerprints(table, columns=None):
+    """Fingerprint of every row of an Arrow table over ``columns`` (default all)."""
+    fingerprints = np.zeros(table.num_rows, dtype=np.uint64)
+    for name in table.column_names if columns is None else columns:
+        fingerprints ^= hash_column(table.column(name), name)
+    return fingerprints
+
+
+def update_fingerprints(fingerprints, removed, added):
+    """Fingerprints of a version derived from one with ``fingerprints``.
+
+    ``removed`` holds the parent's columns that were replaced or dropped,
+    ``added`` the new version's replaced or new columns (both Arrow tables
+    with the same rows).
+    """
+    return np.asarray(fingerprints) ^ table_fingerprints(removed) ^ table_fingerprints(added)
+
+
+def write_fingerprints(fingerprints, dataset_dir, version):
+    """Store a version's row fingerprints beside it; returns the file name or None."""
+    if fingerprints is None:
+        return None
+    path = dataset_dir / fingerprints_file_name(version)
+    try:
+        with open(path, 'wb') as handle:
+            np.save(handle, fingerprints)
+    except OSError:
+        logger.exception('Could not store the row fingerprints of %s v%s', dataset_dir.name, version)
+        return None
+    return path.name
+
+
+def open_fingerprints(dataset_dir, version, rows):
+    """Writable memory-mapped fingerprints of a version, filled in chunk by chunk; None on failure."""
+    try:
+        return np.lib.format.open_memmap(
+            dataset_dir / fingerprints_file_name(version), mode='w+', dtype=np.uint64, shape=(rows,),
+        )
+    except OSError:
+        logger.exception('Could not store the row fingerprints of %s v%s', dataset_dir.name, version)
+        return None
+
+
+def load_fingerprints(dataset_dir, manifest):
+    """The stored row fingerprints of a manifest's version (memory-mapped), or None."""
+    if not manifest.get('fingerprints'):
+        return None
+    try:
+        return np.load(dataset_dir / manifest['fingerprints'], mmap_mode='r')
+    except (OSError, ValueError):
+        logger.warning('Row fingerprints of %s v%s are unreadable', dataset_dir.name, manifest['version'])
+        return None
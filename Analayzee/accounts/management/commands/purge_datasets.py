@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts.dataset_store import MANIFEST_NAME, delete_dataset, get_store_root, is_valid_dataset_id
+
+
+class Command(BaseCommand):
+    help = 'Delete stored datasets that have not been written to for longer than a session lives'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age-days',
+            type=float,
+            default=settings.SESSION_COOKIE_AGE / 86400,
+            help='Delete datasets older than this many days (defaults to SESSION_COOKIE_AGE)',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only list what would be deleted')
+
+    def handle(self, *args, **options):
+        root = get_store_root()
+        if not root.exists():
+            self.stdout.write('Dataset store is empty.')
+            return
+
+        cutoff = time.time() - options['max_age_days'] * 86400
+        deleted = 0
+        for dataset_dir in root.iterdir():
+            if not dataset_dir.is_dir() or not is_valid_dataset_id(dataset_dir.name):
+                continue
+            manifest_path = dataset_dir / MANIFEST_NAME
+            last_write = (manifest_path if manifest_path.exists() else dataset_dir).stat().st_mtime
+            if last_write >= cutoff:
+                continue
+            if not options['dry_run']:
+                delete_dataset(dataset_dir.name)
+            deleted += 1
+            self.stdout.write(f'{"Would delete" if options["dry_run"] else "Deleted"} {dataset_dir.name}')
+
+        self.stdout.write(self.style.SUCCESS(f'{deleted} dataset(s) purged.'))
@@ -0,0 +1,213 @@
+"""Inverted index for searching the text columns of a stored dataset.
+
+Built next to every dataset version (``v{n}.search/``) from the Arrow file:
+
+* ``values.arrow``: every distinct lower-cased value of each text/category
+  column, with the slice of ``rows.npy`` holding the rows it occurs in.
+* ``tokens.arrow``: the sorted distinct words (runs of letters and digits)
+  of those values, with the slice of ``token_values.npy`` listing the values
+  each word occurs in.
+
+A search term that is a single word is matched against the word list (a
+binary search for prefixes, a scan of the distinct words for substrings);
+longer terms scan the distinct values. Either way the scan runs over the
+vocabulary rather than every cell, and row IDs come straight from the
+posting lists.
+"""
+import json
+import logging
+import re
+import shutil
+import uuid
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+from django.conf import settings
+
+from .dataset_cache import get_query_cache
+
+logger = logging.getLogger(__name__)
+
+INDEX_META_NAME = 'meta.json'
+# Words are runs of letters and digits, on both the Arrow and the Python side
+TOKEN_PATTERN = r'[^\p{L}\p{N}]+'
+WORD_RE = re.compile(r'[^\W_]+')
+
+
+def index_dir_name(version):
+    return f'v{version}.search'
+
+
+def is_indexable(data_type):
+    """Text and category columns are indexed; numbers and dates are not."""
+    if pa.types.is_dictionary(data_type):
+        data_type = data_type.value_type
+    return pa.types.is_string(data_type) or pa.types.is_large_string(data_type)
+
+
+def _csr(codes, size):
+    """Group positions by code: returns ``(positions sorted by code, offsets)``; -1 codes are dropped."""
+    valid = codes >= 0
+    order = np.argsort(codes, kind='stable')[np.count_nonzero(~valid):]
+    counts = np.bincount(codes[valid], minlength=size)
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return order, offsets
+
+
+def _column_values(column):
+    """Distinct lower-cased values of a column and the value code of every row (-1 when missing)."""
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(column.type.value_type)
+    encoded = pc.utf8_lower(column.combine_chunks().cast(pa.large_string())).dictionary_encode()
+    codes = encoded.indices.fill_null(-1).to_numpy(zero_copy_only=False).astype(np.int64)
+    return encoded.dictionary, codes
+
+
+def build_search_index(dataset_dir, version, table):
+    """Build the index of a version's Arrow ``table``; returns the index directory name or None."""
+    if not getattr(settings, 'SEARCH_INDEX_ENABLED', True):
+        return None
+
+    columns = [name for name, field in zip(table.column_names, table.schema) if is_indexable(field.type)]
+    if not columns:
+        return None
+
+    values, value_columns, rows, row_offsets = [], [], [], [np.zeros(1, dtype=np.int64)]
+    for column_id, name in enumerate(columns):
+        dictionary, codes = _column_values(table.column(name))
+        positions, offsets = _csr(codes, len(dictionary))
+        values.append(dictionary)
+        value_columns.append(np.full(len(dictionary), column_id, dtype=np.int32))
+        rows.append(positions.astype(np.int64))
+        row_offsets.append(offsets[1:] + row_offsets[-1][-1])
+
+    values = pa.concat_arrays(values)
+    rows = np.concatenate(rows)
+    row_offsets = np.concatenate(row_offsets)
+
+    # Split every distinct value into words, then keep each (word, value) pair once
+    words = pc.split_pattern_regex(values, TOKEN_PATTERN)
+    word_values = pc.list_parent_indices(words).to_numpy()
+    words = pc.list_flatten(words)
+    non_empty = pc.not_equal(words, '').to_numpy(zero_copy_only=False)
+    words = words.filter(pa.array(non_empty))
+    word_values = word_values[non_empty]
+
+    tokens = pc.unique(words)
+    tokens = tokens.take(pc.sort_indices(tokens))
+    token_codes = pc.index_in(words, value_set=tokens).to_numpy().astype(np.int64)
+    pairs = np.unique(token_codes * len(values) + word_values)
+    token_values, token_offsets = _csr(pairs // len(values), len(tokens))
+    token_values = (pairs % len(values))[token_values]
+
+    index_dir = dataset_dir / index_dir_name(version)
+    tmp_dir = dataset_dir / f'.{index_dir.name}-{uuid.uuid4().hex}'
+    tmp_dir.mkdir()
+    try:
+        feather.write_feather(
+            pa.table({'value': values, 'column': np.concatenate(value_columns)}),
+            tmp_dir / 'values.arrow', compression='uncompressed',
+        )
+        feather.write_feather(pa.table({'token': tokens}), tmp_dir / 'tokens.arrow', compression='uncompressed')
+        np.save(tmp_dir / 'rows.npy', rows)
+        np.save(tmp_dir / 'row_offsets.npy', row_offsets)
+        np.save(tmp_dir / 'token_values.npy', token_values)
+        np.save(tmp_dir / 'token_offsets.npy', token_offsets)
+        with open(tmp_dir / INDEX_META_NAME, 'w', encoding='utf-8') as f:
+            json.dump({'version': version, 'columns': columns, 'rows': table.num_rows}, f)
+        shutil.rmtree(index_dir, ignore_errors=True)
+        tmp_dir.rename(index_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    logger.info(
+        'Indexed %d text columns of %s: %d distinct values, %d words',
+        len(columns), dataset_dir.name, len(values), len(tokens),
+    )
+    return index_dir.name
+
+
+class SearchIndex:
+    """A loaded index; the posting arrays stay memory-mapped."""
+
+    def __init__(self, index_dir):
+        with open(index_dir / INDEX_META_NAME, encoding='utf-8') as f:
+            meta = json.load(f)
+        self.columns = meta['columns']
+        self.num_rows = meta['rows']
+
+        values = feather.read_table(index_dir / 'values.arrow', memory_map=True)
+        self.values = values.column('value').combine_chunks()
+        self.value_columns = values.column('column').to_numpy()
+        self.tokens = feather.read_table(index_dir / 'tokens.arrow', memory_map=True).column('token').combine_chunks()
+        # Binary search needs random access to the sorted words
+        self.sorted_tokens = np.array(self.tokens.to_pylist(), dtype=object)
+
+        self.rows = np.load(index_dir / 'rows.npy', mmap_mode='r')
+        self.row_offsets = np.load(index_dir / 'row_offsets.npy', mmap_mode='r')
+        self.token_values = np.load(index_dir / 'token_values.npy', mmap_mode='r')
+        self.token_offsets = np.load(index_dir / 'token_offsets.npy', mmap_mode='r')
+
+        self.nbytes = int(
+            self.values.nbytes + self.tokens.nbytes + self.value_columns.nbytes
+            + sum(len(token) + 56 for token in self.sorted_tokens)
+        )
+
+    @staticmethod
+    def _gather(data, offsets, ids):
+        """Concatenate the posting lists ``data[offsets[i]:offsets[i + 1]]`` of ``ids``."""
+        starts = offsets[ids]
+        counts = offsets[ids + 1] - starts
+        total = int(counts.sum())
+        if not total:
+            return np.empty(0, dtype=np.int64)
+        shifts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return np.asarray(data[np.arange(total) + shifts])
+
+    def _matching_values(self, term, prefix):
+        if WORD_RE.fullmatch(term):
+            # Any occurrence of a single word lies inside one indexed word
+            if prefix:
+                start = np.searchsorted(self.sorted_tokens, term, side='left')
+                end = np.searchsorted(self.sorted_tokens, term + '\U0010ffff', side='left')
+                token_ids = np.arange(start, end)
+            else:
+                token_ids = np.flatnonzero(pc.match_substring(self.tokens, term).to_numpy(zero_copy_only=False))
+            return np.unique(self._gather(self.token_values, self.token_offsets, token_ids))
+
+        if prefix:
+            match = pc.match_substring_regex(self.values, r'(?:^|[^\p{L}\p{N}])' + re.escape(term))
+        else:
+            match = pc.match_substring(self.values, term)
+        return np.flatnonzero(match.to_numpy(zero_copy_only=False))
+
+    def search(self, term, columns=None, prefix=False):
+        """Sorted row IDs with a value containing ``term`` (or a word starting with it if ``prefix``)."""
+        term = term.lower()
+        value_ids = self._matching_values(term, prefix)
+        if columns is not None:
+            column_ids = [i for i, name in enumerate(self.columns) if name in columns]
+            value_ids = value_ids[np.isin(self.value_columns[value_ids], column_ids)]
+        return np.unique(self._gather(self.rows, self.row_offsets, value_ids))
+
+
+def load_search_index(dataset_id, dataset_dir, manifest):
+    """The search index of a manifest's version, or None if it has none."""
+    if not manifest.get('search_index'):
+        return None
+
+    cache = get_query_cache()
+    key = (dataset_id, manifest['version'], 'search_index')
+    index = cache.get(key)
+    if index is None:
+        try:
+            index = SearchIndex(dataset_dir / manifest['search_index'])
+        except (OSError, ValueError, KeyError):
+            logger.warning('Search index of %s v%s is unreadable', dataset_id, manifest['version'])
+            return None
+        cache.put(key, index)
+    return index
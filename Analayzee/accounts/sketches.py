@@ -0,0 +1,286 @@
+"""Mergeable column sketches built while a dataset is ingested.
+
+* ``TDigest`` summarizes a numeric column in a few hundred weighted
+  centroids and answers quantile queries with small relative error, best
+  in the tails.
+* ``HyperLogLog`` estimates the number of distinct values of any column
+  from 2**14 one-byte registers (about 1% standard error).
+
+Both are fed one Arrow chunk at a time with vectorized NumPy operations and
+can be merged, so a dataset written in chunks is summarized in the same
+pass that writes it, without holding a column in memory or sorting it.
+``SketchBuilder`` keeps one of each per column and stores them as
+``v{n}.sketches.npz`` beside the version.
+"""
+import io
+import logging
+import math
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from django.conf import settings
+
+from .dataset_cache import get_query_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COMPRESSION = 200
+HLL_PRECISION = 14
+
+
+def sketches_file_name(version):
+    return f'v{version}.sketches.npz'
+
+
+class TDigest:
+    """Merging t-digest (Dunning) with the arcsine scale function."""
+
+    def __init__(self, compression=DEFAULT_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+
+        # Centroid k of the result takes the items whose left quantile falls in [k, k + 1) on the
+        # k-scale, which keeps centroids small near the tails and large around the median
+        left = (np.cumsum(weights) - weights) / total
+        scale = self.compression / (2 * math.pi) * np.arcsin(2 * left - 1)
+        groups = np.floor(scale - scale[0]).astype(np.int64)
+        _, groups = np.unique(groups, return_inverse=True)
+
+        merged_weights = np.bincount(groups, weights=weights)
+        self.means = np.bincount(groups, weights=means * weights) / merged_weights
+        self.weights = merged_weights
+        self.count = float(total)
+
+    def update(self, values):
+        """Add a 1-D array of finite floats."""
+        if not len(values):
+            return
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._compress(
+            np.concatenate([self.means, values.astype(np.float64)]),
+            np.concatenate([self.weights, np.ones(len(values))]),
+        )
+
+    def merge(self, other):
+        if not other.count:
+            return
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+
+    def quantile(self, q):
+        """Estimated value at quantile ``q`` (a float or array in [0, 1]); NaN when empty."""
+        if not self.count:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else math.nan
+        # Each centroid's mean sits at the middle of its weight; min and max pin the ends
+        centers = np.cumsum(self.weights) - self.weights / 2
+        positions = np.concatenate([[0.0], centers, [self.count]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return np.interp(np.asarray(q, dtype=np.float64) * self.count, positions, values)
+
+    def to_arrays(self, prefix):
+        return {
+            f'{prefix}.means': self.means,
+            f'{prefix}.weights': self.weights,
+            f'{prefix}.bounds': np.array([self.min, self.max, self.compression]),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        minimum, maximum, compression = arrays[f'{prefix}.bounds']
+        digest = cls(int(compression))
+        digest.means = arrays[f'{prefix}.means']
+        digest.weights = arrays[f'{prefix}.weights']
+        digest.count = float(digest.weights.sum())
+        digest.min, digest.max = float(minimum), float(maximum)
+        return digest
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter over 64-bit value hashes."""
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        # update_hashes relies on the hash suffix fitting a float64 mantissa
+        assert precision > 11
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    def update_hashes(self, hashes):
+        if not len(hashes):
+            return
+        suffix_bits = 64 - self.precision
+        index = (hashes >> np.uint64(suffix_bits)).astype(np.intp)
+        suffix = hashes & np.uint64((1 << suffix_bits) - 1)
+        # Position of the first set bit in the suffix, counted from its top; the suffix has
+        # fewer than 53 bits, so frexp's exponent is its exact bit length
+        rank = (suffix_bits + 1 - np.frexp(suffix.astype(np.float64))[1]).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are still empty
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+
+def _hash_values(values):
+    """64-bit hashes of the non-null values of an Arrow array."""
+    if pa.types.is_string(values.type) or pa.types.is_large_string(values.type) or pa.types.is_binary(values.type):
+        # Arrow's hash table finds the distinct strings; only those are hashed in Python objects
+        values = pc.dictionary_encode(values)
+    if pa.types.is_dictionary(values.type):
+        # Hash the (few) dictionary entries once and look hashes up by index
+        dictionary = values.dictionary.to_numpy(zero_copy_only=False)
+        indices = values.indices.drop_null().to_numpy()
+        # Dictionary entries are distinct, so skip hash_array's own factorization
+        return pd.util.hash_array(dictionary.astype(object), categorize=False)[indices]
+    valid = pc.drop_null(values)
+    return pd.util.hash_array(valid.to_numpy(zero_copy_only=False))
+
+
+def _is_digestible(data_type):
+    return pa.types.is_integer(data_type) or pa.types.is_floating(data_type)
+
+
+class SketchBuilder:
+    """A t-digest per numeric column and a HyperLogLog per column, fed chunk by chunk."""
+
+    def __init__(self, schema, compression=DEFAULT_COMPRESSION):
+        self.columns = schema.names
+        self.digests = {
+            field.name: TDigest(compression) for field in schema if _is_digestible(field.type)
+        }
+        self.counters = {name: HyperLogLog() for name in self.columns}
+
+    def update(self, table):
+        """Feed the columns of ``table`` (all or some of the schema's) to their sketches."""
+        for name in list(self.counters):
+            if name not in table.column_names:
+                continue
+            column = table.column(name)
+            try:
+                for chunk in column.chunks:
+                    self.counters[name].update_hashes(_hash_values(chunk))
+                if name in self.digests:
+                    values = pc.drop_null(column).to_numpy().astype(np.float64)
+                    self.digests[name].update(values[np.isfinite(values)])
+            except (TypeError, ValueError, pa.ArrowException):
+                # Nested or otherwise unhashable values; the column simply has no sketches
+                logger.warning('Cannot sketch column %r of type %s', name, column.type)
+                del self.counters[name]
+                self.digests.pop(name, None)
+
+    def adopt(self, sketches, columns):
+        """Take the finished sketches of ``columns`` from another version's ``ColumnSketches``.
+
+        Used for columns a new version shares unchanged with its parent.
+        """
+        for name in columns:
+            if name not in self.counters:
+                continue
+            if name not in sketches.counters:
+                del self.counters[name]
+                self.digests.pop(name, None)
+                continue
+            self.counters[name] = sketches.counters[name]
+            if name in self.digests:
+                if name in sketches.digests:
+                    self.digests[name] = sketches.digests[name]
+                else:
+                    del self.digests[name]
+
+    def to_bytes(self):
+        arrays = {'columns': np.array(self.columns, dtype=str)}
+        for position, name in enumerate(self.columns):
+            if name not in self.counters:
+                continue
+            arrays[f'{position}.hll'] = self.counters[name].registers
+            if name in self.digests:
+                arrays.update(self.digests[name].to_arrays(str(position)))
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        return buffer.getvalue()
+
+
+class ColumnSketches:
+    """Sketches of one dataset version, loaded from its ``v{n}.sketches.npz``."""
+
+    def __init__(self, data):
+        with np.load(io.BytesIO(data)) as arrays:
+            arrays = dict(arrays)
+        self.columns = arrays['columns'].tolist()
+        self.counters = {}
+        self.digests = {}
+        for position, name in enumerate(self.columns):
+            if f'{position}.hll' in arrays:
+                self.counters[name] = HyperLogLog(registers=arrays[f'{position}.hll'])
+            if f'{position}.means' in arrays:
+                self.digests[name] = TDigest.from_arrays(arrays, str(position))
+        self.nbytes = len(data)
+
+    def distinct(self, column):
+        """Approximate number of distinct non-null values, or None for an unknown column."""
+        counter = self.counters.get(column)
+        return counter.estimate() if counter is not None else None
+
+    def quantiles(self, column, qs):
+        """Approximate quantiles of a numeric column, or None if it has no digest."""
+        digest = self.digests.get(column)
+        return digest.quantile(qs) if digest is not None else None
+
+
+def new_sketch_builder(schema):
+    """A ``SketchBuilder`` for a dataset being written, or None when sketches are disabled."""
+    if not getattr(settings, 'COLUMN_SKETCHES_ENABLED', True):
+        return None
+    return SketchBuilder(schema)
+
+
+def write_sketches(builder, dataset_dir, version):
+    """Store a finished builder beside the version; returns the file name or None."""
+    if builder is None:
+        return None
+    path = dataset_dir / sketches_file_name(version)
+    try:
+        path.write_bytes(builder.to_bytes())
+    except OSError:
+        logger.exception('Could not store the column sketches of %s v%s', dataset_dir.name, version)
+        return None
+    return path.name
+
+
+def load_column_sketches(dataset_id, dataset_dir, manifest):
+    """The ``ColumnSketches`` of a manifest's version, or None if it has none."""
+    if not manifest.get('sketches'):
+        return None
+
+    cache = get_query_cache()
+    key = (dataset_id, manifest['version'], 'sketches')
+    sketches = cache.get(key)
+    if sketches is None:
+        try:
+            sketches = ColumnSketches((dataset_dir / manifest['sketches']).read_bytes())
+        except (OSError, ValueError, KeyError):
+            logger.warning('Column sketches of %s v%s are unreadable', dataset_id, manifest['version'])
+            return None
+        cache.put(key, sketches)
+    return sketches
@@ -0,0 +1,657 @@
+import re
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.test import SimpleTestCase, override_settings
+
+from accounts.compaction import CATEGORY_MAX_UNIQUE, DATETIME_TYPE, Compactor
+from accounts.dataset_cache import DataFrameCache, get_dataframe_cache, get_query_cache
+from accounts.dataset_store import (
+    checkout_version, column_files, get_column_sketches, get_search_index, list_versions, new_dataset_id, read_dataset,
+    read_dataset_rows, read_manifest, redo_version, undo_version, write_dataset, write_dataset_chunks,
+)
+from accounts.sketches import ColumnSketches, HyperLogLog, SketchBuilder, TDigest, _hash_values
+from accounts.utils import get_dataframe_from_store, get_dataframe_rows, set_dataframe_in_store
+
+
+class StoreTestCase(SimpleTestCase):
+    """Runs every test against an empty dataset store in a temporary directory."""
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        store = override_settings(DATASET_STORE_ROOT=root)
+        store.enable()
+        self.addCleanup(store.disable)
+        # Caches are per worker and keyed by dataset ID, so they carry nothing between tests
+        for cache in (get_dataframe_cache(), get_query_cache()):
+            self.addCleanup(cache.clear)
+
+    def write(self, df):
+        dataset_id = new_dataset_id()
+        return dataset_id, write_dataset(dataset_id, df)
+
+    def request(self, dataset_id=None):
+        """A request whose session holds ``dataset_id``."""
+        session = SessionStore()
+        if dataset_id:
+            session['dataset_id'] = dataset_id
+        return SimpleNamespace(session=session)
+
+    def assertDataTypesMatch(self, dataset_id, manifest=None):
+        """The manifest's ``data_types`` are the dtypes the version reads back with."""
+        manifest = manifest or read_manifest(dataset_id)
+        self.assertEqual(manifest['data_types'], read_dataset(dataset_id, manifest).dtypes.astype(str).to_dict())
+
+
+class WriteDatasetTests(StoreTestCase):
+    frame = pd.DataFrame({
+        'int': [1, 2, 3],
+        'float': [1.5, np.nan, 3.0],
+        'nullable': pd.array([1, None, 3], dtype='Int64'),
+        'text': ['a', None, 'c'],
+        'flag': [True, False, True],
+        'when': pd.to_datetime(['2024-01-02', None, '2024-03-04 10:30:00.5'], format='ISO8601'),
+        'category': pd.Categorical(['x', 'y', 'x']),
+    })
+
+    def test_round_trip(self):
+        dataset_id, manifest = self.write(self.frame)
+
+        pd.testing.assert_frame_equal(read_dataset(dataset_id, manifest), self.frame)
+        self.assertEqual(manifest['rows'], 3)
+        self.assertEqual(manifest['missing_values'], self.frame.isnull().sum().to_dict())
+        self.assertDataTypesMatch(dataset_id, manifest)
+
+    def test_rows_of_a_window(self):
+        dataset_id, manifest = self.write(self.frame)
+
+        rows = read_dataset_rows(dataset_id, manifest, 1, 5, columns=['when', 'int'])
+
+        expected = self.frame[['when', 'int']].iloc[1:]
+        pd.testing.assert_frame_equal(rows.reset_index(drop=True), expected.reset_index(drop=True))
+
+    def test_rewrite_replaces_the_dataset(self):
+        dataset_id, _ = self.write(self.frame)
+
+        write_dataset(dataset_id, self.frame[['text']])
+
+        pd.testing.assert_frame_equal(read_dataset(dataset_id), self.frame[['text']])
+
+
+class CopyOnWriteTests(StoreTestCase):
+    frame = WriteDatasetTests.frame
+
+    def test_changed_columns_are_the_only_ones_written(self):
+        dataset_id, base = self.write(self.frame)
+        changed = self.frame.assign(float=self.frame['float'].fillna(0), added=[7, 8, 9])
+
+        manifest = write_dataset(dataset_id, changed, base=base, changed_columns={'float', 'added'})
+
+        files = column_files(manifest)
+        self.assertEqual(files['float'], files['added'])
+        self.assertNotEqual(files['float'], column_files(base)['float'])
+        self.assertTrue(all(files[col] == column_files(base)[col] for col in self.frame if col != 'float'))
+        pd.testing.assert_frame_equal(read_dataset(dataset_id, manifest), changed)
+        # The parent still reads back as it was
+        pd.testing.assert_frame_equal(read_dataset(dataset_id, base), self.frame)
+        self.assertDataTypesMatch(dataset_id, manifest)
+
+    def test_nothing_changed_writes_no_version(self):
+        dataset_id, base = self.write(self.frame)
+
+        self.assertIs(write_dataset(dataset_id, self.frame, base=base, changed_columns=set()), base)
+        self.assertEqual(read_manifest(dataset_id)['version'], base['version'])
+
+
+class VersionHistoryTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dataset_id, manifest = self.write(pd.DataFrame({'a': [1.0, 2.0]}))
+        for factor in (2, 3):
+            manifest = write_dataset(
+                self.dataset_id, pd.DataFrame({'a': [factor, 2.0 * factor]}), base=manifest, changed_columns={'a'},
+            )
+
+    def values(self):
+        return read_dataset(self.dataset_id, read_manifest(self.dataset_id))['a'].tolist()
+
+    def test_undo_and_redo(self):
+        self.assertEqual(undo_version(self.dataset_id)['version'], 2)
+        self.assertEqual(self.values(), [2.0, 4.0])
+        self.assertEqual(undo_version(self.dataset_id)['version'], 1)
+        self.assertIsNone(undo_version(self.dataset_id))
+
+        self.assertEqual(redo_version(self.dataset_id)['version'], 2)
+        self.assertEqual(redo_version(self.dataset_id)['version'], 3)
+        self.assertIsNone(redo_version(self.dataset_id))
+        self.assertEqual(self.values(), [3.0, 6.0])
+
+    def test_writing_after_undo_drops_the_undone_versions(self):
+        base = undo_version(self.dataset_id)
+
+        manifest = write_dataset(self.dataset_id, pd.DataFrame({'a': [5.0, 10.0]}), base=base, changed_columns={'a'})
+
+        # Version numbers are never reused, even for dropped versions
+        self.assertEqual(manifest['version'], 4)
+        self.assertEqual([summary['version'] for summary in list_versions(self.dataset_id)], [1, 2, 4])
+        self.assertIsNone(redo_version(self.dataset_id))
+        self.assertEqual(undo_version(self.dataset_id)['version'], 2)
+
+    def test_checkout(self):
+        self.assertEqual(checkout_version(self.dataset_id, 1)['version'], 1)
+        self.assertEqual(self.values(), [1.0, 2.0])
+        self.assertIsNone(checkout_version(self.dataset_id, 99))
+        self.assertIsNone(checkout_version(new_dataset_id(), 1))
+        self.assertIsNone(undo_version('not-an-id'))
+
+
+class WriteDatasetChunksTests(StoreTestCase):
+    def chunks(self):
+        yield pd.DataFrame({'a': [1, 2], 'b': ['x', 'y'], 'c': [True, False]})
+        yield pd.DataFrame({'a': [np.nan, 4.0], 'b': ['z', None], 'c': [None, True]})
+
+    def test_round_trip(self):
+        dataset_id = new_dataset_id()
+        manifest = write_dataset_chunks(dataset_id, self.chunks())
+
+        df = read_dataset(dataset_id, manifest)
+        self.assertEqual(manifest['rows'], 4)
+        self.assertEqual(manifest['missing_values'], {'a': 1, 'b': 1, 'c': 1})
+        self.assertEqual(df['a'].tolist()[:2] + df['a'].tolist()[3:], [1.0, 2.0, 4.0])
+        self.assertTrue(np.isnan(df['a'].iloc[2]))
+        self.assertEqual(df['b'].tolist()[:3], ['x', 'y', 'z'])
+
+    def test_data_types_of_columns_with_nulls(self):
+        for compact in (False, True):
+            with self.subTest(compact=compact):
+                dataset_id = new_dataset_id()
+                write_dataset_chunks(dataset_id, self.chunks(), compact=compact)
+                self.assertDataTypesMatch(dataset_id)
+
+    def test_data_types_of_integers_with_nulls_in_one_chunk(self):
+        dataset_id = new_dataset_id()
+        write_dataset_chunks(dataset_id, [pd.DataFrame({'a': pd.array([1, None, 3], dtype='Int64')})], compact=True)
+
+        self.assertDataTypesMatch(dataset_id)
+
+
+class ConcurrentWriteTests(StoreTestCase):
+    def test_concurrent_writers_take_distinct_versions(self):
+        frame = pd.DataFrame({'a': np.arange(2000.0), 'b': ['x'] * 2000})
+        dataset_id, base = self.write(frame)
+
+        def write(step):
+            manifest = write_dataset(dataset_id, frame.assign(a=frame['a'] * step), base=base, changed_columns={'a'})
+            return manifest['version'], step
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            written = dict(pool.map(write, range(2, 18)))
+
+        self.assertEqual(sorted(written), list(range(2, 18)))
+        self.assertEqual(read_manifest(dataset_id)['last_version'], 17)
+        # Each write replaced its siblings, but never while they were still being written
+        for summary in list_versions(dataset_id)[1:]:
+            manifest = checkout_version(dataset_id, summary['version'])
+            expected = frame['a'] * written[summary['version']]
+            self.assertEqual(read_dataset(dataset_id, manifest)['a'].tolist(), expected.tolist())
+
+    def test_undo_keeps_versions_written_meanwhile(self):
+        frame = pd.DataFrame({'a': [1.0, 2.0]})
+        dataset_id, base = self.write(frame)
+        write_dataset(dataset_id, frame * 2, base=base, changed_columns={'a'})
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            undone = pool.submit(undo_version, dataset_id)
+            written = pool.submit(write_dataset, dataset_id, frame * 3, base=base, changed_columns={'a'})
+        undone.result()
+        version = written.result()['version']
+
+        self.assertEqual(version, 3)
+        self.assertEqual(read_manifest(dataset_id)['last_version'], 3)
+
+
+class DataFrameCacheTests(SimpleTestCase):
+    def block(self, nbytes=100):
+        return np.zeros(nbytes, dtype=np.uint8)
+
+    def test_evicts_least_recently_used_first(self):
+        cache = DataFrameCache(max_bytes=300)
+        for key in ('a', 'b', 'c'):
+            cache.put((key, 1), self.block())
+        cache.get(('a', 1))
+
+        cache.put(('d', 1), self.block())
+
+        self.assertIsNone(cache.get(('b', 1)))
+        for key in ('a', 'c', 'd'):
+            self.assertIsNotNone(cache.get((key, 1)))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['bytes'], 300)
+
+    def test_evicts_as_many_entries_as_needed(self):
+        cache = DataFrameCache(max_bytes=300)
+        for key in ('a', 'b', 'c'):
+            cache.put((key, 1), self.block())
+
+        cache.put(('d', 1), self.block(250))
+
+        self.assertEqual([key for key in 'abcd' if cache.get((key, 1)) is not None], ['d'])
+        self.assertEqual(cache.stats()['bytes'], 250)
+
+    def test_entry_larger_than_the_budget_is_not_kept(self):
+        cache = DataFrameCache(max_bytes=300)
+        cache.put(('a', 1), self.block())
+
+        cache.put(('b', 1), self.block(301))
+
+        self.assertIsNone(cache.get(('b', 1)))
+        self.assertIsNotNone(cache.get(('a', 1)))
+        self.assertEqual(cache.stats()['evictions'], 0)
+
+    def test_frames_are_measured_deeply(self):
+        cache = DataFrameCache(max_bytes=10 ** 6)
+        df = pd.DataFrame({'text': ['x' * 1000] * 100})
+
+        cache.put(('a', 1), df)
+
+        self.assertGreater(cache.stats()['bytes'], 100 * 1000)
+
+    def test_replacing_an_entry_counts_its_bytes_once(self):
+        cache = DataFrameCache(max_bytes=300)
+        cache.put(('a', 1), self.block())
+        cache.put(('a', 1), self.block(200))
+
+        self.assertEqual(cache.stats()['bytes'], 200)
+        self.assertEqual(cache.stats()['entries'], 1)
+
+    def test_invalidate_drops_every_version_of_a_dataset(self):
+        cache = DataFrameCache(max_bytes=300)
+        cache.put(('a', 1), self.block())
+        cache.put(('a', 2), self.block())
+        cache.put(('b', 1), self.block())
+
+        cache.invalidate('a')
+
+        self.assertIsNone(cache.get(('a', 1)))
+        self.assertIsNone(cache.get(('a', 2)))
+        self.assertIsNotNone(cache.get(('b', 1)))
+        self.assertEqual(cache.stats()['bytes'], 100)
+
+
+class CachedDataFrameTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.frame = pd.DataFrame({'a': [1.0, 2.0, 3.0]})
+        self.dataset_id, self.manifest = self.write(self.frame)
+        self.session_request = self.request(self.dataset_id)
+
+    def test_reads_are_served_from_the_cache(self):
+        cache = get_dataframe_cache()
+        get_dataframe_from_store(self.session_request)
+        hits = cache.stats()['hits']
+
+        df = get_dataframe_from_store(self.session_request)
+
+        self.assertEqual(cache.stats()['hits'], hits + 1)
+        pd.testing.assert_frame_equal(df, self.frame)
+
+    def test_rewriting_the_dataset_drops_its_cached_frames(self):
+        get_dataframe_from_store(self.session_request)
+
+        set_dataframe_in_store(self.session_request, pd.DataFrame({'b': ['x', 'y']}))
+
+        self.assertIsNone(get_dataframe_cache().get((self.dataset_id, self.manifest['version'])))
+        self.assertEqual(get_dataframe_from_store(self.session_request)['b'].tolist(), ['x', 'y'])
+
+    def test_a_new_version_is_read_instead_of_the_cached_one(self):
+        get_dataframe_from_store(self.session_request)
+
+        write_dataset(self.dataset_id, self.frame * 2, base=self.manifest, changed_columns={'a'})
+
+        self.assertEqual(get_dataframe_from_store(self.session_request)['a'].tolist(), [2.0, 4.0, 6.0])
+
+    def test_callers_cannot_change_the_cached_frame(self):
+        df = get_dataframe_from_store(self.session_request)
+        df['a'] = 0.0
+        df.loc[0, 'a'] = 5.0
+
+        pd.testing.assert_frame_equal(get_dataframe_from_store(self.session_request), self.frame)
+
+
+class StoreReadTests(StoreTestCase):
+    """Projected, windowed and metadata-only reads only touch what they return."""
+
+    def setUp(self):
+        super().setUp()
+        self.frame = pd.DataFrame({
+            'price': [1.5, np.nan, 3.0, np.nan],
+            'name': ['a', None, 'c', 'd'],
+            'count': pd.array([1, 2, None, 4], dtype='Int64'),
+        })
+        self.dataset_id, self.manifest = self.write(self.frame)
+        self.session_request = self.request(self.dataset_id)
+
+    def test_metadata_only_reads_no_data(self):
+        with mock.patch('accounts.utils.read_dataset') as read, \
+                mock.patch('accounts.utils.read_dataset_rows') as read_rows:
+            metadata = get_dataframe_from_store(self.session_request, metadata_only=True)
+
+        read.assert_not_called()
+        read_rows.assert_not_called()
+        self.assertEqual(get_dataframe_cache().stats()['entries'], 0)
+        self.assertEqual(metadata['rows'], 4)
+        self.assertEqual(metadata['columns'], 3)
+        self.assertEqual(metadata['column_names'], ['price', 'name', 'count'])
+        self.assertEqual(metadata['data_types'], self.frame.dtypes.astype(str).to_dict())
+        self.assertEqual(metadata['missing_values'], self.frame.isnull().sum().to_dict())
+        self.assertEqual((metadata['dataset_id'], metadata['version']), (self.dataset_id, self.manifest['version']))
+
+    def test_projection_reads_only_the_named_columns(self):
+        with mock.patch('accounts.utils.read_dataset', wraps=read_dataset) as read:
+            df = get_dataframe_from_store(self.session_request, columns=['count', 'missing', 'price'])
+
+        read.assert_called_once_with(self.dataset_id, self.manifest, columns=['count', 'price'])
+        pd.testing.assert_frame_equal(df, self.frame[['count', 'price']])
+        # Partial reads are not cached as the dataset's frame
+        self.assertEqual(get_dataframe_cache().stats()['entries'], 0)
+
+    def test_projection_of_a_cached_frame_is_sliced(self):
+        get_dataframe_from_store(self.session_request)
+
+        with mock.patch('accounts.utils.read_dataset') as read:
+            df = get_dataframe_from_store(self.session_request, columns=['name'])
+
+        read.assert_not_called()
+        pd.testing.assert_frame_equal(df, self.frame[['name']])
+
+    def test_rows_reads_only_the_window(self):
+        with mock.patch('accounts.utils.read_dataset') as read:
+            rows, total = get_dataframe_rows(self.session_request, 1, 2, columns=['name'])
+
+        read.assert_not_called()
+        self.assertEqual(total, 4)
+        expected = self.frame[['name']].iloc[1:3].reset_index(drop=True)
+        pd.testing.assert_frame_equal(rows.reset_index(drop=True), expected)
+
+
+class CompactorTests(SimpleTestCase):
+    def compact(self, *chunks):
+        """Compacted types and values of one column fed in ``chunks``."""
+        tables = [pa.table({'a': chunk}) for chunk in chunks]
+        compactor = Compactor(tables[0].schema)
+        for table in tables:
+            compactor.update(table)
+        data_type = compactor.finish().field('a').type
+        values = pa.concat_tables([compactor.compact(table) for table in tables]).column('a')
+        return data_type, values
+
+    def assertCompactsTo(self, chunks, data_type):
+        compacted_type, values = self.compact(*chunks)
+        self.assertEqual(compacted_type, data_type)
+        original = pa.chunked_array([pa.array(chunk) for chunk in chunks])
+        self.assertEqual(values.cast(original.type).to_pylist(), original.to_pylist())
+
+    def test_integers_take_the_smallest_type_for_their_range(self):
+        for values, data_type in (
+            ([0, -128, 127, None], pa.int8()),
+            ([0, 128], pa.int16()),
+            ([-2 ** 15 - 1, 0], pa.int32()),
+            ([0, 2 ** 31], pa.int64()),
+        ):
+            with self.subTest(values=values):
+                self.assertCompactsTo([values], data_type)
+
+    def test_floats_become_float32_only_when_exact(self):
+        self.assertCompactsTo([[0.5, 1.25, None, -3.0]], pa.float32())
+        self.assertCompactsTo([[0.5, 0.1]], pa.float64())
+        self.assertCompactsTo([[0.5, 1e300]], pa.float64())
+
+    def test_repeated_text_becomes_categorical(self):
+        data_type, values = self.compact(['b', 'a', None, 'b'] * 10)
+
+        self.assertEqual(data_type, pa.dictionary(pa.int8(), pa.string()))
+        self.assertEqual(values.chunk(0).dictionary.to_pylist(), ['a', 'b'])
+        self.assertEqual(values.to_pylist(), ['b', 'a', None, 'b'] * 10)
+
+    def test_text_with_too_many_distinct_values_stays_text(self):
+        # More than one distinct value per two rows
+        self.assertCompactsTo([['a', 'b', 'c', 'a']], pa.string())
+        self.assertCompactsTo([[str(n) for n in range(CATEGORY_MAX_UNIQUE + 1)] * 3], pa.string())
+
+    def test_iso_dates_become_timestamps(self):
+        data_type, values = self.compact(['2024-01-02', None, '2024-03-04 10:30:00.5', '2024-03-04T10:30'])
+
+        self.assertEqual(data_type, DATETIME_TYPE)
+        self.assertEqual(values.to_pandas().tolist()[0], pd.Timestamp('2024-01-02'))
+        self.assertEqual(values.to_pandas().tolist()[2], pd.Timestamp('2024-03-04 10:30:00.5'))
+
+    def test_date_like_text_that_is_not_a_date_stays_text(self):
+        self.assertCompactsTo([['2021-13-45', '2024-01-02']], pa.string())
+        self.assertCompactsTo([['02/01/2024', '03/01/2024']], pa.string())
+
+    def test_empty_columns_keep_their_type(self):
+        self.assertCompactsTo([pa.array([None, None], type=pa.int64())], pa.int64())
+
+    def test_later_chunks_widen_the_type(self):
+        for chunks, data_type in (
+            ([[1, 2, 3], [4, 40000]], pa.int32()),
+            ([[0.5, 1.5], [2.5, 0.1]], pa.float64()),
+            ([['2024-01-02', '2024-01-03'], ['2024-01-04', 'soon']], pa.string()),
+            ([['x', 'y'] * 4, [str(n) for n in range(20)]], pa.string()),
+            ([['2024-01-02'] * 4, ['2024-01-32']], pa.dictionary(pa.int8(), pa.string())),
+        ):
+            with self.subTest(chunks=chunks):
+                self.assertCompactsTo(chunks, data_type)
+
+    def test_compacted_chunks_share_one_dictionary(self):
+        _, values = self.compact(['a', 'a', 'a'], ['b', 'b', 'a'])
+
+        self.assertEqual([chunk.dictionary.to_pylist() for chunk in values.chunks], [['a', 'b'], ['a', 'b']])
+
+
+class CompactedWriteTests(StoreTestCase):
+    def test_compacted_dtypes_read_back(self):
+        chunks = [
+            pd.DataFrame({'small': [1, 2], 'half': [0.5, 1.5], 'kind': ['x', 'x'], 'day': ['2024-01-02', None]}),
+            pd.DataFrame({
+                'small': [3, 300], 'half': [2.5, None], 'kind': ['y', 'x'], 'day': ['2024-02-03', '2024-03-04'],
+            }),
+        ]
+        dataset_id = new_dataset_id()
+
+        manifest = write_dataset_chunks(dataset_id, chunks, compact=True)
+
+        df = read_dataset(dataset_id, manifest)
+        self.assertEqual(df.dtypes.astype(str).to_dict(), {
+            'small': 'int16', 'half': 'float32', 'kind': 'category', 'day': 'datetime64[ns]',
+        })
+        self.assertEqual(df['small'].tolist(), [1, 2, 3, 300])
+        self.assertEqual(df['half'].tolist()[:3], [0.5, 1.5, 2.5])
+        self.assertEqual(df['kind'].tolist(), ['x', 'x', 'y', 'x'])
+        self.assertEqual(df['day'].tolist()[1:], [pd.NaT, pd.Timestamp('2024-02-03'), pd.Timestamp('2024-03-04')])
+        self.assertDataTypesMatch(dataset_id, manifest)
+
+
+class SearchIndexTests(StoreTestCase):
+    frame = pd.DataFrame({
+        'name': ['Ann Smith', 'annabel', None, 'Jo-Ann', 'Bob_Annex', 'Zoë Ångström', 'x', 'ann smith'],
+        'city': pd.Categorical(['New York', 'york', 'Newark', None, 'new york', 'Oslo', 'Newark', 'Oslo']),
+        'note': ['a+b=c', '', 'C++ and c#', 'café au lait', 'x y', 'e-mail', None, '100% sure'],
+        'amount': [1, 2, 3, 4, 5, 6, 7, 8],
+    })
+    terms = [
+        'ann', 'AN', 'smith', 'n s', 'york', 'new york', 'ew', 'ark', 'oslo', 'zoë', 'ångström', 'c++', 'c',
+        '+', 'mail', 'e-m', '100%', 'x', 'annex', 'missing', ' ',
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.dataset_id, self.manifest = self.write(self.frame)
+        self.index = get_search_index(self.dataset_id, self.manifest)
+
+    def scan(self, term, columns, prefix):
+        """Rows found by checking every cell."""
+        term = term.lower()
+        pattern = re.compile(r'(?:^|[\W_])' + re.escape(term)) if prefix else None
+        found = set()
+        for column in columns:
+            for row, value in enumerate(self.frame[column]):
+                if pd.isna(value):
+                    continue
+                value = str(value).lower()
+                if (pattern.search(value) if prefix else term in value):
+                    found.add(row)
+        return sorted(found)
+
+    def test_only_text_columns_are_indexed(self):
+        self.assertEqual(self.index.columns, ['name', 'city', 'note'])
+        self.assertEqual(self.index.num_rows, len(self.frame))
+
+    def test_matches_a_scan_of_every_value(self):
+        for prefix in (False, True):
+            for term in self.terms:
+                for columns in (None, ['city'], ['name', 'note']):
+                    with self.subTest(term=term, prefix=prefix, columns=columns):
+                        expected = self.scan(term, columns or self.index.columns, prefix)
+                        self.assertEqual(self.index.search(term, columns=columns, prefix=prefix).tolist(), expected)
+
+    def test_new_text_values_get_a_fresh_index(self):
+        changed = self.frame.assign(name=self.frame['name'].str.replace('Ann', 'Eve'))
+
+        manifest = write_dataset(self.dataset_id, changed, base=self.manifest, changed_columns={'name'})
+
+        self.assertNotEqual(manifest['search_index'], self.manifest['search_index'])
+        index = get_search_index(self.dataset_id, manifest)
+        self.assertEqual(index.search('eve').tolist(), [0, 3, 4])
+        self.assertEqual(index.search('ann', columns=['name']).tolist(), [1, 7])
+        # The parent keeps its own index
+        self.assertEqual(get_search_index(self.dataset_id, self.manifest).search('eve').tolist(), [])
+
+    def test_index_is_shared_when_no_text_column_changed(self):
+        changed = self.frame.assign(amount=self.frame['amount'] * 2)
+
+        manifest = write_dataset(self.dataset_id, changed, base=self.manifest, changed_columns={'amount'})
+
+        self.assertEqual(manifest['search_index'], self.manifest['search_index'])
+        index = get_search_index(self.dataset_id, manifest)
+        self.assertEqual(index.search('ann').tolist(), self.scan('ann', index.columns, False))
+
+    def test_chunked_writes_are_indexed(self):
+        dataset_id = new_dataset_id()
+        manifest = write_dataset_chunks(dataset_id, [self.frame.iloc[:3], self.frame.iloc[3:]])
+
+        index = get_search_index(dataset_id, manifest)
+
+        for term in ('ann', 'york', 'c++'):
+            with self.subTest(term=term):
+                self.assertEqual(index.search(term).tolist(), self.scan(term, index.columns, False))
+
+
+class SketchTests(SimpleTestCase):
+    # Three standard errors of a HyperLogLog with 2**14 registers
+    distinct_error = 3 * 1.04 / 2 ** 7
+
+    def setUp(self):
+        self.rng = np.random.default_rng(11)
+
+    def rank_error(self, digest, values, q):
+        """How far the estimated q-quantile's rank is from q."""
+        return abs(np.searchsorted(np.sort(values), digest.quantile(q)) / len(values) - q)
+
+    def distinct(self, chunks):
+        counter = HyperLogLog()
+        for chunk in chunks:
+            counter.update_hashes(_hash_values(pa.array(chunk)))
+        return counter
+
+    def test_quantiles_of_a_skewed_distribution(self):
+        values = self.rng.lognormal(size=200_000)
+        digest = TDigest()
+        for chunk in np.array_split(values, 20):
+            digest.update(chunk)
+
+        self.assertEqual(digest.count, len(values))
+        self.assertLess(self.rank_error(digest, values, 0.5), 0.005)
+        self.assertLess(self.rank_error(digest, values, 0.99), 0.002)
+        self.assertEqual(digest.quantile([0.0, 1.0]).tolist(), [values.min(), values.max()])
+        self.assertLess(len(digest.means), 200)
+
+    def test_merged_digests(self):
+        values = self.rng.normal(size=100_000)
+        merged = TDigest()
+        for chunk in np.array_split(values, 10):
+            part = TDigest()
+            part.update(chunk)
+            merged.merge(part)
+
+        self.assertEqual(merged.count, len(values))
+        self.assertLess(self.rank_error(merged, values, 0.5), 0.005)
+        self.assertLess(self.rank_error(merged, values, 0.99), 0.002)
+        self.assertTrue(np.isnan(TDigest().quantile(0.5)))
+
+    def test_distinct_counts(self):
+        for distinct in (1, 100, 5000, 300_000):
+            with self.subTest(distinct=distinct):
+                values = self.rng.choice(10 ** 12, distinct, replace=False)
+                # Every value twice, spread over chunks
+                values = np.concatenate([values, self.rng.permutation(values)])
+                estimate = self.distinct(np.array_split(values, 7)).estimate()
+                self.assertLessEqual(abs(estimate / distinct - 1), self.distinct_error)
+
+    def test_distinct_text(self):
+        values = [f'value {n % 2000}' for n in range(10_000)] + [None] * 10
+
+        self.assertLessEqual(abs(self.distinct([values]).estimate() / 2000 - 1), self.distinct_error)
+
+    def test_merged_counters_equal_one_pass(self):
+        values = self.rng.integers(0, 50_000, 100_000)
+        left, right = self.distinct([values[:60_000]]), self.distinct([values[40_000:]])
+
+        left.merge(right)
+
+        np.testing.assert_array_equal(left.registers, self.distinct([values]).registers)
+
+
+class ColumnSketchTests(StoreTestCase):
+    def test_chunked_write_sketches_every_column(self):
+        rng = np.random.default_rng(5)
+        frame = pd.DataFrame({
+            'amount': rng.exponential(size=30_000),
+            'code': rng.integers(0, 700, 30_000),
+            'label': rng.choice([f'label {n}' for n in range(300)], 30_000),
+        })
+        frame.loc[::10, 'amount'] = np.nan
+        dataset_id = new_dataset_id()
+        chunks = [frame.iloc[start:start + 5000] for start in range(0, len(frame), 5000)]
+
+        manifest = write_dataset_chunks(dataset_id, chunks)
+
+        sketches = get_column_sketches(dataset_id, manifest)
+        for column in frame:
+            with self.subTest(column=column):
+                expected = frame[column].nunique()
+                self.assertLessEqual(abs(sketches.distinct(column) / expected - 1), SketchTests.distinct_error)
+        amounts = frame['amount'].dropna().sort_values().to_numpy()
+        for q, estimate in zip((0.5, 0.99), sketches.quantiles('amount', [0.5, 0.99])):
+            self.assertLess(abs(np.searchsorted(amounts, estimate) / len(amounts) - q), 0.005)
+        self.assertIsNone(sketches.quantiles('label', [0.5]))
+        self.assertIsNone(sketches.distinct('missing'))
+
+    def test_stored_sketches_round_trip(self):
+        table = pa.table({'x': np.arange(1000.0), 'y': ['a', 'b'] * 500})
+        builder = SketchBuilder(table.schema)
+        builder.update(table)
+
+        sketches = ColumnSketches(builder.to_bytes())
+
+        self.assertEqual(sketches.distinct('x'), builder.counters['x'].estimate())
+        self.assertEqual(sketches.distinct('y'), 2)
+        np.testing.assert_array_equal(sketches.quantiles('x', [0.1, 0.9]), builder.digests['x'].quantile([0.1, 0.9]))
@@ -1,35 +1,208 @@
 import pandas as pd
-import pickle
-import base64
-from django.conf import settings
+from .dataset_store import (
+    new_dataset_id,
+    is_valid_dataset_id,
+    write_dataset,
+    write_dataset_chunks,
+    read_dataset,
+    read_dataset_rows,
+    delete_dataset,
+    read_manifest,
+    get_dataset_metadata,
+    get_search_index,
+    list_versions,
+    checkout_version,
+    undo_version,
+    redo_version,
+)
+from .dataset_cache import get_dataframe_cache
 
-STORE_SESSION_KEY = 'debug_dataframe_store'
+STORE_SESSION_KEY = 'dataset_id'
+# [{'id', 'name'}] when one upload produced several datasets (e.g. Excel sheets)
+DATASETS_SESSION_KEY = 'datasets'
+# Older sessions carried the whole pickled frame under this key
+LEGACY_STORE_SESSION_KEY = 'debug_dataframe_store'
+
+
+def get_dataset_id(request):
+    """Return the dataset ID kept in the user's session, or None."""
+    dataset_id = request.session.get(STORE_SESSION_KEY)
+    return dataset_id if is_valid_dataset_id(dataset_id) else None
+
+
+def get_or_create_dataset_id(request):
+    """Return the session's dataset ID, assigning a new one if it has none."""
+    dataset_id = get_dataset_id(request)
+    if dataset_id is None:
+        dataset_id = new_dataset_id()
+        request.session[STORE_SESSION_KEY] = dataset_id
+        request.session.pop(LEGACY_STORE_SESSION_KEY, None)
+        request.session.modified = True
+    return dataset_id
+
+
+def set_session_datasets(request, datasets):
+    """Remember the datasets of the latest upload; the first one becomes active."""
+    request.session[DATASETS_SESSION_KEY] = [
+        {'id': dataset['id'], 'name': dataset['name']}
+        for dataset in datasets
+        if is_valid_dataset_id(dataset['id'])
+    ]
+    if request.session[DATASETS_SESSION_KEY]:
+        request.session[STORE_SESSION_KEY] = request.session[DATASETS_SESSION_KEY][0]['id']
+    request.session.modified = True
+
+
+def get_session_datasets(request):
+    """Datasets the user can switch between, or an empty list."""
+    return request.session.get(DATASETS_SESSION_KEY, [])
+
+
+def activate_dataset(request, dataset_id):
+    """Make one of the session's datasets the active one; returns False if it is not theirs."""
+    if not any(dataset['id'] == dataset_id for dataset in get_session_datasets(request)):
+        return False
+    request.session[STORE_SESSION_KEY] = dataset_id
+    request.session.modified = True
+    return True
 
 
 def set_dataframe_in_store(request, df: pd.DataFrame):
-    """Store a pandas DataFrame in the user's session (base64 encoded)."""
-    # Convert DataFrame to pickle bytes, then encode as base64 string
-    pickled_bytes = pickle.dumps(df)
-    base64_string = base64.b64encode(pickled_bytes).decode('utf-8')
-    request.session[STORE_SESSION_KEY] = base64_string
+    """Write a pandas DataFrame to the dataset store and keep its ID in the session."""
+    dataset_id = get_dataset_id(request) or new_dataset_id()
+    write_dataset(dataset_id, df)
+    get_dataframe_cache().invalidate(dataset_id)
+    request.session[STORE_SESSION_KEY] = dataset_id
+    request.session.pop(LEGACY_STORE_SESSION_KEY, None)
+    request.session.modified = True
+
+
+def set_dataframe_chunks_in_store(request, chunks, compact=False):
+    """Stream DataFrame chunks into the dataset store and return the new manifest."""
+    dataset_id = get_dataset_id(request) or new_dataset_id()
+    manifest = write_dataset_chunks(dataset_id, chunks, compact=compact)
+    get_dataframe_cache().invalidate(dataset_id)
+    request.session[STORE_SESSION_KEY] = dataset_id
+    request.session.pop(LEGACY_STORE_SESSION_KEY, None)
     request.session.modified = True
+    return manifest
+
+
+def get_dataset_manifest(request, dataset_id=None):
+    """Manifest of the session's current dataset version, or None.
+
+    ``dataset_id`` picks another of the session's datasets instead of the
+    active one; datasets outside the session give None.
+    """
+    active_id = get_dataset_id(request)
+    if dataset_id is None or dataset_id == active_id:
+        dataset_id = active_id
+    elif not any(dataset['id'] == dataset_id for dataset in get_session_datasets(request)):
+        return None
+    return read_manifest(dataset_id) if dataset_id else None
+
+
+def get_dataset_versions(request):
+    """Kept versions of the session's current dataset, oldest first, or an empty list."""
+    dataset_id = get_dataset_id(request)
+    return list_versions(dataset_id) if dataset_id and read_manifest(dataset_id) else []
 
 
-def get_dataframe_from_store(request):
-    """Retrieve the pandas DataFrame from the user's session, or None if not set."""
-    base64_string = request.session.get(STORE_SESSION_KEY)
-    if base64_string:
+def move_dataset_version(request, action, version=None):
+    """Undo, redo or check out (``version``) the session's current dataset.
+
+    Returns the manifest of the version that is now current, or None if
+    there is nothing to undo/redo or the version is no longer kept.
+    """
+    dataset_id = get_dataset_id(request)
+    if not dataset_id:
+        return None
+    if action == 'undo':
+        return undo_version(dataset_id)
+    if action == 'redo':
+        return redo_version(dataset_id)
+    return checkout_version(dataset_id, version)
+
+
+def get_dataframe_from_store(request, columns=None, metadata_only=False):
+    """Retrieve the pandas DataFrame for the user's session, or None if not set.
+
+    ``columns`` limits the load to the named columns (unknown names are
+    skipped). With ``metadata_only=True`` no data is read at all and the dict
+    from ``get_dataset_metadata`` is returned instead.
+
+    Frames are shared through the worker's cache, so the returned object is a
+    shallow copy: adding or replacing columns is fine, but take a ``.copy()``
+    before mutating values in place.
+    """
+    dataset_id = get_dataset_id(request)
+    if not dataset_id:
+        return None
+
+    manifest = read_manifest(dataset_id)
+    if manifest is None:
+        return None
+
+    if metadata_only:
+        return get_dataset_metadata(manifest)
+
+    cache = get_dataframe_cache()
+    key = (dataset_id, manifest['version'])
+    df = cache.get(key)
+
+    if columns is not None:
+        columns = [col for col in columns if col in manifest['columns']]
+        if df is not None:
+            return df[columns]
+        # Projected reads are cheap and partial, so they bypass the cache
         try:
-            # Decode base64 string back to pickle bytes, then unpickle
-            pickled_bytes = base64.b64decode(base64_string.encode('utf-8'))
-            return pickle.loads(pickled_bytes)
+            return read_dataset(dataset_id, manifest, columns=columns)
         except Exception:
             return None
-    return None
+
+    if df is None:
+        try:
+            df = read_dataset(dataset_id, manifest)
+        except Exception:
+            return None
+        cache.put(key, df)
+    return df.copy(deep=False)
+
+
+def get_dataframe_rows(request, offset, limit, columns=None):
+    """Return ``(rows, total_rows)`` for a window of the session's dataset, or ``(None, 0)``.
+
+    A frame already in the worker's cache is sliced directly; otherwise only
+    the window is read from the memory-mapped file.
+    """
+    dataset_id = get_dataset_id(request)
+    manifest = read_manifest(dataset_id) if dataset_id else None
+    if manifest is None:
+        return None, 0
+
+    columns = manifest['columns'] if columns is None else columns
+    df = get_dataframe_cache().get((dataset_id, manifest['version']))
+    if df is not None:
+        return df.iloc[offset:offset + limit][columns], manifest['rows']
+    return read_dataset_rows(dataset_id, manifest, offset, limit, columns=columns), manifest['rows']
+
+
+def get_dataset_search_index(request):
+    """Search index of the session's current dataset version, or None."""
+    dataset_id = get_dataset_id(request)
+    manifest = read_manifest(dataset_id) if dataset_id else None
+    if manifest is None:
+        return None
+    return get_search_index(dataset_id, manifest)
 
 
 def clear_dataframe_store(request):
-    """Remove the DataFrame from the user's session."""
-    if STORE_SESSION_KEY in request.session:
-        del request.session[STORE_SESSION_KEY]
-        request.session.modified = True 
\ No newline at end of file
+    """Remove the stored DataFrame and forget it in the user's session."""
+    dataset_ids = {get_dataset_id(request)} | {dataset['id'] for dataset in get_session_datasets(request)}
+    for dataset_id in filter(None, dataset_ids):
+        delete_dataset(dataset_id)
+        get_dataframe_cache().invalidate(dataset_id)
+    for key in (STORE_SESSION_KEY, DATASETS_SESSION_KEY, LEGACY_STORE_SESSION_KEY):
+        if key in request.session:
+            del request.session[key]
+            request.session.modified = True
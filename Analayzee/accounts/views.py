@@ -8,6 +8,7 @@ from django.views.decorators.http import require_http_methods, require_GET, requ
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth import update_session_auth_hash
+from django.conf import settings
 from .forms import (
     CustomUserCreationForm, 
     CustomAuthenticationForm, 
@@ -15,8 +16,9 @@ from .forms import (
     ChangePasswordForm
 )
 from .models import User, get_free_subscription_type
-import pandas as pd
-from .utils import set_dataframe_in_store, get_dataframe_from_store, clear_dataframe_store
+from main.ingestion import ingest_csv
+from .utils import set_dataframe_chunks_in_store, get_dataframe_from_store, clear_dataframe_store
+from .dataset_cache import get_dataframe_cache
 
 
 def signup_view(request):
@@ -240,11 +242,16 @@ def debug_store_upload(request):
     if request.method == 'POST' and request.FILES.get('csv_file'):
         csv_file = request.FILES['csv_file']
         try:
-            df = pd.read_csv(csv_file)
-            set_dataframe_in_store(request, df)
+            manifest, _ = ingest_csv(
+                csv_file,
+                lambda chunks: set_dataframe_chunks_in_store(
+                    request, chunks, compact=getattr(settings, 'INGEST_COMPACT_DTYPES', True),
+                ),
+                file_name=csv_file.name,
+            )
             context['success'] = True
-            context['columns'] = list(df.columns)
-            context['rows'] = len(df)
+            context['columns'] = manifest['columns']
+            context['rows'] = manifest['rows']
         except Exception as e:
             context['error'] = f'Failed to read CSV: {e}'
     return render(request, 'accounts/debug_store_upload.html', context)
@@ -261,6 +268,7 @@ def debug_store_view(request):
         context['info'] = str(df.info(buf=None))
     else:
         context['error'] = 'No DataFrame in store. Please upload a CSV first.'
+    context['cache_stats'] = get_dataframe_cache().stats()
     return render(request, 'accounts/debug_store_view.html', context)
 
 
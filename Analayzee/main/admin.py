@@ -1,3 +1,10 @@
 from django.contrib import admin
+from .models import IngestionJob
 
-# Register your models here.
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ('file_name', 'user', 'status', 'rows_read', 'bytes_parsed', 'bytes_total', 'created_at', 'finished_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('file_name', 'dataset_id', 'user__email')
+    readonly_fields = ('id', 'created_at', 'updated_at', 'finished_at')
@@ -0,0 +1,163 @@
+"""Server-side aggregation of chart series.
+
+Charts receive buckets, not rows: a histogram is one ``np.histogram`` call,
+bar and line charts group the y column by x (binning numeric x into ranges
+once it has too many distinct values), and pie charts count the values of
+one column. Every series is capped at ``AGGREGATE_MAX_BUCKETS`` buckets
+whatever the dataset size, and encoded results are cached per dataset
+version and request.
+"""
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from accounts.dataset_cache import get_query_cache
+
+from .serializers import dumps
+
+CHART_TYPES = ('bar', 'line', 'pie', 'doughnut', 'histogram')
+AGGREGATIONS = ('sum', 'mean', 'median', 'min', 'max', 'count')
+DEFAULT_BINS = 10
+MISSING_LABEL = 'Unknown'
+OTHER_LABEL = 'Other'
+
+
+def get_max_buckets():
+    return getattr(settings, 'AGGREGATE_MAX_BUCKETS', 500)
+
+
+def _is_numeric(series):
+    return pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype)
+
+
+def _float_list(values):
+    """Floats for JSON: NaN (e.g. the mean of an empty bucket) becomes None."""
+    values = np.asarray(values, dtype=np.float64)
+    result = values.astype(object)
+    result[np.isnan(values)] = None
+    return result.tolist()
+
+
+def _bin_labels(edges):
+    return [f'{low:.2f}-{high:.2f}' for low, high in zip(edges[:-1], edges[1:])]
+
+
+def histogram(series, bins=DEFAULT_BINS):
+    """Counts of a numeric column over ``bins`` equal-width ranges."""
+    if not _is_numeric(series):
+        raise ValueError(f'Column {series.name} is not numeric')
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return {'labels': [], 'values': [], 'edges': []}
+
+    counts, edges = np.histogram(values, bins=bins)
+    return {'labels': _bin_labels(edges), 'values': counts.tolist(), 'edges': edges.tolist()}
+
+
+def value_counts(series, limit):
+    """Counts of each value, largest first; values beyond ``limit`` are summed into one bucket."""
+    counts = series.astype(object).where(series.notna(), MISSING_LABEL).value_counts(sort=True)
+    other = int(counts.iloc[limit:].sum())
+    counts = counts.iloc[:limit]
+    labels = [str(label) for label in counts.index]
+    values = counts.to_numpy().tolist()
+    if other:
+        labels.append(OTHER_LABEL)
+        values.append(other)
+    return {'labels': labels, 'values': values, 'other_count': other}
+
+
+def grouped(x, y, agg='sum', bins=None, limit=None):
+    """Aggregate ``y`` per value of ``x``, or per range of ``x`` when it is numeric and binned.
+
+    Numeric ``x`` is binned into ``bins`` ranges when ``bins`` is given or
+    when it has more than ``limit`` distinct values. Other ``x`` keeps its
+    ``limit`` most frequent values.
+    """
+    limit = limit or get_max_buckets()
+    if agg not in AGGREGATIONS:
+        raise ValueError(f'agg must be one of {", ".join(AGGREGATIONS)}')
+    if agg != 'count' and not _is_numeric(y):
+        raise ValueError(f'Column {y.name} is not numeric; use agg=count')
+
+    result = {'binned': False, 'other_groups': 0}
+    present = x.notna()
+    keys = x
+    if _is_numeric(x) and (bins or x.nunique() > limit):
+        x_values = x.to_numpy(dtype=np.float64, na_value=np.nan)
+        present = pd.Series(np.isfinite(x_values), index=x.index)
+        finite = x_values[present.to_numpy()]
+        if not len(finite):
+            return {**result, 'labels': [], 'values': [], 'counts': []}
+        edges = np.histogram_bin_edges(finite, bins=min(bins or limit, limit))
+        # digitize puts the maximum in its own bin; fold it into the last one like np.histogram
+        codes = np.clip(np.digitize(x_values, edges[1:-1]), 0, len(edges) - 2)
+        keys = pd.Series(codes, index=x.index)
+        result.update(binned=True, edges=edges.tolist())
+    elif not _is_numeric(x):
+        frequent = x[present].value_counts(sort=True)
+        if len(frequent) > limit:
+            result['other_groups'] = len(frequent) - limit
+            present &= x.isin(frequent.index[:limit])
+
+    groups = (y if agg != 'count' else y.notna()).groupby(keys[present], sort=True, observed=True)
+    aggregated = groups.sum() if agg == 'count' else groups.agg(agg)
+    counts = groups.size()
+
+    if result['binned']:
+        # Empty ranges stay on the axis so the bins line up
+        positions = np.arange(len(result['edges']) - 1)
+        aggregated = aggregated.reindex(positions)
+        counts = counts.reindex(positions, fill_value=0)
+        labels = _bin_labels(result['edges'])
+    else:
+        labels = [str(label) for label in aggregated.index]
+        missing = ~present & x.isna()
+        if missing.any():
+            # Rows without an x value are charted under one label, as the table shows them
+            missing_y = y[missing] if agg != 'count' else y[missing].notna()
+            labels.append(MISSING_LABEL)
+            aggregated = pd.concat([aggregated, pd.Series([missing_y.sum() if agg == 'count' else missing_y.agg(agg)])])
+            counts = pd.concat([counts, pd.Series([int(missing.sum())])])
+
+    return {
+        **result,
+        'labels': labels,
+        'values': _float_list(aggregated.to_numpy(dtype=np.float64, na_value=np.nan)),
+        'counts': counts.to_numpy().tolist(),
+    }
+
+
+def aggregate(df, chart_type, x=None, y=None, agg='sum', bins=None):
+    """The bucketed series a chart of ``chart_type`` plots."""
+    if chart_type not in CHART_TYPES:
+        raise ValueError(f'chart_type must be one of {", ".join(CHART_TYPES)}')
+    limit = get_max_buckets()
+    if bins is not None and not 1 <= bins <= limit:
+        raise ValueError(f'bins must be between 1 and {limit}')
+
+    if chart_type == 'histogram':
+        return histogram(df[y], bins or DEFAULT_BINS)
+    if chart_type in ('pie', 'doughnut'):
+        return value_counts(df[y], bins or limit)
+    return grouped(df[x], df[y], agg, bins, limit)
+
+
+def get_aggregate(dataset_key, load_columns, chart_type, x=None, y=None, agg='sum', bins=None):
+    """JSON-encoded ``aggregate`` result, cached under ``dataset_key`` (``(dataset_id, version)``).
+
+    ``load_columns(columns)`` returns a frame with the named columns; it is
+    only called on a cache miss.
+    """
+    cache = get_query_cache()
+    key = (*dataset_key, 'aggregate', chart_type, x, y, agg, bins)
+    payload = cache.get(key)
+    if payload is None:
+        columns = [column for column in dict.fromkeys((x, y)) if column is not None]
+        result = aggregate(load_columns(columns), chart_type, x, y, agg, bins)
+        payload = dumps({
+            'success': True, 'chart_type': chart_type, 'x': x, 'y': y, 'agg': agg, 'bins': bins, **result,
+        }).encode()
+        cache.put(key, payload)
+    return payload
@@ -1,6 +1,14 @@
+import pandas as pd
 from django.apps import AppConfig
 
 
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        # Cached frames are handed out as shallow copies (accounts.utils, cleaning
+        # previews), which is only safe under copy-on-write. pandas 3 always uses it
+        # and deprecates the option, so it is only switched on for pandas 2.
+        if int(pd.__version__.split('.')[0]) < 3:
+            pd.options.mode.copy_on_write = True
@@ -0,0 +1,1156 @@
+"""Cleaning operations run against the stored dataset.
+
+A cleaning request names a dataset version; the operation is applied to
+that version's frame on the server and written back as the next version,
+and the client gets the operation's stats and a preview of the first rows
+instead of the whole dataset. The new version only stores the columns the
+operation changed (see ``changed_columns``) and can be undone. Versions
+too large to load are cleaned one chunk of the column at a time instead.
+"""
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from pandas.tseries.api import guess_datetime_format
+
+from accounts.dataset_cache import get_dataframe_cache
+from accounts.dataset_store import (
+    get_column_sketches, get_row_fingerprints, read_dataset, read_dataset_rows, read_dataset_table,
+    write_column_chunks, write_dataset,
+)
+from accounts.sketches import TDigest
+
+OPERATIONS = ('missing-values', 'outliers', 'data-type', 'text-cleaning', 'duplicates', 'normalize')
+OPERATION_NAMES = {
+    'missing-values': 'Handle Missing Values',
+    'outliers': 'Handle Outliers',
+    'data-type': 'Convert Data Type',
+    'text-cleaning': 'Text Cleaning',
+    'duplicates': 'Remove Duplicates',
+    'normalize': 'Normalize Data',
+}
+# Rows of the cleaned dataset sent back with the stats, as many as the analysis page starts with
+PREVIEW_ROWS = 50
+# Text cleaning patterns; plain strings so Arrow strings run them without a Python loop
+SPECIAL_CHARACTERS = r'[^a-zA-Z0-9\s]'
+NUMBERS = r'\d+'
+
+
+class StaleVersionError(Exception):
+    """The client cleaned a dataset version that is no longer the current one."""
+
+
+def _number(params, name, default):
+    value = params.get(name, default)
+    try:
+        return float(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a number')
+
+
+def _flag(params, name, default=False):
+    """Boolean option; form posts send them as strings."""
+    value = params.get(name, default)
+    if isinstance(value, str):
+        return value.lower() in ('true', '1', 'on', 'yes')
+    return bool(value)
+
+
+def _list(params, name):
+    return params.getlist(name) if hasattr(params, 'getlist') else params.get(name, [])
+
+
+def _fillna(series, value):
+    """``series.fillna(value)``; categorical columns (compacted at ingest) gain ``value`` as a category."""
+    if isinstance(series.dtype, pd.CategoricalDtype) and value not in series.cat.categories:
+        series = series.cat.add_categories([value])
+    return series.fillna(value)
+
+
+def changed_columns(operation, column, params):
+    """Columns an operation rewrites or adds; None when it may drop rows, which changes every column."""
+    if operation == 'missing-values':
+        return None if params.get('action', 'fill-mean') == 'drop' else {column}
+    if operation == 'outliers':
+        action = params.get('action', 'cap')
+        if action == 'remove':
+            return None
+        return {f'{column}_is_outlier'} if action == 'mark' else {column}
+    if operation == 'duplicates':
+        action = params.get('action', 'remove')
+        if action == 'remove':
+            return None
+        return {'is_duplicate'} if action == 'mark' else set()
+    return {column}
+
+
+def describe_operation(operation, column, params):
+    """Short label of an operation for the version history, e.g. ``Normalize Data (minmax) on price``."""
+    option = params.get('action') or params.get('method') or params.get('target_type')
+    label = OPERATION_NAMES.get(operation, operation) + (f' ({option})' if option else '')
+    return f'{label} on {column}' if column else label
+
+
+def apply_cleaning_operation(df, column, operation, params, sketches=None, fingerprints=None):
+    """Apply specific cleaning operation to DataFrame
+
+    ``sketches`` are the ingest sketches of the stored version ``df`` was
+    read from; large columns then take quantiles from them instead of sorting.
+    ``fingerprints(columns)`` returns the stored row fingerprints of that
+    version (or None); duplicate detection then compares those instead of
+    the columns.
+    """
+    stats = {}
+
+    if operation == 'missing-values':
+        stats = handle_missing_values(df, column, params)
+    elif operation == 'outliers':
+        stats = handle_outliers(df, column, params, sketches)
+    elif operation == 'data-type':
+        stats = convert_data_type(df, column, params)
+    elif operation == 'text-cleaning':
+        stats = clean_text(df, column, params)
+    elif operation == 'duplicates':
+        stats = remove_duplicates(df, params, fingerprints)
+    elif operation == 'normalize':
+        stats = normalize_data(df, column, params, sketches)
+
+    return stats
+
+
+def handle_missing_values(df, column, params):
+    """Handle missing values in a column"""
+    action = params.get('action', 'fill-mean')
+    missing_count = df[column].isnull().sum()
+    stats = {'missing_filled': missing_count}
+
+    if action == 'fill-mean' and pd.api.types.is_numeric_dtype(df[column]):
+        df[column] = _fillna(df[column], df[column].mean())
+    elif action == 'fill-median' and pd.api.types.is_numeric_dtype(df[column]):
+        df[column] = _fillna(df[column], df[column].median())
+    elif action == 'fill-mode':
+        mode = df[column].mode()
+        if not mode.empty:
+            df[column] = _fillna(df[column], mode.iloc[0])
+    elif action == 'fill-zero':
+        df[column] = _fillna(df[column], 0)
+    elif action == 'fill-custom':
+        custom_value = params.get('custom_value', '')
+        if pd.api.types.is_numeric_dtype(df[column]) and not pd.api.types.is_bool_dtype(df[column]):
+            # Form posts send numbers as text; a numeric column is filled with the number
+            try:
+                custom_value = float(custom_value)
+            except (TypeError, ValueError):
+                pass
+        df[column] = _fillna(df[column], custom_value)
+    elif action == 'drop':
+        df.dropna(subset=[column], inplace=True)
+        stats['rows_dropped'] = missing_count
+
+    return stats
+
+
+def column_quantiles(df, column, qs, sketches=None):
+    """Quantiles of a column; approximated from the ingest t-digest for large columns"""
+    if sketches is not None and len(df) >= getattr(settings, 'SKETCH_QUANTILES_MIN_ROWS', 1000000):
+        approximate = sketches.quantiles(column, qs)
+        if approximate is not None:
+            return [float(value) for value in approximate]
+    return [df[column].quantile(q) for q in qs]
+
+
+def handle_outliers(df, column, params, sketches=None):
+    """Handle outliers in a column"""
+    method = params.get('method', 'iqr')
+    action = params.get('action', 'cap')
+    threshold = _number(params, 'threshold', 1.5)
+
+    if not pd.api.types.is_numeric_dtype(df[column]):
+        return {'error': 'Column is not numeric'}
+
+    outliers_mask = pd.Series(False, index=df.index)
+
+    if method == 'iqr':
+        Q1, Q3 = column_quantiles(df, column, [0.25, 0.75], sketches)
+        IQR = Q3 - Q1
+        lower_bound = Q1 - threshold * IQR
+        upper_bound = Q3 + threshold * IQR
+        outliers_mask = (df[column] < lower_bound) | (df[column] > upper_bound)
+    elif method == 'zscore':
+        z_scores = np.abs((df[column] - df[column].mean()) / df[column].std())
+        outliers_mask = z_scores > threshold
+    elif method == 'percentile':
+        lower_percentile = (100 - threshold * 100) / 2
+        upper_percentile = 100 - lower_percentile
+        lower_bound, upper_bound = column_quantiles(
+            df, column, [lower_percentile / 100, upper_percentile / 100], sketches,
+        )
+        outliers_mask = (df[column] < lower_bound) | (df[column] > upper_bound)
+
+    outlier_count = outliers_mask.sum()
+    stats = {'outliers_found': outlier_count}
+
+    if action == 'cap':
+        if method == 'zscore':
+            mean_val = df[column].mean()
+            std_val = df[column].std()
+            lower_bound = mean_val - threshold * std_val
+            upper_bound = mean_val + threshold * std_val
+        df[column] = df[column].clip(lower_bound, upper_bound)
+        stats['outliers_capped'] = outlier_count
+    elif action == 'remove':
+        df.drop(df[outliers_mask].index, inplace=True)
+        stats['outliers_removed'] = outlier_count
+    elif action == 'mark':
+        df[f'{column}_is_outlier'] = outliers_mask
+        stats['outliers_marked'] = outlier_count
+
+    return stats
+
+
+def convert_data_type(df, column, params, datetime_format=None):
+    """Convert data type of a column (``datetime_format`` is passed on to ``pd.to_datetime``)"""
+    target_type = params.get('target_type', 'string')
+    method = params.get('method', 'coerce')
+
+    stats = {'original_type': str(df[column].dtype)}
+
+    try:
+        if target_type == 'int':
+            df[column] = pd.to_numeric(df[column], errors='coerce' if method == 'coerce' else 'raise').astype('Int64')
+        elif target_type == 'float':
+            df[column] = pd.to_numeric(df[column], errors='coerce' if method == 'coerce' else 'raise')
+        elif target_type == 'string':
+            df[column] = df[column].astype(str)
+        elif target_type == 'datetime':
+            df[column] = pd.to_datetime(
+                df[column], errors='coerce' if method == 'coerce' else 'raise', format=datetime_format,
+            )
+        elif target_type == 'boolean':
+            df[column] = df[column].map({'true': True, 'false': False, '1': True, '0': False, 1: True, 0: False})
+
+        stats['new_type'] = str(df[column].dtype)
+        stats['conversion_successful'] = True
+
+    except Exception as e:
+        stats['conversion_successful'] = False
+        stats['error'] = str(e)
+
+    return stats
+
+
+def _parse_replacements(text):
+    """``old: new`` lines as ``(old, new)`` pairs, in order; lines without an ``old`` are skipped"""
+    replacements = []
+    for line in text.split('\n'):
+        if ':' in line:
+            old, new = line.split(':', 1)
+            if old.strip():
+                replacements.append((old.strip(), new.strip()))
+    return replacements
+
+
+def _dedupe_words(text):
+    # dict keys keep the first occurrence of each word, in order
+    return ' '.join(dict.fromkeys(text.split()))
+
+
+def _replace(values, old, new):
+    return values.str.replace(old, new, regex=False)
+
+
+def _text_cleaner(params):
+    """The function ``clean_text`` applies to a Series of strings for these options
+
+    Each option is one vectorized ``.str`` call; regexes are passed as
+    pattern strings so Arrow-backed strings are matched natively.
+    """
+    steps = []
+    if _flag(params, 'trim_whitespace', True):
+        steps.append(lambda values: values.str.strip())
+    if _flag(params, 'lowercase'):
+        steps.append(lambda values: values.str.lower())
+    if _flag(params, 'remove_special'):
+        steps.append(lambda values: values.str.replace(SPECIAL_CHARACTERS, '', regex=True))
+    if _flag(params, 'remove_numbers'):
+        steps.append(lambda values: values.str.replace(NUMBERS, '', regex=True))
+    if _flag(params, 'remove_duplicates'):
+        steps.append(lambda values: values.map(_dedupe_words))
+
+    # One literal replace per line, in order, so a line also rewrites what earlier lines put in
+    for old, new in _parse_replacements(params.get('custom_replacements', '') or ''):
+        steps.append(partial(_replace, old=old, new=new))
+
+    def clean(values):
+        for step in steps:
+            values = step(values)
+        return values
+
+    return clean
+
+
+def is_text_column(series):
+    """Whether text cleaning applies: string or object columns, and categoricals of strings."""
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        dtype = dtype.categories.dtype
+    return pd.api.types.is_string_dtype(dtype)
+
+
+def clean_text_values(series, cleaners):
+    """``series`` with ``cleaners`` (from ``_text_cleaner``) applied in order; missing values are kept.
+
+    Each distinct value is cleaned once and the results are mapped back by
+    code, so repetitive columns cost as much as their categories. A
+    categorical column stays categorical: its categories are cleaned, and
+    categories that clean to the same text are merged.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        values = series.cat.categories.to_series(index=None).astype(str)
+        for cleaner in cleaners:
+            values = cleaner(values)
+        # Categories that now read the same share one code
+        merged, categories = pd.factorize(values.to_numpy(dtype=object))
+        codes = series.cat.codes.to_numpy()
+        codes = np.where(codes < 0, -1, merged[codes])
+        return pd.Series(
+            pd.Categorical.from_codes(codes, categories=categories, ordered=series.cat.ordered),
+            index=series.index, name=series.name,
+        )
+
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    values = pd.Series(uniques).astype(str)
+    for cleaner in cleaners:
+        values = cleaner(values)
+    cleaned = np.append(values.to_numpy(dtype=object), None)
+    result = pd.Series(cleaned[codes], index=series.index, name=series.name, dtype=object)
+    missing = codes < 0
+    if missing.any():
+        result[missing] = series[missing].astype(object)
+    return result.astype(series.dtype) if series.dtype != object else result
+
+
+def clean_text(df, column, params):
+    """Clean text data in a column"""
+    if not is_text_column(df[column]):
+        return {'error': 'Column is not text'}
+
+    stats = {'rows_processed': len(df)}
+
+    df[column] = clean_text_values(df[column], [_text_cleaner(params)])
+
+    return stats
+
+
+def duplicate_subset(params):
+    """Columns two rows must share to count as duplicates; None compares whole rows"""
+    scope = params.get('scope', 'all')
+    if scope == 'all':
+        return None
+    if scope == 'selected':
+        column = params.get('column')
+        return [column] if column else None
+    return _list(params, 'subset_columns') or None
+
+
+def remove_duplicates(df, params, fingerprints=None):
+    """Remove duplicate rows"""
+    action = params.get('action', 'remove')
+    keep_option = params.get('keep', 'first')
+    if keep_option == 'none':
+        keep_option = False
+
+    original_count = len(df)
+    subset = duplicate_subset(params)
+
+    keys = fingerprints(subset) if fingerprints is not None else None
+    if keys is not None and len(keys) == len(df):
+        # One 64-bit fingerprint per row: a single integer hash pass however many columns are compared
+        keys = pd.Series(np.asarray(keys), index=df.index)
+        duplicated = keys.duplicated
+    else:
+        duplicated = partial(df.duplicated, subset=subset)
+
+    if action == 'remove':
+        df.drop(df.index[duplicated(keep=keep_option).to_numpy()], inplace=True)
+        removed_count = original_count - len(df)
+        stats = {'duplicates_removed': removed_count, 'rows_remaining': len(df)}
+    elif action == 'mark':
+        df['is_duplicate'] = duplicated(keep=False)
+        duplicate_count = df['is_duplicate'].sum()
+        stats = {'duplicates_marked': duplicate_count}
+    elif action == 'count':
+        duplicate_count = duplicated(keep=False).sum()
+        stats = {'duplicate_count': duplicate_count}
+
+    return stats
+
+
+def normalize_data(df, column, params, sketches=None):
+    """Normalize numeric data"""
+    method = params.get('method', 'minmax')
+    range_min = _number(params, 'range_min', 0)
+    range_max = _number(params, 'range_max', 1)
+
+    if not pd.api.types.is_numeric_dtype(df[column]):
+        return {'error': 'Column is not numeric'}
+
+    stats = {'original_min': df[column].min(), 'original_max': df[column].max()}
+
+    if method == 'minmax':
+        df[column] = (df[column] - df[column].min()) / (df[column].max() - df[column].min())
+        df[column] = df[column] * (range_max - range_min) + range_min
+    elif method == 'zscore':
+        df[column] = (df[column] - df[column].mean()) / df[column].std()
+    elif method == 'robust':
+        Q1, Q3 = column_quantiles(df, column, [0.25, 0.75], sketches)
+        IQR = Q3 - Q1
+        df[column] = (df[column] - Q1) / IQR
+    elif method == 'decimal':
+        max_abs = df[column].abs().max()
+        if max_abs > 0:
+            scale = 10 ** (len(str(int(max_abs))) - 1)
+            df[column] = df[column] / scale
+
+    stats['new_min'] = df[column].min()
+    stats['new_max'] = df[column].max()
+
+    return stats
+
+
+# Cleaning plans: an ordered list of steps, grouped into stages before anything runs.
+# Runs of steps that only rewrite their own column's values are fused: numeric
+# fills, caps and normalizations work in place on one float buffer of the column,
+# and text cleanings are composed and applied once per distinct value. Every
+# other step (row drops, type conversions, new columns) is a stage of its own.
+
+NUMERIC_FILLS = ('fill-mean', 'fill-median', 'fill-mode', 'fill-zero', 'fill-custom')
+
+
+def _is_numeric_step(step):
+    operation, params = step['operation'], step['params']
+    if operation == 'missing-values':
+        action = params.get('action', 'fill-mean')
+        if action == 'fill-custom':
+            try:
+                float(params.get('custom_value', ''))
+            except (TypeError, ValueError):
+                return False
+        return action in NUMERIC_FILLS
+    if operation == 'outliers':
+        return params.get('action', 'cap') == 'cap'
+    return operation == 'normalize'
+
+
+def _stage_kind(step):
+    if _is_numeric_step(step):
+        return 'numeric'
+    if step['operation'] == 'text-cleaning':
+        return 'text'
+    return 'frame'
+
+
+def build_plan(steps):
+    """Group an ordered list of ``{'operation', 'column', ...options}`` steps into stages.
+
+    Raises ``ValueError`` for a malformed step.
+    """
+    plan = []
+    for position, step in enumerate(steps, start=1):
+        if not isinstance(step, dict):
+            raise ValueError(f'Step {position} must be an object')
+        operation = step.get('operation')
+        if operation not in OPERATIONS:
+            raise ValueError(f'Step {position}: operation must be one of {", ".join(OPERATIONS)}')
+        column = step.get('column')
+        if not column and operation != 'duplicates':
+            raise ValueError(f'Step {position}: column is required')
+        step = {'position': position, 'operation': operation, 'column': column, 'params': step}
+
+        kind = _stage_kind(step)
+        previous = plan[-1] if plan else None
+        if kind != 'frame' and previous and previous['kind'] == kind and previous['column'] == column:
+            previous['steps'].append(step)
+        else:
+            plan.append({'kind': kind, 'column': column, 'steps': [step]})
+    return plan
+
+
+def describe_plan(plan):
+    """JSON-friendly summary: one entry per pass over the data."""
+    return [
+        {
+            'column': stage['column'],
+            'operations': [step['operation'] for step in stage['steps']],
+            'fused': len(stage['steps']) > 1,
+        }
+        for stage in plan
+    ]
+
+
+def _float(value):
+    return None if np.isnan(value) else float(value)
+
+
+def _nan_reduce(function, values):
+    """``function`` over the non-missing values, NaN when there are none."""
+    present = values[~np.isnan(values)]
+    return function(present) if len(present) else np.nan
+
+
+def _nan_std(values):
+    """Sample standard deviation of the non-missing values, as ``Series.std``."""
+    present = values[~np.isnan(values)]
+    return present.std(ddof=1) if len(present) > 1 else np.nan
+
+
+def _buffer_quantiles(values, qs, column, sketches=None):
+    """``column_quantiles`` for a column's float buffer (NaN meaning missing)."""
+    if sketches is not None and len(values) >= getattr(settings, 'SKETCH_QUANTILES_MIN_ROWS', 1000000):
+        approximate = sketches.quantiles(column, qs)
+        if approximate is not None:
+            return [float(value) for value in approximate]
+    if np.isnan(values).all():
+        return [np.nan] * len(qs)
+    return [float(value) for value in np.nanquantile(values, qs)]
+
+
+class BufferSummary:
+    """Statistics of a column's float buffer for the numeric kernels, computed when asked for.
+
+    The kernels only read statistics through this interface, so
+    ``StreamSummary`` can stand in with statistics of a whole stored column.
+    """
+
+    def __init__(self, values, column, sketches=None):
+        self.values = values
+        self.column = column
+        self.sketches = sketches
+
+    def mean(self):
+        return _nan_reduce(np.mean, self.values)
+
+    def std(self):
+        return _nan_std(self.values)
+
+    def min(self):
+        return _nan_reduce(np.min, self.values)
+
+    def max(self):
+        return _nan_reduce(np.max, self.values)
+
+    def max_abs(self):
+        return _nan_reduce(lambda present: np.abs(present).max(), self.values)
+
+    def median(self):
+        return _nan_reduce(np.median, self.values)
+
+    def mode(self):
+        # The smallest of the most frequent values, as Series.mode().iloc[0]
+        uniques, counts = np.unique(self.values[~np.isnan(self.values)], return_counts=True)
+        return uniques[counts.argmax()] if len(uniques) else np.nan
+
+    def quantiles(self, qs):
+        return _buffer_quantiles(self.values, qs, self.column, self.sketches)
+
+
+def _fill_kernel(values, params, summary):
+    action = params.get('action', 'fill-mean')
+    missing = np.isnan(values)
+    count = int(missing.sum())
+    if count:
+        if action == 'fill-mean':
+            value = summary.mean()
+        elif action == 'fill-median':
+            value = summary.median()
+        elif action == 'fill-mode':
+            value = summary.mode()
+        elif action == 'fill-zero':
+            value = 0.0
+        else:
+            value = float(params.get('custom_value'))
+        values[missing] = value
+    return {'missing_filled': count}
+
+
+def outlier_bounds(params, summary):
+    """``(lower, upper)`` bounds outside which values are outliers; None for an unknown method."""
+    method = params.get('method', 'iqr')
+    threshold = _number(params, 'threshold', 1.5)
+
+    if method == 'iqr':
+        Q1, Q3 = summary.quantiles([0.25, 0.75])
+        IQR = Q3 - Q1
+        return Q1 - threshold * IQR, Q3 + threshold * IQR
+    if method == 'zscore':
+        mean_val, std_val = summary.mean(), summary.std()
+        return mean_val - threshold * std_val, mean_val + threshold * std_val
+    if method == 'percentile':
+        lower_percentile = (100 - threshold * 100) / 2
+        upper_percentile = 100 - lower_percentile
+        lower_bound, upper_bound = summary.quantiles([lower_percentile / 100, upper_percentile / 100])
+        return lower_bound, upper_bound
+    return None
+
+
+def _cap_kernel(values, params, summary):
+    bounds = outlier_bounds(params, summary)
+    if bounds is None:
+        return {'error': f'Unknown outlier method: {params.get("method")}'}
+
+    lower_bound, upper_bound = bounds
+    outlier_count = int(np.count_nonzero((values < lower_bound) | (values > upper_bound)))
+    np.clip(values, lower_bound, upper_bound, out=values)
+    return {'outliers_found': outlier_count, 'outliers_capped': outlier_count}
+
+
+def _normalize_kernel(values, params, summary):
+    method = params.get('method', 'minmax')
+    range_min = _number(params, 'range_min', 0)
+    range_max = _number(params, 'range_max', 1)
+
+    low, high = summary.min(), summary.max()
+    stats = {'original_min': _float(low), 'original_max': _float(high)}
+
+    if method == 'minmax':
+        values -= low
+        values /= high - low
+        values *= range_max - range_min
+        values += range_min
+    elif method == 'zscore':
+        mean_val, std_val = summary.mean(), summary.std()
+        values -= mean_val
+        values /= std_val
+    elif method == 'robust':
+        Q1, Q3 = summary.quantiles([0.25, 0.75])
+        values -= Q1
+        values /= Q3 - Q1
+    elif method == 'decimal':
+        max_abs = summary.max_abs()
+        if max_abs > 0:
+            values /= 10 ** (len(str(int(max_abs))) - 1)
+
+    stats['new_min'] = _float(_nan_reduce(np.min, values))
+    stats['new_max'] = _float(_nan_reduce(np.max, values))
+    return stats
+
+
+def numeric_result(series, values, keep_dtype=True):
+    """The kernels' float buffer ``values`` as the new ``series``.
+
+    ``series`` itself is returned when no value changed. With ``keep_dtype``
+    an integer column stays in its dtype while every value is still a whole
+    number it can hold (and, unless it is nullable, none is missing). Other
+    results of a nullable column are ``Float64``, as pandas arithmetic gives.
+    """
+    if np.array_equal(series.to_numpy(dtype=np.float64, na_value=np.nan), values, equal_nan=True):
+        return series
+    result = pd.Series(values, index=series.index, name=series.name)
+    nullable = isinstance(series.dtype, pd.api.extensions.ExtensionDtype)
+    fallback = result.astype('Float64') if nullable else result
+    if not keep_dtype:
+        return fallback
+    if pd.api.types.is_float_dtype(series.dtype):
+        return result.astype(series.dtype)
+    if not pd.api.types.is_integer_dtype(series.dtype):
+        return fallback
+
+    missing = np.isnan(values)
+    present = values[~missing]
+    limits = np.iinfo(getattr(series.dtype, 'numpy_dtype', series.dtype))
+    fits = (
+        (nullable or not missing.any())
+        and np.array_equal(present, np.trunc(present))
+        and (not len(present) or (present.min() >= limits.min and present.max() <= limits.max))
+    )
+    return result.astype(series.dtype) if fits else fallback
+
+
+NUMERIC_KERNELS = {
+    'missing-values': _fill_kernel,
+    'outliers': _cap_kernel,
+    'normalize': _normalize_kernel,
+}
+
+
+def _run_numeric_stage(df, stage, sketches, fingerprints=None):
+    column = stage['column']
+    series = df[column]
+    if not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return _run_frame_stage(df, stage, sketches, fingerprints)
+
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+    results = []
+    for step in stage['steps']:
+        # Sketches describe the stored column, so they only stand in for it before the first change
+        usable = sketches if not results else None
+        kernel = NUMERIC_KERNELS[step['operation']]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            results.append(kernel(values, step['params'], BufferSummary(values, column, usable)))
+        if 'error' in results[-1]:
+            return results
+
+    # Normalized values are fractions; fills and caps keep integer columns integer, as fillna and clip do
+    keep_dtype = all(step['operation'] != 'normalize' for step in stage['steps'])
+    df[column] = numeric_result(series, values, keep_dtype)
+    return results
+
+
+def _run_text_stage(df, stage, sketches, fingerprints=None):
+    column = stage['column']
+    if not is_text_column(df[column]):
+        return _run_frame_stage(df, stage, sketches, fingerprints)
+
+    # Every step runs over the distinct values once, not one pass per step over every row
+    df[column] = clean_text_values(df[column], [_text_cleaner(step['params']) for step in stage['steps']])
+    return [{'rows_processed': len(df)} for _ in stage['steps']]
+
+
+def _run_frame_stage(df, stage, sketches, fingerprints=None):
+    results = []
+    for step in stage['steps']:
+        if results:
+            sketches = fingerprints = None
+        results.append(apply_cleaning_operation(
+            df, step['column'], step['operation'], step['params'], sketches, fingerprints,
+        ))
+        if 'error' in results[-1]:
+            break
+    return results
+
+
+STAGE_RUNNERS = {
+    'numeric': _run_numeric_stage,
+    'text': _run_text_stage,
+    'frame': _run_frame_stage,
+}
+
+
+def _pristine_fingerprints(fingerprints, df, pristine):
+    """``fingerprints`` limited to column sets whose values are all still the stored ones."""
+    if fingerprints is None:
+        return None
+
+    def get(columns):
+        compared = set(df.columns if columns is None else columns)
+        return fingerprints(columns) if compared <= pristine else None
+
+    return get
+
+
+def execute_plan(df, plan, sketches=None, fingerprints=None):
+    """Run a plan against ``df`` in place; returns one ``{'operation', 'column', 'stats'}`` per step.
+
+    Stops at the first step whose stats carry an ``error``.
+    """
+    results = []
+    # Columns whose values are still those the stored version's sketches and fingerprints describe
+    pristine = set(df.columns)
+    for stage in plan:
+        column = stage['column']
+        if column is not None and column not in df.columns:
+            stats = [{'error': f'Unknown column: {column}'}]
+        else:
+            rows = len(df)
+            stats = STAGE_RUNNERS[stage['kind']](
+                df, stage, sketches if column in pristine else None, _pristine_fingerprints(fingerprints, df, pristine),
+            )
+            if len(df) != rows:
+                pristine.clear()
+            pristine.discard(column)
+
+        for step, step_stats in zip(stage['steps'], stats):
+            results.append({'operation': step['operation'], 'column': step['column'], 'stats': step_stats})
+        if stats and 'error' in stats[-1]:
+            break
+    return results
+
+
+# Out-of-core execution: operations that rewrite or add one column row by row
+# (fills, caps and marks, type conversions, text cleaning, normalization) run
+# over the stored column in chunks of CLEANING_CHUNK_ROWS rows once a version is
+# larger than CLEANING_IN_MEMORY_MAX_BYTES. A first pass gathers the statistics
+# the operation needs for the whole column, a second cleans each chunk with them
+# and streams it into the new version, so worker memory bounds the chunk rather
+# than the dataset. Operations that drop rows or compare whole rows run in memory.
+
+def get_chunk_rows():
+    return getattr(settings, 'CLEANING_CHUNK_ROWS', 1000000)
+
+
+def get_in_memory_max_bytes():
+    return getattr(settings, 'CLEANING_IN_MEMORY_MAX_BYTES', 1024 * 1024 * 1024)
+
+
+def can_clean_in_chunks(operation, column, params):
+    """Whether an operation only rewrites or adds a column, one row at a time."""
+    return operation != 'duplicates' and changed_columns(operation, column, params) is not None
+
+
+class StreamSummary:
+    """``BufferSummary`` statistics of a whole stored column, gathered one chunk at a time.
+
+    Moments, bounds and the mode are exact (the mode keeps a count per
+    distinct value). Quantiles of a column of ``rows`` values are exact
+    below ``SKETCH_QUANTILES_MIN_ROWS``, as ``column_quantiles`` computes
+    them, so its values are kept; larger columns take them from the ingest
+    sketches when they have the column, otherwise from a t-digest fed during
+    the pass, so they are approximate like the sketches of large columns.
+    """
+
+    def __init__(self, column, numeric, sketches=None, quantiles=False, mode=False, rows=None):
+        self.column = column
+        self.numeric = numeric
+        large = rows is None or rows >= getattr(settings, 'SKETCH_QUANTILES_MIN_ROWS', 1000000)
+        usable = large and sketches is not None and sketches.quantiles(column, [0.5]) is not None
+        self.sketches = sketches if usable else None
+        quantiles = quantiles and numeric and self.sketches is None
+        self.values = [] if quantiles and not large else None
+        self.digest = TDigest() if quantiles and large else None
+        self.counts = pd.Series(dtype=np.float64) if mode else None
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._min = np.inf
+        self._max = -np.inf
+
+    def update(self, series):
+        """Add a chunk of the column's values."""
+        if not self.numeric:
+            if self.counts is not None:
+                self.counts = self.counts.add(series.value_counts(), fill_value=0)
+            return
+
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        present = values[~np.isnan(values)]
+        if not len(present):
+            return
+        if self.counts is not None:
+            self.counts = self.counts.add(pd.Series(present).value_counts(), fill_value=0)
+        if self.values is not None:
+            self.values.append(present)
+        if self.digest is not None:
+            self.digest.update(present[np.isfinite(present)])
+
+        # Merge the chunk's mean and squared deviations into the running ones (Chan et al.)
+        mean = present.mean()
+        total = self.count + len(present)
+        delta = mean - self._mean
+        self._m2 += ((present - mean) ** 2).sum() + delta ** 2 * self.count * len(present) / total
+        self._mean += delta * len(present) / total
+        self.count = total
+        self._min = min(self._min, present.min())
+        self._max = max(self._max, present.max())
+
+    def mean(self):
+        return self._mean if self.count else np.nan
+
+    def std(self):
+        return np.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    def min(self):
+        return self._min if self.count else np.nan
+
+    def max(self):
+        return self._max if self.count else np.nan
+
+    def max_abs(self):
+        return max(abs(self._min), abs(self._max)) if self.count else np.nan
+
+    def median(self):
+        return self.quantiles([0.5])[0]
+
+    def mode(self):
+        counts = self.counts[self.counts > 0]
+        if counts.empty:
+            return np.nan
+        # The smallest of the most frequent values, as Series.mode().iloc[0]
+        return counts[counts == counts.max()].sort_index().index[0]
+
+    def quantiles(self, qs):
+        if self.sketches is not None:
+            return [float(value) for value in self.sketches.quantiles(self.column, qs)]
+        if self.values is not None:
+            self.values = [np.concatenate(self.values)] if self.values else []
+            return _buffer_quantiles(self.values[0] if self.values else np.empty(0), qs, self.column)
+        return [float(value) for value in self.digest.quantile(np.asarray(qs, dtype=np.float64))]
+
+    @property
+    def nbytes(self):
+        """Memory held by the kept values and value counts, for the query cache's byte budget."""
+        nbytes = sum(values.nbytes for values in self.values) if self.values is not None else 0
+        return nbytes + (int(self.counts.memory_usage(deep=True)) if self.counts is not None else 0)
+
+
+def summary_needs(operation, params):
+    """``(quantiles, mode)`` an operation needs from the first pass, or None when it needs no pass."""
+    action = params.get('action')
+    method = params.get('method')
+    if operation == 'missing-values':
+        action = action or 'fill-mean'
+        if action not in ('fill-mean', 'fill-median', 'fill-mode'):
+            return None
+        return action == 'fill-median', action == 'fill-mode'
+    if operation == 'outliers':
+        return (method or 'iqr') in ('iqr', 'percentile'), False
+    if operation == 'normalize':
+        return method == 'robust', False
+    return None
+
+
+def _column_chunks(table, column, chunk_rows):
+    """One-column DataFrames of up to ``chunk_rows`` rows of a memory-mapped table."""
+    for offset in range(0, table.num_rows, chunk_rows):
+        yield table.slice(offset, chunk_rows).select([column]).to_pandas()
+
+
+def _datetime_format(table, column, chunk_rows):
+    """The format ``pd.to_datetime`` would use for a whole text column.
+
+    pandas guesses it from the first value that is not missing and parses
+    every value on its own (``'mixed'``) when it cannot; chunks parsed
+    separately would each guess from their own first value.
+    """
+    for chunk in _column_chunks(table, column, chunk_rows):
+        values = chunk[column].dropna()
+        values = values[values != '']
+        if len(values):
+            first = values.iloc[0]
+            return (guess_datetime_format(first) if isinstance(first, str) else None) or 'mixed'
+    return None
+
+
+def _chunk_cleaner(operation, column, params, numeric, summary, datetime_format=None):
+    """Function that cleans one chunk in place with the column's global ``summary`` and returns its stats."""
+    if operation in ('outliers', 'normalize') and not numeric:
+        return lambda chunk: {'error': 'Column is not numeric'}
+
+    if numeric and _is_numeric_step({'operation': operation, 'params': params}):
+        kernel = NUMERIC_KERNELS[operation]
+
+        def clean(chunk):
+            values = chunk[column].to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                stats = kernel(values, params, summary)
+            chunk[column] = numeric_result(chunk[column], values, keep_dtype=operation != 'normalize')
+            return stats
+        return clean
+
+    if operation == 'outliers':
+        # ``mark`` and ``remove``; ``cap`` ran through the kernel above
+        bounds = outlier_bounds(params, summary)
+        if bounds is None:
+            return lambda chunk: {'error': f'Unknown outlier method: {params.get("method")}'}
+
+        def clean(chunk):
+            outliers = (chunk[column] < bounds[0]) | (chunk[column] > bounds[1])
+            count = int(outliers.sum())
+            if params.get('action') == 'remove':
+                chunk.drop(chunk[outliers].index, inplace=True)
+                return {'outliers_found': count, 'outliers_removed': count}
+            chunk[f'{column}_is_outlier'] = outliers
+            return {'outliers_found': count, 'outliers_marked': count}
+        return clean
+
+    if operation == 'missing-values' and summary is not None and summary.counts is not None:
+        # ``fill-mode`` of a text column fills with the mode of the whole column
+        mode = summary.mode()
+
+        def clean(chunk):
+            stats = {'missing_filled': int(chunk[column].isnull().sum())}
+            if not pd.isna(mode):
+                chunk[column] = _fillna(chunk[column], mode)
+            return stats
+        return clean
+
+    if operation == 'data-type' and datetime_format is not None:
+        return lambda chunk: convert_data_type(chunk, column, params, datetime_format)
+
+    # Type conversions, text cleaning and constant fills need nothing but the chunk's own rows
+    return lambda chunk: apply_cleaning_operation(chunk, column, operation, params)
+
+
+def _column_dtype(table, column):
+    return table.slice(0, 0).to_pandas()[column].dtype
+
+
+def _is_numeric(dtype):
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+
+
+def summarize_column(table, column, operation, params, sketches=None):
+    """``StreamSummary`` of what ``operation`` needs from the whole ``column`` of a stored ``table``.
+
+    None when the operation needs no statistics of the column. ``sketches``
+    are the version's ingest sketches.
+    """
+    dtype = _column_dtype(table, column)
+    needs = summary_needs(operation, params)
+    # Text columns only need a pass for the mode
+    if needs is None or not (_is_numeric(dtype) or needs[1]):
+        return None
+    quantiles, mode = needs
+    summary = StreamSummary(column, _is_numeric(dtype), sketches, quantiles, mode, rows=table.num_rows)
+    for chunk in _column_chunks(table, column, get_chunk_rows()):
+        summary.update(chunk[column])
+    return summary
+
+
+def column_cleaner(table, column, operation, params, summary):
+    """Function that cleans any rows of a stored ``table`` in place as cleaning all of it would.
+
+    ``summary`` is the column's ``summarize_column``; the function returns
+    the stats of the rows it was given.
+    """
+    dtype = _column_dtype(table, column)
+    datetime_format = None
+    if operation == 'data-type' and params.get('target_type') == 'datetime' and pd.api.types.is_string_dtype(dtype):
+        datetime_format = _datetime_format(table, column, get_chunk_rows())
+    return _chunk_cleaner(operation, column, params, _is_numeric(dtype), summary, datetime_format)
+
+
+def _merge_stats(total, stats):
+    """Fold one chunk's stats into ``total``: counts add up, ``new_min``/``new_max`` widen, the rest is kept."""
+    for key, value in stats.items():
+        if key not in total or total[key] is None:
+            total[key] = value
+        elif value is None:
+            continue
+        elif key == 'new_min':
+            total[key] = min(total[key], value)
+        elif key == 'new_max':
+            total[key] = max(total[key], value)
+        elif isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_)):
+            total[key] += value
+
+
+class _ChunkFailed(Exception):
+    """A chunk's stats carried an error; the version being written is discarded."""
+
+    def __init__(self, stats):
+        super().__init__(stats['error'])
+        self.stats = stats
+
+
+def clean_dataset_in_chunks(dataset_id, manifest, column, operation, params):
+    """Apply one cleaning operation to a stored version chunk by chunk and store the result.
+
+    Only the cleaned column is read, through the memory map, and at most
+    ``CLEANING_CHUNK_ROWS`` rows of it are in memory at a time. Returns
+    ``(stats, new_manifest)`` like ``clean_dataset``; ``new_manifest`` is
+    None when the operation failed and nothing was written.
+    """
+    table = read_dataset_table(dataset_id, manifest, [column])
+    summary = summarize_column(table, column, operation, params, get_column_sketches(dataset_id, manifest))
+    clean = column_cleaner(table, column, operation, params, summary)
+    written = sorted(changed_columns(operation, column, params))
+    stats = {}
+
+    def cleaned_chunks():
+        for chunk in _column_chunks(table, column, get_chunk_rows()):
+            chunk_stats = clean(chunk)
+            if 'error' in chunk_stats:
+                raise _ChunkFailed(chunk_stats)
+            _merge_stats(stats, chunk_stats)
+            yield chunk[written]
+
+    try:
+        new_manifest = write_column_chunks(
+            dataset_id, manifest, cleaned_chunks(), label=describe_operation(operation, column, params),
+        )
+    except _ChunkFailed as failed:
+        return failed.stats, None
+
+    if 'new_type' in stats:
+        # Chunks may have converted to different types; the stored one holds them all
+        stats['new_type'] = new_manifest['data_types'][column]
+    return stats, new_manifest
+
+
+def _should_clean_in_chunks(dataset_id, manifest, column, operation, params):
+    if not can_clean_in_chunks(operation, column, params):
+        return False
+    # The Arrow size of the memory-mapped version, without reading any values
+    return read_dataset_table(dataset_id, manifest).nbytes > get_in_memory_max_bytes()
+
+
+def validate_operation(manifest, column, operation):
+    """Raise ``ValueError`` for an unknown operation or a column the version does not have."""
+    if operation not in OPERATIONS:
+        raise ValueError(f'operation must be one of {", ".join(OPERATIONS)}')
+    if column not in manifest['columns']:
+        raise ValueError(f'Unknown column: {column}')
+
+
+def _check_version(manifest, expected_version):
+    if expected_version is not None and expected_version != manifest['version']:
+        raise StaleVersionError(
+            f'Version {expected_version} is no longer current (now {manifest["version"]}); reload the dataset'
+        )
+
+
+def _load_frame(dataset_id, manifest):
+    df = get_dataframe_cache().get((dataset_id, manifest['version']))
+    # Cached frames are shared; with copy-on-write a shallow copy keeps them untouched
+    return read_dataset(dataset_id, manifest) if df is None else df.copy(deep=False)
+
+
+def _store_frame(dataset_id, df, base, changed, label):
+    # Versions never change once written, so cached frames of earlier versions stay valid for undo
+    return write_dataset(dataset_id, df, base=base, changed_columns=changed, label=label)
+
+
+def clean_dataset(dataset_id, manifest, column, operation, params, expected_version=None):
+    """Apply one cleaning operation to a stored dataset version and store the result.
+
+    Returns ``(stats, new_manifest, preview)``; ``new_manifest`` is None when
+    the operation failed (``stats['error']``) and nothing was written.
+    Raises ``StaleVersionError`` when ``expected_version`` is not the
+    current version and ``ValueError`` for an unknown column or operation.
+    """
+    validate_operation(manifest, column, operation)
+    _check_version(manifest, expected_version)
+
+    if _should_clean_in_chunks(dataset_id, manifest, column, operation, params):
+        stats, new_manifest = clean_dataset_in_chunks(dataset_id, manifest, column, operation, params)
+        return stats, new_manifest, read_dataset_rows(dataset_id, new_manifest or manifest, 0, PREVIEW_ROWS)
+
+    df = _load_frame(dataset_id, manifest)
+    stats = apply_cleaning_operation(
+        df, column, operation, params,
+        get_column_sketches(dataset_id, manifest), partial(get_row_fingerprints, dataset_id, manifest),
+    )
+    if 'error' in stats:
+        return stats, None, df.head(PREVIEW_ROWS)
+
+    new_manifest = _store_frame(
+        dataset_id, df, manifest, changed_columns(operation, column, params), describe_operation(operation, column, params),
+    )
+    return stats, new_manifest, df.head(PREVIEW_ROWS)
+
+
+def clean_dataset_with_plan(dataset_id, manifest, plan, expected_version=None):
+    """Run a ``build_plan`` plan against a stored dataset version and store the result once.
+
+    Returns ``(results, new_manifest, preview)`` like ``clean_dataset``;
+    nothing is written if any step fails.
+    """
+    _check_version(manifest, expected_version)
+
+    df = _load_frame(dataset_id, manifest)
+    results = execute_plan(
+        df, plan, get_column_sketches(dataset_id, manifest), partial(get_row_fingerprints, dataset_id, manifest),
+    )
+    if not results or 'error' in results[-1]['stats']:
+        return results, None, df.head(PREVIEW_ROWS)
+
+    changed = set()
+    for stage in plan:
+        for step in stage['steps']:
+            step_changed = changed_columns(step['operation'], step['column'], step['params'])
+            changed = None if changed is None or step_changed is None else changed | step_changed
+    label = ', '.join(
+        describe_operation(step['operation'], step['column'], step['params']) for stage in plan for step in stage['steps']
+    )
+    return results, _store_frame(dataset_id, df, manifest, changed, label), df.head(PREVIEW_ROWS)
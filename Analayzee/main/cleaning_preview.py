@@ -0,0 +1,218 @@
+"""Previews of cleaning operations on a stratified sample of the stored dataset.
+
+A preview cleans a few thousand rows kept in the worker's query cache
+instead of the whole frame, and writes nothing. Fill values, outlier bounds
+and normalization ranges still come from the whole column: the sample goes
+through the ``column_cleaner`` out-of-core cleaning uses, with a
+``StreamSummary`` of the column cached beside the sample, so each sampled
+row comes out as applying the step would leave it. The sample is
+stratified on the cleaned column:
+
+* rows with a value are spread over the whole file, one random row from
+  each of ``CLEANING_PREVIEW_SAMPLE_ROWS`` equal stretches of them;
+* rows missing the value are sampled on their own (up to a fifth of the
+  sample), so fills and drops show up even when missing values are rare.
+
+Counts in the returned stats are scaled up to the full dataset by the
+sampling rate of the rows they were counted on; counts the manifest or the
+ingest sketches already know (missing values, distinct values) are taken
+from there instead.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+from django.conf import settings
+
+from accounts.dataset_cache import get_query_cache
+from accounts.dataset_store import get_column_sketches, read_dataset_sample, read_dataset_table
+
+from .cleaning import (
+    PREVIEW_ROWS, changed_columns, column_cleaner, duplicate_subset, summarize_column, summary_needs,
+    validate_operation,
+)
+
+# Fixed seed: previews of one version always use the same rows
+SAMPLE_SEED = 0
+# Outlier counts only ever include rows with a value, so they scale with that stratum
+PRESENT_COUNTS = ('outliers_found', 'outliers_capped', 'outliers_removed', 'outliers_marked')
+# Duplicate counts do not grow linearly with the sample; they are only estimated from sketches
+DUPLICATE_COUNTS = ('duplicates_removed', 'rows_remaining', 'duplicates_marked', 'duplicate_count')
+
+
+def get_sample_rows():
+    return getattr(settings, 'CLEANING_PREVIEW_SAMPLE_ROWS', 5000)
+
+
+class CleaningSample:
+    """Rows of one dataset version sampled for previews of one column."""
+
+    def __init__(self, frame, present_rows, missing_rows):
+        self.frame = frame
+        # Rows of the whole version with and without a value in the column
+        self.present_rows = present_rows
+        self.missing_rows = missing_rows
+        self.nbytes = int(frame.memory_usage(deep=True).sum())
+
+
+def stratified_positions(count, size, rng):
+    """One random position out of each of ``size`` equal stretches of ``range(count)``, ascending."""
+    if size >= count:
+        return np.arange(count)
+    edges = np.arange(size + 1) * count // size
+    return edges[:-1] + (rng.random(size) * (edges[1:] - edges[:-1])).astype(np.intp)
+
+
+def _sample_positions(dataset_id, manifest, column, size):
+    """Sampled row positions and the number of rows with and without a value in ``column``."""
+    rng = np.random.default_rng(SAMPLE_SEED)
+    total = manifest['rows']
+    missing = manifest['missing_values'].get(column, 0)
+    if not missing or total <= size:
+        return stratified_positions(total, size, rng), total - missing, missing
+
+    # Only the validity bitmap (and NaNs of float columns) of one column is read
+    values = read_dataset_table(dataset_id, manifest, [column]).column(column)
+    is_missing = pc.is_null(values, nan_is_null=True).to_numpy(zero_copy_only=False)
+    missing_positions = np.flatnonzero(is_missing)
+    present_positions = np.flatnonzero(~is_missing)
+
+    missing_size = min(len(missing_positions), size // 5)
+    positions = np.concatenate([
+        present_positions[stratified_positions(len(present_positions), size - missing_size, rng)],
+        missing_positions[stratified_positions(len(missing_positions), missing_size, rng)],
+    ])
+    return np.sort(positions), len(present_positions), len(missing_positions)
+
+
+def get_cleaning_sample(dataset_id, manifest, column):
+    """The ``CleaningSample`` of a dataset version for ``column``, cached per worker."""
+    cache = get_query_cache()
+    size = get_sample_rows()
+    key = (dataset_id, manifest['version'], 'cleaning_sample', column, size)
+    sample = cache.get(key)
+    if sample is None:
+        positions, present_rows, missing_rows = _sample_positions(dataset_id, manifest, column, size)
+        frame = read_dataset_sample(dataset_id, manifest, positions)
+        sample = CleaningSample(frame, present_rows, missing_rows)
+        cache.put(key, sample)
+    return sample
+
+
+def get_column_summary(dataset_id, manifest, table, column, operation, params):
+    """``summarize_column`` of a dataset version for ``operation``, cached per worker."""
+    needs = summary_needs(operation, params)
+    if needs is None:
+        return None
+    cache = get_query_cache()
+    key = (dataset_id, manifest['version'], 'cleaning_summary', column, needs)
+    summary = cache.get(key)
+    if summary is None:
+        summary = summarize_column(table, column, operation, params, get_column_sketches(dataset_id, manifest))
+        if summary is not None:
+            cache.put(key, summary)
+    return summary
+
+
+def _estimate_duplicates(manifest, params, sketches):
+    """Duplicates ``remove`` would drop from the whole dataset, when one column is compared.
+
+    Every distinct value (and the missing value, if any) keeps one row; the
+    distinct count comes from the column's HyperLogLog sketch.
+    """
+    subset = duplicate_subset(params)
+    if (params.get('action', 'remove') != 'remove' or params.get('keep', 'first') == 'none'
+            or subset is None or len(subset) != 1 or sketches is None):
+        return {}
+    distinct = sketches.distinct(subset[0])
+    if distinct is None:
+        return {}
+    kept = min(manifest['rows'], distinct + (1 if manifest['missing_values'].get(subset[0]) else 0))
+    return {'duplicates_removed': manifest['rows'] - kept, 'rows_remaining': kept}
+
+
+def extrapolate_stats(stats, operation, sample, column, manifest, params, sketches=None):
+    """Estimates of an operation's stats on the whole dataset from its stats on ``sample``."""
+    if len(sample.frame) == manifest['rows']:
+        # Small datasets are sampled whole; their stats are exact
+        return dict(stats)
+    estimated = {key: value for key, value in stats.items() if key not in DUPLICATE_COUNTS}
+    if operation == 'missing-values':
+        # The manifest records the exact count
+        for key in ('missing_filled', 'rows_dropped'):
+            if key in estimated:
+                estimated[key] = sample.missing_rows
+    elif operation == 'text-cleaning':
+        estimated['rows_processed'] = manifest['rows']
+    elif operation == 'duplicates':
+        estimated.update(_estimate_duplicates(manifest, params, sketches))
+
+    sampled_present = int(sample.frame[column].notna().sum())
+    if sampled_present:
+        scale = sample.present_rows / sampled_present
+        for key in PRESENT_COUNTS:
+            if key in estimated:
+                estimated[key] = int(round(int(estimated[key]) * scale))
+    return estimated
+
+
+def _shown_column(operation, column, params):
+    """The column whose values a preview compares: the one added by a ``mark`` action, else ``column``."""
+    changed = changed_columns(operation, column, params)
+    if changed and column not in changed:
+        return next(iter(changed))
+    return column
+
+
+def compare_rows(before, after, column, limit=PREVIEW_ROWS):
+    """Before and after values of ``column`` for up to ``limit`` sampled rows, changed rows first."""
+    new = after[column].astype(object).reindex(before.index)
+    removed = ~before.index.isin(after.index)
+    if column in before:
+        old = before[column].astype(object)
+        same = (old == new) | (old.isna() & new.isna())
+    else:
+        # A flag column added by a ``mark`` action: the rows it flags are the changed ones
+        old = pd.Series(None, index=before.index, dtype=object)
+        same = ~new.fillna(False).astype(bool)
+    status = np.select([removed, ~same.to_numpy()], ['removed', 'modified'], 'unchanged')
+
+    order = np.argsort(status == 'unchanged', kind='stable')[:limit]
+    rows = pd.DataFrame({
+        'row': before.index.to_numpy()[order],
+        'before': old.to_numpy()[order],
+        'after': new.to_numpy()[order],
+        'status': status[order],
+    })
+    return rows, int((status != 'unchanged').sum())
+
+
+def preview_cleaning(dataset_id, manifest, column, operation, params):
+    """Run a cleaning operation on the sample of a dataset version without storing anything.
+
+    Returns a dict with ``stats`` (estimated for the whole dataset),
+    ``sample_stats``, ``sample_rows``, ``changed_rows`` (in the sample) and
+    ``rows`` (``compare_rows`` records); ``stats['error']`` is set when the
+    operation fails. Raises ``ValueError`` for an unknown column or operation.
+    """
+    validate_operation(manifest, column, operation)
+    sample = get_cleaning_sample(dataset_id, manifest, column)
+    sketches = get_column_sketches(dataset_id, manifest)
+    table = read_dataset_table(dataset_id, manifest, [column])
+    summary = get_column_summary(dataset_id, manifest, table, column, operation, params)
+
+    # The cached frame is shared; with copy-on-write a shallow copy keeps it untouched
+    df = sample.frame.copy(deep=False)
+    sample_stats = column_cleaner(table, column, operation, params, summary)(df)
+    if 'error' in sample_stats:
+        return {'stats': sample_stats, 'sample_stats': sample_stats, 'sample_rows': len(sample.frame)}
+
+    shown = _shown_column(operation, column, params)
+    rows, changed = compare_rows(sample.frame, df, shown)
+    return {
+        'stats': extrapolate_stats(sample_stats, operation, sample, column, manifest, params, sketches),
+        'sample_stats': sample_stats,
+        'sample_rows': len(sample.frame),
+        'column': shown,
+        'changed_rows': changed,
+        'rows': rows,
+    }
@@ -0,0 +1,235 @@
+"""Pearson and Spearman correlation matrices of a stored dataset.
+
+The numeric columns are stacked into one float block and every pairwise
+sum the Pearson formula needs (counts, sums, sums of squares, cross
+products) comes out of a handful of matrix products over that block and
+its missing-value mask. A pair of columns is therefore only compared over
+the rows where both have a value, without looping over pairs.
+
+Spearman is Pearson over average ranks. Columns without missing values are
+ranked once over all rows; a pair involving a column with missing values is
+ranked within the rows the pair shares, like ``DataFrame.corr`` does. Pairs
+sharing the same rows are ranked together, so the extra work grows with the
+number of distinct missing-value patterns rather than the number of pairs.
+
+Matrices are computed once per dataset version and method, stored beside
+the version as ``v{n}.correlation-*.npz`` and kept in the worker's
+query cache.
+"""
+import io
+import logging
+
+import numpy as np
+import pandas as pd
+
+from accounts.dataset_cache import get_dataframe_cache, get_query_cache
+from accounts.dataset_store import read_dataset, read_version_artifact, write_version_artifact
+
+from .profiling import is_numeric_column
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('pearson', 'spearman')
+# Spearman matrices stored before pairs were ranked over their shared rows are not reused
+ARTIFACT_NAMES = {'pearson': 'correlation-pearson.npz', 'spearman': 'correlation-spearman-pairwise.npz'}
+# Pairs sharing fewer rows than this get no coefficient
+MIN_PERIODS = 2
+
+
+class CorrelationMatrix:
+    """Coefficients and shared-row counts for every pair of numeric columns."""
+
+    def __init__(self, columns, values, counts):
+        self.columns = list(columns)
+        self.values = values
+        self.counts = counts
+        self.nbytes = int(values.nbytes + counts.nbytes)
+
+    def subset(self, columns):
+        positions = [self.columns.index(column) for column in columns]
+        return CorrelationMatrix(columns, self.values[np.ix_(positions, positions)], self.counts[np.ix_(positions, positions)])
+
+    def to_dict(self):
+        """``{column: {column: r}}``; missing coefficients are None."""
+        values = self.values.astype(object)
+        values[np.isnan(self.values)] = None
+        return {column: dict(zip(self.columns, row)) for column, row in zip(self.columns, values.tolist())}
+
+    def top_pairs(self, limit=None, min_abs=0.0):
+        """Distinct pairs ordered by ``|r|``, strongest first."""
+        upper_i, upper_j = np.triu_indices(len(self.columns), k=1)
+        r = self.values[upper_i, upper_j]
+        strength = np.abs(r)
+        keep = ~np.isnan(r) & (strength >= min_abs)
+        upper_i, upper_j, r, strength = upper_i[keep], upper_j[keep], r[keep], strength[keep]
+
+        order = np.argsort(-strength, kind='stable')
+        if limit is not None:
+            order = order[:limit]
+        return [
+            {
+                'x': self.columns[upper_i[k]],
+                'y': self.columns[upper_j[k]],
+                'r': float(r[k]),
+                'n': int(self.counts[upper_i[k], upper_j[k]]),
+            }
+            for k in order
+        ]
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez(buffer, columns=np.array(self.columns, dtype=str), values=self.values, counts=self.counts)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        with np.load(io.BytesIO(data)) as arrays:
+            return cls(arrays['columns'].tolist(), arrays['values'], arrays['counts'])
+
+
+def pairwise_pearson(block):
+    """Pearson matrix of the columns of a 2-D float array, NaN meaning missing.
+
+    Returns ``(r, counts)`` where ``counts[i, j]`` is the number of rows
+    where both columns have a value.
+    """
+    present = ~np.isnan(block)
+    if present.all():
+        counts = np.full((block.shape[1],) * 2, block.shape[0], dtype=np.int64)
+        centered = block - block.mean(axis=0)
+        cross = centered.T @ centered
+        with np.errstate(divide='ignore', invalid='ignore'):
+            norms = np.sqrt(np.diag(cross))
+            r = cross / np.outer(norms, norms)
+    else:
+        mask = present.astype(np.float64)
+        # Centering on the column means keeps the sums small, so the subtraction below stays accurate
+        filled = np.where(present, block - np.nanmean(block, axis=0), 0.0)
+        counts = (mask.T @ mask).round().astype(np.int64)
+        sums = filled.T @ mask                 # sums[i, j]: column i over rows where j is present too
+        squares = (filled * filled).T @ mask
+        cross = filled.T @ filled
+        with np.errstate(divide='ignore', invalid='ignore'):
+            covariance = cross - sums * sums.T / counts
+            variance_x = squares - sums * sums / counts
+            variance_y = variance_x.T
+            r = covariance / np.sqrt(variance_x * variance_y)
+
+    r[counts < MIN_PERIODS] = np.nan
+    np.clip(r, -1.0, 1.0, out=r)
+    # Rounding can leave the diagonal a hair off 1; constant columns stay NaN
+    np.fill_diagonal(r, np.where(np.isnan(np.diag(r)), np.nan, 1.0))
+    return r, counts
+
+
+def _rank(block):
+    """Average ranks of each column of a 2-D float array; NaN stays NaN."""
+    return pd.DataFrame(block, copy=False).rank(method='average').to_numpy(dtype=np.float64)
+
+
+class _SubsetRanker:
+    """Average ranks of one column within any subset of its rows, from a single sort."""
+
+    def __init__(self, values):
+        # NaN sorts last and is never inside a subset
+        order = np.argsort(values, kind='stable')
+        ordered = values[order]
+        self.order = order.astype(np.int32)
+        self.groups = (np.cumsum(np.r_[True, ordered[1:] != ordered[:-1]]) - 1).astype(np.int32)
+
+    def ranks(self, rows):
+        """Ranks of the values on the rows where ``rows`` is True, in row order."""
+        members = rows[self.order]
+        sizes = np.bincount(self.groups, weights=members)
+        before = np.cumsum(sizes) - sizes
+        ranks = np.empty(len(rows))
+        ranks[self.order] = before[self.groups] + (sizes[self.groups] + 1) / 2
+        return ranks[rows]
+
+
+def pairwise_spearman(block):
+    """Spearman matrix of the columns of a 2-D float array, NaN meaning missing.
+
+    Returns ``(r, counts)`` like ``pairwise_pearson``; each pair is ranked
+    over the rows where both columns have a value.
+    """
+    present = ~np.isnan(block)
+    r, counts = pairwise_pearson(_rank(block))
+
+    incomplete = np.flatnonzero(~present.all(axis=0))
+    if not len(incomplete):
+        return r, counts
+    rankers = [_SubsetRanker(block[:, column]) for column in range(block.shape[1])]
+    done = set()
+    for i in incomplete:
+        done.add(i)
+        groups = {}
+        for j in range(block.shape[1]):
+            if j in done:
+                continue
+            shared = present[:, i] & present[:, j]
+            groups.setdefault(shared.tobytes(), (shared, []))[1].append(j)
+        for shared, others in groups.values():
+            if np.count_nonzero(shared) < MIN_PERIODS:
+                # Already NaN: too few shared rows
+                continue
+            ranks = np.column_stack([rankers[column].ranks(shared) for column in (i, *others)])
+            pair_r, _ = pairwise_pearson(ranks)
+            r[i, others] = r[others, i] = pair_r[0, 1:]
+    return r, counts
+
+
+def correlation_matrix(df, method='pearson'):
+    """``CorrelationMatrix`` over the numeric columns of ``df``."""
+    columns = [column for column in df.columns if is_numeric_column(df[column])]
+    if not columns:
+        return CorrelationMatrix([], np.empty((0, 0)), np.empty((0, 0), dtype=np.int64))
+
+    block = df[columns].to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+    # Infinite values would poison every sum of their column; treat them as missing, as pandas does
+    block[~np.isfinite(block)] = np.nan
+
+    r, counts = (pairwise_spearman if method == 'spearman' else pairwise_pearson)(block)
+    return CorrelationMatrix([str(column) for column in columns], r, counts)
+
+
+def _numeric_columns(manifest):
+    columns = []
+    for column in manifest['columns']:
+        try:
+            dtype = pd.api.types.pandas_dtype(manifest['data_types'][column])
+        except TypeError:
+            continue
+        if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+            columns.append(column)
+    return columns
+
+
+def get_correlation_matrix(dataset_id, manifest, method='pearson'):
+    """The ``CorrelationMatrix`` of a dataset version, computed once per version and method."""
+    if method not in METHODS:
+        raise ValueError(f'method must be one of {", ".join(METHODS)}')
+
+    cache = get_query_cache()
+    key = (dataset_id, manifest['version'], 'correlation', method)
+    matrix = cache.get(key)
+    if matrix is not None:
+        return matrix
+
+    artifact = ARTIFACT_NAMES[method]
+    data = read_version_artifact(dataset_id, manifest, artifact)
+    if data is not None:
+        matrix = CorrelationMatrix.from_bytes(data)
+    else:
+        df = get_dataframe_cache().get(key[:2])
+        if df is None:
+            # Only the numeric columns are paged in
+            df = read_dataset(dataset_id, manifest, columns=_numeric_columns(manifest))
+        matrix = correlation_matrix(df, method)
+        try:
+            write_version_artifact(dataset_id, manifest, artifact, matrix.to_bytes())
+        except OSError:
+            logger.warning('Could not store the %s correlation of %s v%s', method, dataset_id, manifest['version'])
+
+    cache.put(key, matrix)
+    return matrix
@@ -0,0 +1,182 @@
+"""Downsampling of line and scatter chart series to a target point count.
+
+* Line series use Largest-Triangle-Three-Buckets (Steinarsson): the first
+  and last points are kept and every bucket in between keeps the point
+  that forms the largest triangle with the point kept before it and the
+  mean of the next bucket, so peaks and troughs survive.
+* Scatter series are sampled per cell of a grid laid over the plot: every
+  occupied cell keeps up to the same number of randomly chosen points, so
+  sparse regions and outliers stay visible while dense regions are
+  thinned. Each kept point carries the number of rows it stands for.
+
+Results are encoded once per dataset version and request and kept in the
+worker's query cache.
+"""
+import math
+
+import numpy as np
+from django.conf import settings
+
+from accounts.dataset_cache import get_query_cache
+
+from .profiling import is_numeric_column
+from .serializers import dumps
+
+CHART_TYPES = ('line', 'scatter')
+DEFAULT_POINTS = 2000
+# Fixed seed: the same request always samples the same points
+SAMPLE_SEED = 0
+
+
+def get_max_points():
+    return getattr(settings, 'CHART_MAX_POINTS', 10000)
+
+
+def lttb(x, y, threshold):
+    """Positions of the ``threshold`` points LTTB keeps of a series sorted by ``x``."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Bucket edges over the points between the first and the last, in integers:
+    # flooring a float linspace can put an edge one point off
+    edges = np.arange(threshold - 1, dtype=np.int64) * (n - 2) // (threshold - 2) + 1
+    starts, ends = edges[:-1], edges[1:]
+    sizes = ends - starts
+    # Mean of every bucket in one pass; the last point is the "next bucket" of the last bucket
+    mean_x = np.append(np.add.reduceat(x[:-1], starts) / sizes, x[-1])
+    mean_y = np.append(np.add.reduceat(y[:-1], starts) / sizes, y[-1])
+
+    selected = np.empty(threshold, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for bucket, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        ax, ay = x[a], y[a]
+        cx, cy = mean_x[bucket + 1], mean_y[bucket + 1]
+        # Twice the triangle area; the constant factor does not change the argmax
+        area = np.abs((ax - cx) * (y[start:end] - ay) - (ax - x[start:end]) * (cy - ay))
+        a = start + int(area.argmax())
+        selected[bucket + 1] = a
+    return selected
+
+
+def _cell_cap(counts, target):
+    """Largest per-cell quota that keeps the total at most ``target`` (at least one per cell)."""
+    low, high = 1, int(counts.max())
+    while low < high:
+        middle = (low + high + 1) // 2
+        if np.minimum(counts, middle).sum() <= target:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def grid_sample(x, y, target, seed=SAMPLE_SEED):
+    """Positions of about ``target`` points spread over a grid, and the rows each one stands for."""
+    n = len(x)
+    if target >= n:
+        return np.arange(n), np.ones(n)
+
+    side = max(1, math.isqrt(target))
+    cells = np.zeros(n, dtype=np.intp)
+    for values in (x, y):
+        low, high = values.min(), values.max()
+        span = high - low
+        column = np.zeros(n, dtype=np.intp)
+        if span:
+            column = np.minimum(((values - low) / span * side).astype(np.intp), side - 1)
+        cells = cells * side + column
+
+    counts = np.bincount(cells, minlength=side * side)
+    cap = _cell_cap(counts[counts > 0], target)
+
+    # Shuffle, then group by cell: a point's rank within its cell decides whether it is kept
+    shuffled = np.random.default_rng(seed).permutation(n)
+    order = shuffled[np.argsort(cells[shuffled], kind='stable')]
+    sorted_cells = cells[order]
+    rank = np.arange(n) - np.searchsorted(sorted_cells, sorted_cells, side='left')
+    keep = np.sort(order[rank < cap])
+
+    cell_counts = counts[cells[keep]]
+    return keep, cell_counts / np.minimum(cell_counts, cap)
+
+
+def _finite(values):
+    return values.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def line_series(x, y, points):
+    """A line chart's series: sorted by ``x`` when it is numeric, in row order with labels otherwise."""
+    if not is_numeric_column(y):
+        raise ValueError(f'Column {y.name} is not numeric')
+    y_values = _finite(y)
+    if is_numeric_column(x):
+        x_values = _finite(x)
+        valid = np.isfinite(x_values) & np.isfinite(y_values)
+        order = np.argsort(x_values[valid], kind='stable')
+        x_values, y_values = x_values[valid][order], y_values[valid][order]
+        labels = None
+    else:
+        valid = np.isfinite(y_values)
+        y_values = y_values[valid]
+        x_values = np.arange(len(y_values), dtype=np.float64)
+        labels = x[valid].astype(object).where(x[valid].notna(), 'Unknown').astype(str).to_numpy()
+
+    keep = lttb(x_values, y_values, points)
+    data = {'y': y_values[keep].tolist()}
+    if labels is None:
+        data['x'] = x_values[keep].tolist()
+    else:
+        data['labels'] = labels[keep].tolist()
+    return {'total_points': len(y_values), 'returned_points': len(keep), 'numeric_x': labels is None, 'data': data}
+
+
+def scatter_series(x, y, points):
+    """A scatter chart's points, grid-sampled to about ``points``."""
+    for series in (x, y):
+        if not is_numeric_column(series):
+            raise ValueError(f'Column {series.name} is not numeric')
+    x_values, y_values = _finite(x), _finite(y)
+    valid = np.isfinite(x_values) & np.isfinite(y_values)
+    x_values, y_values = x_values[valid], y_values[valid]
+
+    keep, weights = grid_sample(x_values, y_values, points)
+    return {
+        'total_points': len(x_values),
+        'returned_points': len(keep),
+        'numeric_x': True,
+        'data': {'x': x_values[keep].tolist(), 'y': y_values[keep].tolist(), 'weight': weights.tolist()},
+    }
+
+
+def chart_series(df, chart_type, x, y, points=DEFAULT_POINTS):
+    """The downsampled series a ``line`` or ``scatter`` chart of ``df[x]`` and ``df[y]`` plots."""
+    if chart_type not in CHART_TYPES:
+        raise ValueError(f'chart_type must be one of {", ".join(CHART_TYPES)}')
+    limit = get_max_points()
+    if not 3 <= points <= limit:
+        raise ValueError(f'points must be between 3 and {limit}')
+
+    build = line_series if chart_type == 'line' else scatter_series
+    result = build(df[x], df[y], points)
+    result['downsampled'] = result['returned_points'] < result['total_points']
+    return result
+
+
+def get_chart_series(dataset_key, load_columns, chart_type, x, y, points=DEFAULT_POINTS):
+    """JSON-encoded ``chart_series`` result, cached under ``dataset_key`` (``(dataset_id, version)``).
+
+    ``load_columns(columns)`` returns a frame with the named columns; it is
+    only called on a cache miss.
+    """
+    cache = get_query_cache()
+    key = (*dataset_key, 'chart_series', chart_type, x, y, points)
+    payload = cache.get(key)
+    if payload is None:
+        result = chart_series(load_columns(list(dict.fromkeys((x, y)))), chart_type, x, y, points)
+        payload = dumps({
+            'success': True, 'chart_type': chart_type, 'x': x, 'y': y, 'points': points, **result,
+        }).encode()
+        cache.put(key, payload)
+    return payload
@@ -0,0 +1,242 @@
+"""Parsing of uploaded files into the dataset store."""
+import codecs
+import csv
+import logging
+import time
+
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_ROWS = 50_000
+# pyarrow parses a block per thread, so blocks are sized in bytes rather than rows
+PYARROW_BLOCK_BYTES = 16 * 1024 * 1024
+SNIFF_SAMPLE_BYTES = 64 * 1024
+CSV_ENGINES = ('auto', 'pyarrow', 'c', 'python')
+SNIFF_DELIMITERS = ',\t;|'
+
+
+def get_chunk_rows():
+    """Rows parsed per chunk; bounds the memory an upload can take."""
+    return getattr(settings, 'INGEST_CHUNK_ROWS', DEFAULT_CHUNK_ROWS)
+
+
+def get_csv_engine():
+    """Configured CSV engine, see ``CSV_PARSER_ENGINE``."""
+    engine = getattr(settings, 'CSV_PARSER_ENGINE', 'auto')
+    if engine not in CSV_ENGINES:
+        logger.warning('Unknown CSV_PARSER_ENGINE %r, using auto', engine)
+        return 'auto'
+    return engine
+
+
+def _detect_encoding(raw):
+    if raw.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        raw.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        # The sample may end in the middle of a multi-byte character
+        if e.start >= len(raw) - 3:
+            return 'utf-8'
+    try:
+        raw.decode('cp1252')
+        return 'cp1252'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def _looks_numeric(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def sniff_csv(file, file_name='', sample_bytes=SNIFF_SAMPLE_BYTES):
+    """Guess encoding, delimiter and header presence from the start of ``file``.
+
+    The file position is restored afterwards.
+    """
+    position = file.tell()
+    raw = file.read(sample_bytes)
+    file.seek(position)
+    if isinstance(raw, str):
+        raw = raw.encode('utf-8')
+
+    encoding = _detect_encoding(raw)
+    text = raw.decode(encoding, errors='ignore')
+    lines = text.splitlines()
+    if len(raw) == sample_bytes and len(lines) > 1:
+        # Last line is probably cut off
+        lines = lines[:-1]
+    sample = '\n'.join(lines)
+
+    try:
+        delimiter = csv.Sniffer().sniff(sample, delimiters=SNIFF_DELIMITERS).delimiter
+    except csv.Error:
+        delimiter = '\t' if file_name.lower().endswith('.tsv') else ','
+
+    # csv.Sniffer.has_header is unreliable for all-text tables, so only treat
+    # the file as headerless when its first row is entirely numeric
+    first_row = next(csv.reader(lines[:1], delimiter=delimiter), [])
+    header = not (first_row and all(_looks_numeric(value) for value in first_row))
+
+    return {'encoding': encoding, 'delimiter': delimiter, 'header': header}
+
+
+def read_csv_chunks(file, dialect, engine='c', chunk_rows=None):
+    """Yield ``file`` as chunks: Arrow record batches for pyarrow, DataFrames otherwise."""
+    if engine == 'pyarrow':
+        read_options = pa_csv.ReadOptions(
+            use_threads=True,
+            block_size=PYARROW_BLOCK_BYTES,
+            encoding='utf8' if dialect['encoding'].startswith('utf-8') else dialect['encoding'],
+            autogenerate_column_names=not dialect['header'],
+        )
+        parse_options = pa_csv.ParseOptions(delimiter=dialect['delimiter'])
+        # Empty fields are missing values, as they are for pandas
+        convert_options = pa_csv.ConvertOptions(strings_can_be_null=True)
+        start = file.tell()
+        reader = pa_csv.open_csv(
+            file, read_options=read_options, parse_options=parse_options, convert_options=convert_options,
+        )
+
+        # The C engine leaves dates as text; keep both engines producing the same dtypes
+        temporal = [field.name for field in reader.schema if pa.types.is_temporal(field.type)]
+        if temporal:
+            file.seek(start)
+            convert_options.column_types = {name: pa.string() for name in temporal}
+            reader = pa_csv.open_csv(
+                file, read_options=read_options, parse_options=parse_options, convert_options=convert_options,
+            )
+
+        # Headerless columns are named 0, 1, ... as the C engine names them, rather than pyarrow's f0, f1, ...
+        names = None if dialect['header'] else [str(position) for position in range(len(reader.schema))]
+        for batch in reader:
+            yield batch if names is None else batch.rename_columns(names)
+        return
+
+    with pd.read_csv(
+        file,
+        sep=dialect['delimiter'],
+        encoding=dialect['encoding'],
+        header=0 if dialect['header'] else None,
+        engine=engine,
+        chunksize=chunk_rows or get_chunk_rows(),
+    ) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def ingest_csv(file, write_chunks, file_name=''):
+    """Parse a CSV/TSV upload and pass its chunks to ``write_chunks``.
+
+    ``write_chunks`` is called with an iterable of chunks and must consume it
+    transactionally (e.g. ``set_dataframe_chunks_in_store``), because a file
+    the pyarrow reader rejects part-way through is re-read from the start with
+    the C engine. Returns ``(result_of_write_chunks, metrics)``.
+    """
+    started = time.perf_counter()
+    position = file.tell()
+    dialect = sniff_csv(file, file_name)
+    engine = get_csv_engine()
+    engines = ['pyarrow', 'c'] if engine == 'auto' else [engine]
+
+    for attempt, current_engine in enumerate(engines):
+        file.seek(position)
+        try:
+            result = write_chunks(read_csv_chunks(file, dialect, engine=current_engine))
+            break
+        except pa.ArrowInvalid as e:
+            if attempt == len(engines) - 1:
+                raise
+            logger.info('pyarrow could not parse %s (%s), retrying with the C engine', file_name, e)
+
+    seconds = time.perf_counter() - started
+    size = getattr(file, 'size', None) or max(file.tell() - position, 0)
+    metrics = {
+        'engine': current_engine,
+        'fallback': current_engine != engines[0],
+        **dialect,
+        'bytes': size,
+        'seconds': round(seconds, 3),
+        'mb_per_second': round(size / (1024 * 1024) / seconds, 2) if seconds else None,
+    }
+    logger.info('Parsed %s: %s', file_name or 'CSV upload', metrics)
+    return result, metrics
+
+
+def list_excel_sheets(file, extension='.xlsx'):
+    """Sheet names with their row counts, read from each sheet's dimension record.
+
+    No cell data is loaded; ``rows`` is None when the workbook does not
+    record dimensions (or for legacy ``.xls`` files).
+    """
+    file.seek(0)
+    if extension == '.xls':
+        return [{'name': name, 'rows': None} for name in pd.ExcelFile(file).sheet_names]
+
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        return [
+            {'name': sheet.title, 'rows': max(sheet.max_row - 1, 0) if sheet.max_row else None}
+            for sheet in workbook.worksheets
+        ]
+    finally:
+        workbook.close()
+
+
+def _column_names(header):
+    """Header cells as unique strings, named like pandas does for blanks and repeats."""
+    names = []
+    seen = {}
+    for position, value in enumerate(header):
+        name = f'Unnamed: {position}' if value is None else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def read_excel_chunks(file, sheet_name, extension='.xlsx', chunk_rows=None):
+    """Yield one sheet of a workbook as DataFrames of at most ``chunk_rows`` rows.
+
+    ``.xlsx`` sheets are streamed row by row through openpyxl's read-only
+    mode; legacy ``.xls`` files can only be read whole.
+    """
+    file.seek(0)
+    if extension == '.xls':
+        yield pd.read_excel(file, sheet_name=sheet_name)
+        return
+
+    chunk_rows = chunk_rows or get_chunk_rows()
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+        columns = _column_names(next(rows, ()))
+        width = len(columns)
+
+        batch = []
+        yielded = False
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            batch.append(tuple(row[:width]) + (None,) * (width - len(row)))
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame.from_records(batch, columns=columns)
+                yielded = True
+                batch = []
+        if batch or not yielded:
+            yield pd.DataFrame.from_records(batch, columns=columns)
+    finally:
+        workbook.close()
@@ -0,0 +1,184 @@
+"""Background ingestion of uploaded files.
+
+Uploads are spooled next to their dataset and parsed outside the request,
+either in a per-process thread pool (the default) or by a Celery worker.
+Progress is written to the ``IngestionJob`` row so any worker can answer the
+polling API.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from accounts.dataset_cache import get_dataframe_cache
+from accounts.dataset_store import get_dataset_dir, new_dataset_id, write_dataset_chunks
+from .ingestion import ingest_csv, list_excel_sheets, read_excel_chunks
+from .models import IngestionJob
+
+logger = logging.getLogger(__name__)
+
+INGEST_JOB_SESSION_KEY = 'ingest_job_id'
+CSV_EXTENSIONS = ('.csv', '.tsv')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'INGEST_WORKERS', 2),
+                    thread_name_prefix='ingest',
+                )
+    return _executor
+
+
+def create_ingestion_job(uploaded_file, dataset_id, user=None, sheet_name=''):
+    """Spool an upload next to its dataset and record a pending job for it."""
+    job = IngestionJob(
+        dataset_id=dataset_id,
+        file_name=uploaded_file.name,
+        sheet_name=sheet_name,
+        bytes_total=uploaded_file.size or 0,
+        user=user if user is not None and user.is_authenticated else None,
+    )
+    extension = os.path.splitext(uploaded_file.name)[1].lower()
+    dataset_dir = get_dataset_dir(dataset_id)
+    dataset_dir.mkdir(parents=True, exist_ok=True)
+    upload_path = dataset_dir / f'.upload-{job.id.hex}{extension}'
+
+    with open(upload_path, 'wb') as f:
+        for chunk in uploaded_file.chunks():
+            f.write(chunk)
+
+    job.upload_path = str(upload_path)
+    job.save()
+    return job
+
+
+def submit_ingestion_job(job):
+    """Hand a job to the configured backend (``INGEST_BACKEND``)."""
+    backend = getattr(settings, 'INGEST_BACKEND', 'thread')
+    if backend == 'celery':
+        from .tasks import run_ingestion_job_task
+        run_ingestion_job_task.delay(str(job.id))
+    elif backend == 'sync':
+        run_ingestion_job(job.id)
+    else:
+        _get_executor().submit(run_ingestion_job, job.id)
+
+
+def _track_progress(job, chunks, file=None, rows_before=0):
+    """Pass chunks through while recording rows (and bytes, for text files) parsed on the job."""
+    # A parser fallback restarts the file, so counting starts over each time
+    rows_read = rows_before
+    for chunk in chunks:
+        rows_read += len(chunk)
+        progress = {'rows_read': rows_read, 'updated_at': timezone.now()}
+        if file is not None:
+            progress['bytes_parsed'] = min(file.tell(), job.bytes_total)
+        IngestionJob.objects.filter(pk=job.pk).update(**progress)
+        yield chunk
+
+
+def _ingest_excel(job, file, extension, compact):
+    """Ingest the selected sheet(s); every sheet beyond the first gets its own dataset."""
+    sheets = list_excel_sheets(file, extension)
+    names = [sheet['name'] for sheet in sheets]
+    if job.sheet_name == IngestionJob.ALL_SHEETS:
+        selected = names
+    elif job.sheet_name:
+        if job.sheet_name not in names:
+            raise ValueError(f'Sheet "{job.sheet_name}" not found. Available sheets: {", ".join(names)}')
+        selected = [job.sheet_name]
+    else:
+        selected = names[:1]
+
+    first_manifest = None
+    rows_read = 0
+    for sheet in sheets:
+        if sheet['name'] not in selected:
+            continue
+        dataset_id = job.dataset_id if first_manifest is None else new_dataset_id()
+        chunks = read_excel_chunks(file, sheet['name'], extension)
+        manifest = write_dataset_chunks(
+            dataset_id, _track_progress(job, chunks, rows_before=rows_read), compact=compact,
+        )
+        sheet.update(rows=manifest['rows'], dataset_id=dataset_id)
+        rows_read += manifest['rows']
+        first_manifest = first_manifest or manifest
+        get_dataframe_cache().invalidate(dataset_id)
+
+    job.sheets = sheets
+    return {**first_manifest, 'rows': rows_read}
+
+
+def run_ingestion_job(job_id):
+    """Parse a job's spooled upload into its dataset; safe to call from any worker."""
+    close_old_connections()
+    job = IngestionJob.objects.get(pk=job_id)
+    job.status = IngestionJob.STATUS_RUNNING
+    job.save(update_fields=['status', 'updated_at'])
+
+    try:
+        extension = os.path.splitext(job.file_name)[1].lower()
+        compact = getattr(settings, 'INGEST_COMPACT_DTYPES', True)
+        with open(job.upload_path, 'rb') as f:
+            if extension in CSV_EXTENSIONS:
+                manifest, _ = ingest_csv(
+                    f,
+                    lambda chunks: write_dataset_chunks(
+                        job.dataset_id, _track_progress(job, chunks, file=f), compact=compact,
+                    ),
+                    file_name=job.file_name,
+                )
+            else:
+                manifest = _ingest_excel(job, f, extension, compact)
+        get_dataframe_cache().invalidate(job.dataset_id)
+
+        job.status = IngestionJob.STATUS_FINISHED
+        job.rows_read = manifest['rows']
+        job.bytes_parsed = job.bytes_total
+    except Exception as e:
+        logger.exception('Ingestion job %s failed', job_id)
+        job.status = IngestionJob.STATUS_FAILED
+        job.error = str(e)
+    finally:
+        job.finished_at = timezone.now()
+        job.save()
+        try:
+            os.remove(job.upload_path)
+        except OSError:
+            pass
+        close_old_connections()
+
+
+def expire_stale_job(job):
+    """Fail a job whose worker stopped reporting progress (e.g. it was restarted)."""
+    timeout = getattr(settings, 'INGEST_JOB_TIMEOUT', 600)
+    if not job.is_done and job.updated_at < timezone.now() - timedelta(seconds=timeout):
+        job.status = IngestionJob.STATUS_FAILED
+        job.error = 'Processing stopped unexpectedly. Please upload the file again.'
+        job.finished_at = timezone.now()
+        job.save()
+    return job
+
+
+def get_session_ingestion_job(request):
+    """Return the ingestion job started from this session, or None."""
+    job_id = request.session.get(INGEST_JOB_SESSION_KEY)
+    if not job_id:
+        return None
+    job = IngestionJob.objects.filter(pk=job_id).first()
+    if job is None:
+        request.session.pop(INGEST_JOB_SESSION_KEY, None)
+        return None
+    return expire_stale_job(job)
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from accounts.dataset_store import delete_dataset, new_dataset_id, read_dataset_table, write_dataset
+from main import profiling
+
+from .bench_serialization import _build_frame
+
+
+class Command(BaseCommand):
+    help = 'Time column profiling in-process and across the profiling process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Number of rows')
+        parser.add_argument('--columns', type=int, default=200, help='Number of columns')
+        parser.add_argument('--workers', type=int, nargs='+', default=[2, 4], help='Pool sizes to try')
+
+    def handle(self, *args, **options):
+        df = _build_frame(options['rows'], options['columns'])
+        self.stdout.write(f'Frame: {len(df)} rows x {len(df.columns)} columns')
+
+        dataset_id = new_dataset_id()
+        try:
+            manifest = write_dataset(dataset_id, df)
+
+            start = time.perf_counter()
+            profiling.profile_frame(read_dataset_table(dataset_id, manifest).to_pandas())
+            serial = time.perf_counter() - start
+            self.stdout.write(f'in-process:   {serial * 1000:.0f} ms')
+
+            for workers in options['workers']:
+                profiling._reset_pool()
+                with override_settings(PROFILE_MAX_WORKERS=workers):
+                    pool_size = profiling.get_pool_size()
+                    if pool_size > 1:
+                        # Start the pool processes outside the timing
+                        profiling._get_pool().submit(int).result()
+                    start = time.perf_counter()
+                    profiling.profile_dataset(dataset_id, manifest)
+                    elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f'{pool_size} processes: {elapsed * 1000:.0f} ms ({serial / elapsed:.1f}x)'
+                    + ('' if pool_size == workers else f' (capped from {workers} by the CPUs available)')
+                )
+        finally:
+            profiling._reset_pool()
+            delete_dataset(dataset_id)
@@ -0,0 +1,73 @@
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from main.serializers import dataframe_to_records, dumps
+
+
+def _legacy_records(df):
+    """The per-cell iterrows conversion the analysis preview used before."""
+    def clean_for_json(obj):
+        if pd.isna(obj):
+            return None
+        elif isinstance(obj, (np.integer, np.floating)):
+            return float(obj) if not np.isnan(obj) else None
+        elif isinstance(obj, pd.Timestamp):
+            return obj.isoformat()
+        return obj
+
+    records = []
+    for _, row in df.iterrows():
+        records.append({col: clean_for_json(row[col]) for col in df.columns})
+    return json.dumps(records)
+
+
+def _build_frame(rows, columns):
+    """Mixed-dtype frame with missing values in every column type."""
+    rng = np.random.default_rng(0)
+    data = {}
+    for i in range(columns):
+        kind = i % 4
+        if kind == 0:
+            values = rng.random(rows)
+            values[::7] = np.nan
+        elif kind == 1:
+            values = rng.integers(0, 1000, rows)
+        elif kind == 2:
+            values = pd.Series(rng.choice(['red', 'green', 'blue'], rows)).where(np.arange(rows) % 5 != 0)
+        else:
+            values = pd.Series(pd.date_range('2024-01-01', periods=rows, freq='h')).where(np.arange(rows) % 6 != 0)
+        data[f'col_{i}'] = values
+    return pd.DataFrame(data)
+
+
+def _best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = 'Compare the vectorized preview serializer against the old iterrows conversion'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50, help='Rows to serialize (the preview size)')
+        parser.add_argument('--columns', type=int, default=1000, help='Number of columns')
+        parser.add_argument('--repeat', type=int, default=5, help='Best-of-N timing')
+
+    def handle(self, *args, **options):
+        df = _build_frame(options['rows'], options['columns'])
+        self.stdout.write(f'Frame: {len(df)} rows x {len(df.columns)} columns')
+
+        legacy = _best_of(lambda: _legacy_records(df), options['repeat'])
+        vectorized = _best_of(lambda: dumps(dataframe_to_records(df)), options['repeat'])
+
+        self.stdout.write(f'iterrows + clean_for_json: {legacy * 1000:.1f} ms')
+        self.stdout.write(f'vectorized serializer:     {vectorized * 1000:.1f} ms')
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {legacy / vectorized:.1f}x'))
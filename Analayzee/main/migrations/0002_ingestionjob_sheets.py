@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='sheet_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='sheets',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
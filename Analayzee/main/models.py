@@ -1,3 +1,63 @@
+import uuid
+
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class IngestionJob(models.Model):
+    """Background parse of an uploaded file into the dataset store"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_FINISHED = 'finished'
+    STATUS_FAILED = 'failed'
+    ALL_SHEETS = '__all__'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_FINISHED, 'Finished'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='ingestion_jobs'
+    )
+    dataset_id = models.CharField(max_length=32)
+    file_name = models.CharField(max_length=255)
+    upload_path = models.CharField(max_length=500)
+    # Excel only: sheet to ingest, blank for the first one or ALL_SHEETS
+    sheet_name = models.CharField(max_length=255, blank=True)
+    # Excel only: [{'name', 'rows', 'dataset_id'}] for every sheet in the workbook
+    sheets = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    bytes_total = models.BigIntegerField(default=0)
+    bytes_parsed = models.BigIntegerField(default=0)
+    rows_read = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.file_name} - {self.status}"
+
+    @property
+    def is_done(self):
+        """Check if the job has stopped, successfully or not"""
+        return self.status in (self.STATUS_FINISHED, self.STATUS_FAILED)
+
+    @property
+    def progress(self):
+        """Fraction of the upload parsed so far"""
+        if self.status == self.STATUS_FINISHED:
+            return 1.0
+        if not self.bytes_total:
+            return 0.0
+        return min(self.bytes_parsed / self.bytes_total, 1.0)
@@ -0,0 +1,372 @@
+"""Per-column profiles (summary statistics) of a stored dataset.
+
+A profile has the shape the column-analysis cards render: counts and missing
+values, moments, quantiles, outliers and a histogram for numeric columns;
+cardinality and the top-k values for everything else. Each column is
+reduced with a few vectorized NumPy/pandas passes: quantiles come from one
+``np.quantile`` call and modes and top values from a hash-based
+``value_counts`` instead of repeated sorts.
+
+Spread and shape use the sample estimators (``ddof=1`` variance, bias-
+corrected skewness and excess kurtosis), matching ``DataFrame.describe``.
+Profiles are computed once per dataset version, stored beside it as
+``v{n}.profile.json`` and kept in the worker's query cache.
+
+Columns are independent, so wide datasets are profiled across a process
+pool of up to ``PROFILE_MAX_WORKERS`` processes. Only the file path and
+column names are sent to a pool process: it memory-maps the version's Arrow
+file and reads its columns from the shared page cache, and only the small
+profile dicts are pickled back.
+"""
+import logging
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+from django.conf import settings
+
+from accounts.dataset_cache import get_dataframe_cache, get_query_cache
+from accounts.dataset_store import (
+    column_files,
+    get_column_sketches,
+    get_dataset_dir,
+    read_dataset,
+    read_version_artifact,
+    write_version_artifact,
+)
+
+from .serializers import dumps
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ARTIFACT = 'profile.json'
+HISTOGRAM_BINS = 10
+OUTLIER_IQR_FACTOR = 1.5
+# More modes than this are cut off; a column of unique values would list them all
+MAX_MODES = 10
+NULL_LIKE_VALUES = ('null', 'NULL', 'None', 'none')
+# Quantiles read from the ingest t-digests
+SKETCH_QUANTILES = {'p1': 0.01, 'p5': 0.05, 'p25': 0.25, 'p50': 0.5, 'p75': 0.75, 'p95': 0.95, 'p99': 0.99}
+# Narrower frames are profiled in-process; starting pool work costs more than it saves
+PARALLEL_MIN_COLUMNS = 8
+# Column batches per pool process, so a few expensive columns do not leave processes idle
+BATCHES_PER_PROCESS = 4
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _float(value):
+    """A JSON-safe float: NaN and infinities become None."""
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def _percent(count, total):
+    return count / total * 100 if total else 0.0
+
+
+def is_numeric_column(series):
+    return pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype)
+
+
+def _empty_profile(column, total_rows):
+    return {'type': 'empty', 'column': column, 'basic': {'count': 0, 'missing': total_rows}}
+
+
+def profile_numeric(column, series, total_rows):
+    values = series.dropna().to_numpy(dtype=np.float64)
+    values = values[np.isfinite(values)]
+    n = len(values)
+    if not n:
+        return _empty_profile(column, total_rows)
+
+    p10, q1, median, q3, p90 = np.quantile(values, [0.1, 0.25, 0.5, 0.75, 0.9])
+    iqr = q3 - q1
+    minimum, maximum = values.min(), values.max()
+    total = values.sum()
+    mean = total / n
+
+    moments = pd.Series(values, copy=False)
+    variance = moments.var()
+    std = math.sqrt(variance) if n > 1 else float('nan')
+    skewness = moments.skew()
+    kurtosis = moments.kurt()
+    coefficient_of_variation = std / mean * 100 if mean else float('nan')
+
+    counts = moments.value_counts(sort=True)
+    modes = counts.index[counts.to_numpy() == counts.iloc[0]][:MAX_MODES]
+
+    outliers = int(np.count_nonzero(
+        (values < q1 - OUTLIER_IQR_FACTOR * iqr) | (values > q3 + OUTLIER_IQR_FACTOR * iqr)
+    ))
+    zero_count = int(np.count_nonzero(values == 0))
+    negative_count = int(np.count_nonzero(values < 0))
+    positive_count = n - zero_count - negative_count
+
+    histogram, edges = np.histogram(values, bins=HISTOGRAM_BINS)
+
+    return {
+        'type': 'numeric',
+        'column': column,
+        'basic': {
+            'count': n,
+            'missing': total_rows - n,
+            'missingPercentage': _percent(total_rows - n, total_rows),
+            'min': _float(minimum),
+            'max': _float(maximum),
+            'range': _float(maximum - minimum),
+            'sum': _float(total),
+            'mean': _float(mean),
+            'median': _float(median),
+            'mode': [_float(mode) for mode in modes],
+        },
+        'dispersion': {
+            'variance': _float(variance),
+            'stdDev': _float(std),
+            'coefficientOfVariation': _float(coefficient_of_variation),
+            'iqr': _float(iqr),
+            'q1': _float(q1),
+            'q3': _float(q3),
+        },
+        'shape': {
+            'skewness': _float(skewness),
+            'kurtosis': _float(kurtosis),
+            'outliers': outliers,
+            'outlierPercentage': _percent(outliers, n),
+            'isNormal': bool(abs(skewness) < 1 and abs(kurtosis) < 2),
+            'isSkewed': bool(abs(skewness) > 1),
+            'hasHighVariability': bool(coefficient_of_variation > 50),
+        },
+        'percentiles': {
+            'p10': _float(p10),
+            'p25': _float(q1),
+            'p50': _float(median),
+            'p75': _float(q3),
+            'p90': _float(p90),
+        },
+        'dataQuality': {
+            'zeroCount': zero_count,
+            'zeroPercentage': _percent(zero_count, n),
+            'negativeCount': negative_count,
+            'negativePercentage': _percent(negative_count, n),
+            'positiveCount': positive_count,
+            'positivePercentage': _percent(positive_count, n),
+        },
+        'distribution': [
+            {
+                'range': f'{low:.2f} - {high:.2f}',
+                'min': _float(low),
+                'max': _float(high),
+                'count': int(count),
+                'percentage': _percent(int(count), n),
+            }
+            for low, high, count in zip(edges[:-1], edges[1:], histogram)
+        ],
+    }
+
+
+def profile_categorical(column, series, total_rows, top_k):
+    counts = series.value_counts(sort=True, dropna=True)
+    counts = counts[counts.to_numpy() > 0]
+    n = int(counts.sum())
+    if not n:
+        return _empty_profile(column, total_rows)
+
+    # Quality checks run over the distinct values, not every row
+    labels = counts.index.astype(str)
+    frequencies = counts.to_numpy()
+    empty_count = int(frequencies[labels.str.strip() == ''].sum())
+    null_like_count = int(frequencies[labels.isin(NULL_LIKE_VALUES)].sum())
+    valid_count = n - empty_count - null_like_count
+    unique = len(counts)
+
+    top = counts.iloc[:top_k]
+    return {
+        'type': 'categorical',
+        'column': column,
+        'basic': {
+            'count': n,
+            'missing': total_rows - n,
+            'missingPercentage': _percent(total_rows - n, total_rows),
+            'uniqueValues': unique,
+            'mostFrequent': labels[0],
+            'mostFrequentCount': int(frequencies[0]),
+            'mostFrequentPercentage': _percent(int(frequencies[0]), n),
+        },
+        'dataQuality': {
+            'emptyStringCount': empty_count,
+            'emptyStringPercentage': _percent(empty_count, n),
+            'nullLikeCount': null_like_count,
+            'nullLikePercentage': _percent(null_like_count, n),
+            'validValues': valid_count,
+            'validPercentage': _percent(valid_count, n),
+        },
+        'insights': {
+            'isBalanced': bool(unique > 1 and frequencies[0] / frequencies[-1] < 3),
+            'hasHighCardinality': unique > n * 0.5,
+            'isLowCardinality': unique < 5,
+            'diversityIndex': unique / n,
+        },
+        'distribution': [
+            {'value': label, 'count': int(count), 'percentage': _percent(int(count), n)}
+            for label, count in zip(labels[:top_k], top.to_numpy())
+        ],
+    }
+
+
+def profile_column(column, series, total_rows, top_k=None):
+    """Profile of one column in the shape the column-analysis cards expect."""
+    top_k = top_k or getattr(settings, 'PROFILE_TOP_K', 20)
+    if is_numeric_column(series):
+        return profile_numeric(column, series, total_rows)
+    return profile_categorical(column, series, total_rows, top_k)
+
+
+def profile_frame(df, top_k=None):
+    """``{column: profile}`` for every column of ``df``."""
+    return {str(column): profile_column(str(column), df[column], len(df), top_k) for column in df.columns}
+
+
+def _profile_file_columns(files, top_k):
+    """Pool task: profile some columns of memory-mapped Arrow files, given as ``[(path, columns)]``."""
+    profiles = {}
+    for path, columns in files:
+        # Selecting from the mapped table stays zero-copy; feather's ``columns=`` reads the whole file
+        table = feather.read_table(path, memory_map=True).select(columns)
+        profiles.update(profile_frame(table.to_pandas(), top_k))
+    return profiles
+
+
+def get_pool_size():
+    """Processes the profiling pool may use, capped by ``PROFILE_MAX_WORKERS`` and the CPUs available."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    return max(1, min(getattr(settings, 'PROFILE_MAX_WORKERS', 4), cpus))
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: forking a process that runs request and ingestion threads is unsafe
+                _pool = ProcessPoolExecutor(
+                    max_workers=get_pool_size(),
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+    return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def profile_dataset(dataset_id, manifest, df=None):
+    """``{column: profile}`` for a dataset version, spread over the process pool when it is wide.
+
+    ``df`` (the loaded frame, if the caller has it) is only used when the
+    columns are profiled in this process.
+    """
+    columns = manifest['columns']
+    top_k = getattr(settings, 'PROFILE_TOP_K', 20)
+    pool_size = get_pool_size()
+
+    if pool_size > 1 and len(columns) >= PARALLEL_MIN_COLUMNS:
+        dataset_dir = get_dataset_dir(dataset_id)
+        files = column_files(manifest)
+        batches = []
+        for batch in np.array_split(np.array(columns, dtype=object), min(len(columns), pool_size * BATCHES_PER_PROCESS)):
+            # A version may read some columns from its parents' files
+            groups = {}
+            for column in batch:
+                groups.setdefault(str(dataset_dir / files[column]), []).append(column)
+            batches.append(list(groups.items()))
+        try:
+            pool = _get_pool()
+            profiles = {}
+            for result in pool.map(_profile_file_columns, batches, [top_k] * len(batches)):
+                profiles.update(result)
+            return {column: profiles[column] for column in columns}
+        except BrokenProcessPool:
+            # A pool process died (e.g. killed for memory); start a fresh pool next time
+            logger.exception('Profiling pool broke while profiling %s; profiling in-process', dataset_id)
+            _reset_pool()
+
+    if df is None:
+        df = read_dataset(dataset_id, manifest)
+    return profile_frame(df, top_k)
+
+
+def _sketch_summary(sketches, column):
+    summary = {'distinct': sketches.distinct(column)}
+    quantiles = sketches.quantiles(column, list(SKETCH_QUANTILES.values()))
+    if quantiles is not None:
+        summary['quantiles'] = {name: _float(value) for name, value in zip(SKETCH_QUANTILES, quantiles)}
+    return summary
+
+
+def get_approximate_profile(dataset_id, manifest):
+    """Counts, distinct values and quantiles from the manifest and ingest sketches alone.
+
+    No column data is read, so this answers instantly however large the
+    dataset is. Returns None if the version has no sketches.
+    """
+    sketches = get_column_sketches(dataset_id, manifest)
+    if sketches is None:
+        return None
+
+    columns = {}
+    for column in manifest['columns']:
+        missing = manifest['missing_values'].get(column, 0)
+        columns[column] = {
+            'column': column,
+            'count': manifest['rows'] - missing,
+            'missing': missing,
+            **_sketch_summary(sketches, column),
+        }
+    return {'rows': manifest['rows'], 'approximate': True, 'columns': columns}
+
+
+def get_dataset_profile(dataset_id, manifest):
+    """JSON-encoded profile of a dataset version (``{"rows", "columns": {...}}``).
+
+    Served from the worker's cache, then from the file stored beside the
+    version; only the first request for a version computes it. Columns
+    sketched at ingest also carry an ``approximate`` entry with their
+    estimated distinct count and quantiles.
+    """
+    cache = get_query_cache()
+    key = (dataset_id, manifest['version'], 'profile')
+    profile = cache.get(key)
+    if profile is not None:
+        return profile
+
+    profile = read_version_artifact(dataset_id, manifest, PROFILE_ARTIFACT)
+    if profile is None:
+        columns = profile_dataset(dataset_id, manifest, get_dataframe_cache().get(key[:2]))
+        sketches = get_column_sketches(dataset_id, manifest)
+        if sketches is not None:
+            for column, column_profile in columns.items():
+                column_profile['approximate'] = _sketch_summary(sketches, column)
+        profile = dumps({'rows': manifest['rows'], 'columns': columns}).encode()
+        try:
+            write_version_artifact(dataset_id, manifest, PROFILE_ARTIFACT, profile)
+        except OSError:
+            # The dataset was replaced or removed meanwhile; the profile is still valid for this response
+            logger.warning('Could not store the profile of %s v%s', dataset_id, manifest['version'])
+
+    cache.put(key, profile)
+    return profile
@@ -0,0 +1,102 @@
+"""Column-wise conversion of DataFrames to JSON-ready rows.
+
+Columns are converted in vectorized steps (missing values to None, numpy
+scalars to Python ones, timestamps to ISO strings) instead of testing every
+cell in Python, and the result is encoded with orjson when it is installed.
+"""
+import datetime
+import json
+
+import numpy as np
+import pandas as pd
+from django.http import HttpResponse
+
+try:
+    # orjson is optional (requirements-prod.txt); the stdlib encoder is the fallback
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _block_values(block):
+    """Convert columns sharing one dtype to a 2-D object array of JSON-native values."""
+    dtype = block.dtypes.iloc[0]
+    mask = block.isna().to_numpy()
+
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        if getattr(dtype, 'tz', None) is not None:
+            block = block.apply(lambda col: col.dt.tz_convert(None))
+        array = block.to_numpy()
+        # The column's own resolution keeps sub-second values; whole seconds are written without
+        # a fraction, as Timestamp.isoformat does
+        values = np.datetime_as_string(array, unit=np.datetime_data(array.dtype)[0])
+        whole = array == array.astype('datetime64[s]')
+        values[whole] = np.datetime_as_string(array[whole], unit='s')
+        values = values.astype(object)
+    elif pd.api.types.is_timedelta64_dtype(dtype):
+        values = block.astype(str).to_numpy(dtype=object)
+    elif isinstance(dtype, np.dtype) and dtype.kind in 'biuf':
+        # Casting a numpy array to object yields Python ints/floats/bools in one C loop
+        values = block.to_numpy().astype(object)
+    else:
+        # Categoricals, nullable and string extension dtypes, plain objects
+        values = block.astype(object).to_numpy(dtype=object, copy=True)
+
+    if mask.any():
+        values[mask] = None
+    return values
+
+
+def _object_values(df):
+    """2-D object array of JSON-native values for the whole frame.
+
+    Columns are grouped by dtype so each group is converted with a handful of
+    2-D array operations, however wide the frame is.
+    """
+    values = np.empty((len(df), len(df.columns)), dtype=object)
+
+    positions_by_dtype = {}
+    for position, dtype in enumerate(df.dtypes):
+        # Categoricals compare equal only with the same categories, so group by their string form
+        positions_by_dtype.setdefault(str(dtype), []).append(position)
+
+    for positions in positions_by_dtype.values():
+        values[:, positions] = _block_values(df.iloc[:, positions])
+    return values
+
+
+def dataframe_to_records(df):
+    """Convert ``df`` to a list of row dicts that any JSON encoder accepts."""
+    columns = [str(col) for col in df.columns]
+    return [dict(zip(columns, row)) for row in _object_values(df).tolist()]
+
+
+def dataframe_to_columns(df):
+    """Convert ``df`` to ``{column: [values]}``, the compact column-oriented form."""
+    columns = [str(col) for col in df.columns]
+    return dict(zip(columns, _object_values(df).T.tolist()))
+
+
+def _default(obj):
+    """Fallback for values left in object columns (numpy scalars, timestamps, ...)."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (pd.Timestamp, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if obj is pd.NaT or obj is pd.NA:
+        return None
+    return str(obj)
+
+
+def dumps(obj):
+    """Encode ``obj`` as a JSON string."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, default=_default)
+
+
+def json_response(payload, status=200):
+    """``JsonResponse`` equivalent that goes through ``dumps``."""
+    return HttpResponse(dumps(payload), content_type='application/json', status=status)
@@ -0,0 +1,229 @@
+"""Server-side sort, filter, search and paging for the analysis table.
+
+Every column used for sorting is reduced once to an integer sort key (a dense
+rank, missing values last) and the final row order for a query is cached per
+dataset version, so flipping through pages of the same query only slices an
+index array and serializes the page.
+"""
+import json
+import re
+
+import numpy as np
+import pandas as pd
+
+from accounts.dataset_cache import get_query_cache
+
+FILTER_OPS = ('contains', 'eq', 'ne', 'gt', 'gte', 'lt', 'lte', 'isnull', 'notnull')
+
+
+def parse_sort(raw, columns):
+    """Parse ``[{"column": ..., "direction": "asc"|"desc"}, ...]`` into ``[(column, descending)]``."""
+    if not raw:
+        return []
+    try:
+        items = json.loads(raw)
+    except json.JSONDecodeError:
+        raise ValueError('sort must be a JSON list')
+    if not isinstance(items, list):
+        raise ValueError('sort must be a JSON list')
+
+    sort = []
+    for item in items:
+        column = item.get('column') if isinstance(item, dict) else None
+        if column not in columns:
+            raise ValueError(f'Unknown sort column: {column}')
+        direction = item.get('direction', 'asc')
+        if direction not in ('asc', 'desc'):
+            raise ValueError(f'Invalid sort direction: {direction}')
+        sort.append((column, direction == 'desc'))
+    return sort
+
+
+def parse_filters(raw, columns):
+    """Parse ``[{"column": ..., "op": ..., "value": ...}, ...]`` into ``[(column, op, value)]``."""
+    if not raw:
+        return []
+    try:
+        items = json.loads(raw)
+    except json.JSONDecodeError:
+        raise ValueError('filters must be a JSON list')
+    if not isinstance(items, list):
+        raise ValueError('filters must be a JSON list')
+
+    filters = []
+    for item in items:
+        column = item.get('column') if isinstance(item, dict) else None
+        if column not in columns:
+            raise ValueError(f'Unknown filter column: {column}')
+        op = item.get('op', 'contains')
+        if op not in FILTER_OPS:
+            raise ValueError(f'Invalid filter operation: {op}')
+        value = item.get('value')
+        if op not in ('isnull', 'notnull') and (value is None or value == ''):
+            # An empty filter box filters nothing
+            continue
+        filters.append((column, op, value))
+    return filters
+
+
+def _dense_rank(values):
+    """Rank of each value among the distinct values (ties share a rank); missing values get -1."""
+    codes, _ = pd.factorize(values, sort=True)
+    return codes.astype(np.int32)
+
+
+def _compute_sort_key(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Rank the (few) categories, then look ranks up by code
+        category_ranks = _dense_rank(series.cat.categories.astype(str).str.lower())
+        codes = series.cat.codes.to_numpy()
+        return np.where(codes >= 0, category_ranks[codes], -1).astype(np.int32)
+
+    if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return _dense_rank(series)
+
+    # Text sorts case-insensitively, like the table always has
+    return _dense_rank(series.where(series.isna(), series.astype(str).str.lower()))
+
+
+def _sort_key(df, dataset_key, column):
+    cache = get_query_cache()
+    key = (*dataset_key, 'sort_key', column)
+    sort_key = cache.get(key)
+    if sort_key is None:
+        sort_key = _compute_sort_key(df[column])
+        cache.put(key, sort_key)
+    return sort_key
+
+
+def _sort_order(df, dataset_key, sort):
+    """Row positions ordered by ``sort``; missing values go last in either direction."""
+    keys = []
+    for column, descending in sort:
+        sort_key = _sort_key(df, dataset_key, column)
+        missing_rank = int(sort_key.max()) + 1 if len(sort_key) else 0
+        if descending:
+            keys.append(np.where(sort_key < 0, missing_rank, missing_rank - 1 - sort_key))
+        else:
+            keys.append(np.where(sort_key < 0, missing_rank, sort_key))
+
+    if len(keys) == 1:
+        return np.argsort(keys[0], kind='stable')
+    # lexsort treats the last key as the primary one
+    return np.lexsort(keys[::-1])
+
+
+def _contains(series, term, word_prefix=False):
+    """Case-insensitive substring match (or, with ``word_prefix``, a word starting with ``term``)."""
+    term = str(term).lower()
+    if word_prefix:
+        pattern, regex = r'(?:^|[\W_])' + re.escape(term), True
+    else:
+        pattern, regex = term, False
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        matches = series.cat.categories.astype(str).str.lower().str.contains(pattern, regex=regex)
+        return np.isin(series.cat.codes.to_numpy(), np.flatnonzero(matches))
+    text = series.astype(str).str.lower()
+    return text.str.contains(pattern, regex=regex).to_numpy(dtype=bool) & series.notna().to_numpy()
+
+
+def _coerce(series, value):
+    """Convert a filter value to something comparable with the column."""
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return str(value).lower() in ('true', '1', 'yes')
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return float(value)
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return pd.Timestamp(value)
+    return str(value)
+
+
+def _filter_mask(series, op, value):
+    if op == 'contains':
+        return _contains(series, value)
+    if op == 'isnull':
+        return series.isna().to_numpy()
+    if op == 'notnull':
+        return series.notna().to_numpy()
+
+    try:
+        value = _coerce(series, value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid value for column {series.name}: {value!r}')
+    if not (pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_datetime64_any_dtype(series.dtype)):
+        series = series.astype(str).where(series.notna())
+
+    compare = {
+        'eq': series.eq, 'ne': series.ne,
+        'gt': series.gt, 'gte': series.ge,
+        'lt': series.lt, 'lte': series.le,
+    }[op]
+    return compare(value).fillna(False).to_numpy(dtype=bool)
+
+
+def _search_mask(df, search, search_columns, search_index=None, prefix=False):
+    """Rows containing ``search`` in any search column, answered from the index where possible."""
+    found = np.zeros(len(df), dtype=bool)
+    indexed = []
+    if search_index is not None and search_index.num_rows == len(df):
+        indexed = [column for column in search_columns if column in search_index.columns]
+        if indexed:
+            found[search_index.search(search, columns=indexed, prefix=prefix)] = True
+
+    for column in search_columns:
+        if column in indexed:
+            continue
+        found |= _contains(df[column], search, word_prefix=prefix)
+    return found
+
+
+def _match_mask(df, filters, search, search_columns, search_index=None, prefix=False):
+    """Rows passing every filter and, if ``search`` is set, containing it in any search column."""
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in filters:
+        mask &= _filter_mask(df[column], op, value)
+
+    if search:
+        mask &= _search_mask(df, search, search_columns, search_index, prefix)
+    return mask
+
+
+def query_table(df, dataset_key, sort=(), filters=(), search='', search_columns=None,
+                columns=None, offset=0, limit=25, search_index=None, search_mode='contains'):
+    """Run a table query and return ``(page, row_ids, matched_rows)``.
+
+    ``dataset_key`` is ``(dataset_id, version)`` and scopes the cached sort
+    keys and row orders. ``row_ids`` are the positions of the page's rows in
+    the stored dataset. Text columns covered by ``search_index`` are searched
+    through it; ``search_mode='prefix'`` matches words starting with the term.
+    """
+    search_columns = list(df.columns) if search_columns is None else search_columns
+    columns = list(df.columns) if columns is None else columns
+
+    rows = None
+    if sort or filters or search:
+        cache = get_query_cache()
+        key = (
+            *dataset_key, 'rows', tuple(sort),
+            json.dumps(filters, sort_keys=True, default=str),
+            search.lower(), tuple(search_columns) if search else (), search_mode,
+        )
+        rows = cache.get(key)
+        if rows is None:
+            rows = _sort_order(df, dataset_key, sort) if sort else np.arange(len(df))
+            if filters or search:
+                mask = _match_mask(
+                    df, filters, search, search_columns, search_index, prefix=search_mode == 'prefix',
+                )
+                rows = rows[mask[rows]]
+            cache.put(key, rows)
+
+    if rows is None:
+        matched_rows = len(df)
+        page_rows = np.arange(min(offset, matched_rows), min(offset + limit, matched_rows))
+    else:
+        matched_rows = len(rows)
+        page_rows = rows[offset:offset + limit]
+
+    page = df.iloc[page_rows][columns]
+    return page, page_rows.tolist(), matched_rows
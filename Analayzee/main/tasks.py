@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from .jobs import run_ingestion_job
+
+
+@shared_task
+def run_ingestion_job_task(job_id):
+    """Celery entry point for background ingestion (INGEST_BACKEND = 'celery')"""
+    run_ingestion_job(job_id)
@@ -1,3 +1,1384 @@
-from django.test import TestCase
+import io
+import json
+import math
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import openpyxl
+import pandas as pd
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.dataset_store import (
+    checkout_version, get_dataset_dir, get_row_fingerprints, new_dataset_id, read_dataset, read_dataset_table,
+    read_manifest, write_dataset, write_dataset_chunks,
+)
+from accounts.fingerprints import table_fingerprints
+from accounts.tests import StoreTestCase
+from accounts.dataset_cache import get_dataframe_cache, get_query_cache
+from accounts.utils import DATASETS_SESSION_KEY
+
+from .aggregation import AGGREGATIONS, aggregate, grouped
+from .cleaning import (
+    apply_cleaning_operation, build_plan, changed_columns, clean_dataset, execute_plan, remove_duplicates,
+)
+from .cleaning_preview import preview_cleaning
+from .ingestion import ingest_csv, list_excel_sheets, read_excel_chunks
+from .jobs import INGEST_JOB_SESSION_KEY, create_ingestion_job
+from .models import IngestionJob
+from . import profiling
+from .correlation import correlation_matrix, get_correlation_matrix
+from .downsampling import grid_sample, lttb
+from .profiling import get_dataset_profile, profile_column, profile_dataset, profile_frame
+from .serializers import dataframe_to_columns, dataframe_to_records, dumps
+from .table_query import _compute_sort_key, _sort_order, parse_filters, parse_sort, query_table
+
+
+class CleaningVersionTests(StoreTestCase):
+    def test_converted_column_reads_back_with_its_new_dtype(self):
+        dataset_id, manifest = self.write(pd.DataFrame({'a': [1.0, 2.0, np.nan, 4.0], 'b': list('xyzw')}))
+
+        stats, new_manifest, _ = clean_dataset(dataset_id, manifest, 'a', 'data-type', {'target_type': 'int'})
+
+        self.assertEqual(stats['new_type'], 'Int64')
+        self.assertEqual(new_manifest['data_types']['a'], 'Int64')
+        df = read_dataset(dataset_id)
+        self.assertEqual(str(df['a'].dtype), 'Int64')
+        self.assertEqual(df['a'].tolist(), [1, 2, pd.NA, 4])
+
+    def test_later_versions_keep_the_conversion(self):
+        dataset_id, manifest = self.write(pd.DataFrame({'a': [1.0, 2.0, np.nan, 4.0], 'b': list('XYZW')}))
+        _, manifest, _ = clean_dataset(dataset_id, manifest, 'a', 'data-type', {'target_type': 'int'})
+
+        clean_dataset(dataset_id, manifest, 'b', 'text-cleaning', {'lowercase': 'true'})
+
+        df = read_dataset(dataset_id, read_manifest(dataset_id))
+        self.assertEqual(str(df['a'].dtype), 'Int64')
+        self.assertEqual(df['b'].tolist(), list('xyzw'))
+
+
+class PlanTests(SimpleTestCase):
+    frame = pd.DataFrame({
+        'small': pd.Series([1, 2, 3, 100, 2], dtype='int8'),
+        'nullable': pd.Series([1, None, 3, 100, 2], dtype='Int64'),
+        'price': [1.5, np.nan, 3.25, 250.0, 2.0],
+    })
+
+    def assertFusedMatchesSteps(self, steps):
+        expected = self.frame.copy()
+        for step in steps:
+            apply_cleaning_operation(expected, step['column'], step['operation'], step)
+
+        fused = self.frame.copy()
+        results = execute_plan(fused, build_plan(steps))
+
+        self.assertFalse(any('error' in result['stats'] for result in results), results)
+        pd.testing.assert_frame_equal(fused, expected)
+
+    def test_fills_and_caps_keep_integer_dtypes(self):
+        for column in ('small', 'nullable', 'price'):
+            with self.subTest(column=column):
+                self.assertFusedMatchesSteps([
+                    {'column': column, 'operation': 'missing-values', 'action': 'fill-zero'},
+                    {'column': column, 'operation': 'missing-values', 'action': 'fill-custom', 'custom_value': '7'},
+                    {'column': column, 'operation': 'outliers', 'action': 'cap', 'method': 'iqr', 'threshold': '2'},
+                ])
+
+    def test_caps_to_fractional_bounds_become_float(self):
+        self.assertFusedMatchesSteps([
+            {'column': 'small', 'operation': 'outliers', 'action': 'cap', 'method': 'zscore', 'threshold': '1'},
+        ])
+
+    def test_normalize_after_fill(self):
+        self.assertFusedMatchesSteps([
+            {'column': 'price', 'operation': 'missing-values', 'action': 'fill-median'},
+            {'column': 'price', 'operation': 'normalize', 'method': 'minmax'},
+            {'column': 'small', 'operation': 'normalize', 'method': 'zscore'},
+        ])
+
+
+@override_settings(CLEANING_CHUNK_ROWS=7, SKETCH_QUANTILES_MIN_ROWS=0)
+class ChunkedCleaningTests(StoreTestCase):
+    """The out-of-core path stores the same values and dtypes as cleaning in memory."""
+
+    cases = [
+        ('price', 'missing-values', {'action': 'fill-mean'}),
+        ('price', 'missing-values', {'action': 'fill-mode'}),
+        ('price', 'missing-values', {'action': 'fill-custom', 'custom_value': '7'}),
+        ('count', 'missing-values', {'action': 'fill-zero'}),
+        ('city', 'missing-values', {'action': 'fill-mode'}),
+        ('price', 'outliers', {'action': 'cap', 'method': 'iqr'}),
+        ('count', 'outliers', {'action': 'cap', 'method': 'iqr', 'threshold': '2'}),
+        ('price', 'outliers', {'action': 'mark', 'method': 'zscore', 'threshold': '1'}),
+        ('price', 'normalize', {'method': 'minmax'}),
+        ('count', 'normalize', {'method': 'robust'}),
+        ('amount', 'data-type', {'target_type': 'float'}),
+        ('code', 'data-type', {'target_type': 'int'}),
+        ('day', 'data-type', {'target_type': 'datetime'}),
+        ('flag', 'data-type', {'target_type': 'boolean'}),
+        ('count', 'data-type', {'target_type': 'string'}),
+        ('city', 'text-cleaning', {'lowercase': 'true', 'remove_special': 'true'}),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(0)
+        rows = 40
+        frame = pd.DataFrame({
+            'price': np.where(rng.random(rows) < 0.2, np.nan, rng.normal(10, 3, rows)),
+            'count': pd.array(np.where(rng.random(rows) < 0.2, None, rng.integers(0, 9, rows)), dtype='Int64'),
+            'city': rng.choice(['Paris!', 'Rome', None], rows),
+            # The first chunk only holds whole numbers
+            'amount': ['1', '2', '3', '4', '5', '6', '7'] + list(rng.choice(['1.5', '2', 'x', None], rows - 7)),
+            'code': rng.choice(['1', '2', 'x', None], rows),
+            'day': rng.choice(['2024-01-02', '2024-03-04 10:30', 'never', None], rows),
+            'flag': rng.choice(['true', 'false', '1', None], rows),
+        })
+        self.dataset_id, self.manifest = self.write(frame)
+
+    def clean(self, max_bytes, column, operation, params):
+        with self.settings(CLEANING_IN_MEMORY_MAX_BYTES=max_bytes):
+            stats, manifest, _ = clean_dataset(self.dataset_id, self.manifest, column, operation, params)
+        self.assertIsNotNone(manifest, stats)
+        return stats, manifest, read_dataset(self.dataset_id, manifest)
+
+    def test_same_result_as_in_memory(self):
+        for column, operation, params in self.cases:
+            with self.subTest(column=column, operation=operation, **params):
+                stats, manifest, expected = self.clean(2 ** 40, column, operation, params)
+                chunked_stats, chunked_manifest, chunked = self.clean(0, column, operation, params)
+
+                for written in changed_columns(operation, column, params):
+                    self.assertNotEqual(chunked_manifest['column_files'][written], manifest['column_files'][written])
+                pd.testing.assert_frame_equal(chunked, expected)
+                self.assertEqual(chunked_manifest['data_types'], manifest['data_types'])
+                self.assertEqual(chunked_manifest['data_types'], chunked.dtypes.astype(str).to_dict())
+                self.assertEqual(chunked_manifest['missing_values'], manifest['missing_values'])
+                self.assertEqual(chunked_stats.get('new_type'), stats.get('new_type'))
+
+    def test_failed_conversion_writes_nothing(self):
+        with self.settings(CLEANING_IN_MEMORY_MAX_BYTES=0):
+            stats, manifest, _ = clean_dataset(
+                self.dataset_id, self.manifest, 'amount', 'data-type', {'target_type': 'float', 'method': 'raise'},
+            )
+        self.assertIsNone(manifest)
+        self.assertFalse(stats['conversion_successful'])
+        self.assertEqual(read_manifest(self.dataset_id)['version'], self.manifest['version'])
+
+
+@override_settings(CLEANING_PREVIEW_SAMPLE_ROWS=40)
+class PreviewTests(StoreTestCase):
+    """Previewed rows come out as applying the step to the whole dataset leaves them."""
+
+    cases = [
+        ('price', 'missing-values', {'action': 'fill-mean'}),
+        ('price', 'missing-values', {'action': 'fill-median'}),
+        ('city', 'missing-values', {'action': 'fill-mode'}),
+        ('price', 'outliers', {'action': 'cap', 'method': 'iqr'}),
+        ('price', 'outliers', {'action': 'mark', 'method': 'zscore', 'threshold': '1'}),
+        ('price', 'outliers', {'action': 'remove', 'method': 'percentile', 'threshold': '0.9'}),
+        ('price', 'normalize', {'method': 'minmax'}),
+        ('price', 'normalize', {'method': 'robust'}),
+        ('count', 'normalize', {'method': 'zscore'}),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(1)
+        rows = 2000
+        # The sample misses most of the skewed tail, so its statistics differ from the column's
+        price = rng.lognormal(2, 1, rows)
+        price[rng.random(rows) < 0.1] = np.nan
+        self.frame = pd.DataFrame({
+            'price': price,
+            'count': pd.array(rng.integers(0, 100, rows), dtype='Int64'),
+            'city': rng.choice(['Paris', 'Rome', 'Oslo', None], rows, p=[0.5, 0.3, 0.1, 0.1]),
+        })
+        self.dataset_id, self.manifest = self.write(self.frame)
+
+    def test_sampled_rows_match_apply(self):
+        for column, operation, params in self.cases:
+            with self.subTest(column=column, operation=operation, **params):
+                preview = preview_cleaning(self.dataset_id, self.manifest, column, operation, params)
+                applied = self.frame.copy()
+                stats = apply_cleaning_operation(applied, column, operation, params)
+
+                self.assertNotIn('error', preview['stats'])
+                self.assertEqual(len(preview['rows']), preview['sample_rows'])
+                self.assertGreater(preview['changed_rows'], 0)
+                shown = preview['column']
+                for row in preview['rows'].itertuples():
+                    if row.status == 'removed':
+                        self.assertNotIn(row.row, applied.index)
+                    elif pd.isna(applied.at[row.row, shown]):
+                        self.assertTrue(pd.isna(row.after), row)
+                    elif isinstance(row.after, str):
+                        self.assertEqual(row.after, applied.at[row.row, shown])
+                    else:
+                        self.assertAlmostEqual(float(row.after), float(applied.at[row.row, shown]), places=9)
+                for key in ('original_min', 'original_max'):
+                    if key in stats:
+                        self.assertAlmostEqual(preview['stats'][key], float(stats[key]))
+
+
+class TextCleaningTests(SimpleTestCase):
+    def clean(self, values, **params):
+        df = pd.DataFrame({'text': values})
+        stats = apply_cleaning_operation(df, 'text', 'text-cleaning', params)
+        self.assertNotIn('error', stats)
+        return df['text']
+
+    def test_replacements_apply_in_order(self):
+        replacements = 'cat: dog\ndog: wolf\nw: W\n: ignored'
+        cleaned = self.clean(['cat', 'dog', 'hotdog', 'w', None], custom_replacements=replacements)
+        # Each line also rewrites what the lines before it put in, as str.replace line by line does
+        self.assertEqual(cleaned.tolist()[:4], ['Wolf', 'Wolf', 'hotWolf', 'W'])
+        self.assertTrue(pd.isna(cleaned[4]))
+
+    def test_keeps_missing_values(self):
+        for dtype in (object, 'str', 'category'):
+            with self.subTest(dtype=dtype):
+                series = pd.Series([' A ', None, np.nan, 'b '], dtype=dtype)
+                cleaned = self.clean(series, lowercase='true')
+                if dtype == 'category':
+                    self.assertIsInstance(cleaned.dtype, pd.CategoricalDtype)
+                else:
+                    self.assertEqual(cleaned.dtype, series.dtype)
+                self.assertEqual(cleaned.isna().tolist(), [False, True, True, False])
+                self.assertEqual(cleaned[cleaned.notna()].tolist(), ['a', 'b'])
+
+    def test_categorical_stays_categorical(self):
+        series = pd.Series(pd.Categorical([' High', 'low', 'high ', None, 'LOW'], ['low', 'LOW', ' High', 'high ']))
+        cleaned = self.clean(series, lowercase='true')
+
+        self.assertIsInstance(cleaned.dtype, pd.CategoricalDtype)
+        # Categories that clean to the same text are merged
+        self.assertEqual(cleaned.cat.categories.tolist(), ['low', 'high'])
+        self.assertEqual(cleaned.astype(object).tolist(), ['high', 'low', 'high', np.nan, 'low'])
+
+        ordered = series.cat.as_ordered()
+        self.assertTrue(self.clean(ordered, lowercase='true').cat.ordered)
+
+    def test_rejects_non_text_columns(self):
+        for values in ([1, 2, 3], [1.5, np.nan, 2.0], [True, False, True], pd.Categorical([1, 2, 1])):
+            with self.subTest(values=values):
+                df = pd.DataFrame({'value': values})
+                original = df['value'].copy()
+                stats = apply_cleaning_operation(df, 'value', 'text-cleaning', {'lowercase': 'true'})
+                self.assertEqual(stats, {'error': 'Column is not text'})
+                pd.testing.assert_series_equal(df['value'], original)
+
+                results = execute_plan(df, build_plan([
+                    {'column': 'value', 'operation': 'text-cleaning', 'lowercase': 'true'},
+                ]))
+                self.assertEqual(results[-1]['stats'], {'error': 'Column is not text'})
+
+
+class DuplicateFingerprintTests(StoreTestCase):
+    """Duplicates found by stored row fingerprints are those ``DataFrame.duplicated`` finds."""
+
+    def frame(self):
+        rows = [
+            (1.0, 2.0, 'x', 'red', '2024-01-01', 1),
+            # The same values in swapped columns
+            (2.0, 1.0, 'x', 'red', '2024-01-01', 1),
+            (np.nan, 2.0, None, np.nan, None, None),
+            (np.nan, np.nan, None, np.nan, None, None),
+            (0.0, 2.0, 'y', 'blue', '2024-01-02', 2),
+            (-0.0, 2.0, 'y', 'blue', '2024-01-02', 2),
+            (1.0, 2.0, 'y', 'red', '2024-01-01', None),
+        ]
+        picks = np.random.default_rng(24).integers(0, len(rows), 60)
+        df = pd.DataFrame([rows[pick] for pick in picks], columns=['a', 'b', 'text', 'colour', 'when', 'n'])
+        return df.astype({'colour': 'category', 'when': 'datetime64[ns]', 'n': 'Int64'})
+
+    def spy(self, dataset_id, manifest):
+        """``get_row_fingerprints`` for a version, recording the column sets it is asked for."""
+        calls = []
+
+        def fingerprints(columns):
+            calls.append(columns)
+            return get_row_fingerprints(dataset_id, manifest, columns)
+        return fingerprints, calls
+
+    def test_matches_pandas_duplicated(self):
+        dataset_id, manifest = self.write(self.frame())
+        df = read_dataset(dataset_id, manifest)
+        scopes = [
+            ({'scope': 'all'}, None),
+            ({'scope': 'selected', 'column': 'a'}, ['a']),
+            ({'scope': 'columns', 'subset_columns': ['b', 'a']}, ['b', 'a']),
+            ({'scope': 'columns', 'subset_columns': ['text', 'colour', 'when', 'n']}, ['text', 'colour', 'when', 'n']),
+        ]
+        for scope, subset in scopes:
+            for keep, pandas_keep in (('first', 'first'), ('last', 'last'), ('none', False)):
+                with self.subTest(subset=subset, keep=keep):
+                    duplicated = df.duplicated(subset, keep=pandas_keep)
+                    fingerprints, calls = self.spy(dataset_id, manifest)
+
+                    removed = df.copy()
+                    stats = remove_duplicates(removed, {**scope, 'keep': keep}, fingerprints)
+                    self.assertEqual(calls, [subset])
+                    pd.testing.assert_frame_equal(removed, df[~duplicated])
+                    self.assertEqual(stats['duplicates_removed'], duplicated.sum())
+
+                    marked = df.copy()
+                    remove_duplicates(marked, {**scope, 'action': 'mark'}, fingerprints)
+                    self.assertEqual(marked['is_duplicate'].tolist(), df.duplicated(subset, keep=False).tolist())
+
+    def test_swapped_values_are_not_duplicates(self):
+        df = pd.DataFrame({'a': [1.0, 2.0], 'b': [2.0, 1.0]})
+        dataset_id, manifest = self.write(df)
+        self.assertEqual(len(set(get_row_fingerprints(dataset_id, manifest).tolist())), 2)
+        self.assertEqual(remove_duplicates(df, {}, self.spy(dataset_id, manifest)[0])['rows_remaining'], 2)
+
+    def plan_frame(self):
+        # (NaN, 1) and (0, 1) only become duplicates once a's missing values are filled with zero
+        return pd.DataFrame({'a': [np.nan, 0.0, 0.0, 5.0], 'b': [1, 1, 2, 2], 'x': [np.nan, 1.0, np.nan, 3.0]})
+
+    def run_plan(self, steps):
+        dataset_id, manifest = self.write(self.plan_frame())
+        df = read_dataset(dataset_id, manifest)
+        expected = df.copy()
+        for step in steps:
+            apply_cleaning_operation(expected, step.get('column'), step['operation'], step)
+
+        fingerprints, calls = self.spy(dataset_id, manifest)
+        results = execute_plan(df, build_plan(steps), fingerprints=fingerprints)
+        pd.testing.assert_frame_equal(df, expected)
+        return results[-1]['stats'], calls
+
+    def test_plan_uses_fingerprints_of_untouched_columns(self):
+        stats, calls = self.run_plan([
+            {'column': 'x', 'operation': 'missing-values', 'action': 'fill-zero'},
+            {'operation': 'duplicates', 'scope': 'columns', 'subset_columns': ['a', 'b']},
+        ])
+        self.assertEqual(calls, [['a', 'b']])
+        self.assertEqual(stats['duplicates_removed'], 0)
+
+    def test_plan_does_not_use_fingerprints_of_changed_columns(self):
+        for scope in ({'scope': 'columns', 'subset_columns': ['a', 'b']}, {'scope': 'all'}):
+            with self.subTest(**scope):
+                stats, calls = self.run_plan([
+                    {'column': 'a', 'operation': 'missing-values', 'action': 'fill-zero'},
+                    {'operation': 'duplicates', **scope},
+                ])
+                self.assertEqual(calls, [])
+                self.assertEqual(stats['duplicates_removed'], 1 if scope['scope'] == 'columns' else 0)
+
+    def test_new_version_keeps_valid_fingerprints(self):
+        dataset_id, manifest = self.write(self.plan_frame())
+        _, new_manifest, _ = clean_dataset(dataset_id, manifest, 'x', 'missing-values', {'action': 'fill-zero'})
+
+        stored = get_row_fingerprints(dataset_id, new_manifest)
+        np.testing.assert_array_equal(stored, table_fingerprints(read_dataset_table(dataset_id, new_manifest)))
+        # Fingerprints over the columns the step did not touch are unchanged
+        untouched = get_row_fingerprints(dataset_id, new_manifest, ['a', 'b'])
+        np.testing.assert_array_equal(untouched, get_row_fingerprints(dataset_id, manifest, ['a', 'b']))
+
+
+class SerializerTests(SimpleTestCase):
+    def test_timestamps_keep_their_sub_second_values(self):
+        df = pd.DataFrame({
+            'us': pd.to_datetime(['2024-01-02', '2024-01-02 10:30:00.5', None], format='ISO8601'),
+            'ns': pd.to_datetime(['2024-01-02 10:30:00.123456789', '2024-01-02', None], format='ISO8601'),
+            'utc': pd.to_datetime(['2024-01-02 10:30:00.25', '2024-01-02 01:00', None], format='ISO8601', utc=True),
+        })
+        df['us_too'] = df['us']
+
+        columns = dataframe_to_columns(df)
+
+        self.assertEqual(columns['us'], ['2024-01-02T00:00:00', '2024-01-02T10:30:00.500000', None])
+        self.assertEqual(columns['us_too'], columns['us'])
+        self.assertEqual(columns['ns'], ['2024-01-02T10:30:00.123456789', '2024-01-02T00:00:00', None])
+        self.assertEqual(columns['utc'], ['2024-01-02T10:30:00.250000', '2024-01-02T01:00:00', None])
+
+    def test_missing_values_become_null(self):
+        df = pd.DataFrame({
+            'float': [1.5, np.nan],
+            'int': pd.array([1, None], dtype='Int64'),
+            'text': ['a', None],
+            'category': pd.Categorical(['x', None]),
+        })
+
+        records = dataframe_to_records(df)
+
+        self.assertEqual(records, [
+            {'float': 1.5, 'int': 1, 'text': 'a', 'category': 'x'},
+            {'float': None, 'int': None, 'text': None, 'category': None},
+        ])
+        self.assertNotIn('NaN', dumps(records))
+
+
+class IngestCsvTests(StoreTestCase):
+    def ingest(self, data, engine):
+        dataset_id = new_dataset_id()
+        with self.settings(CSV_PARSER_ENGINE=engine):
+            manifest, metrics = ingest_csv(
+                io.BytesIO(data), lambda chunks: write_dataset_chunks(dataset_id, chunks), 'upload.csv',
+            )
+        return read_dataset(dataset_id, manifest), metrics
+
+    def assertEnginesAgree(self, data):
+        expected, _ = self.ingest(data, 'c')
+        for engine in ('pyarrow', 'python'):
+            with self.subTest(engine=engine):
+                df, metrics = self.ingest(data, engine)
+                self.assertEqual(metrics['engine'], engine)
+                pd.testing.assert_frame_equal(df, expected)
+        return expected
+
+    def test_engines_agree(self):
+        df = self.assertEnginesAgree(b'id,price,day,name\n1,2.5,2024-01-02,a\n2,,2024-02-03,\n3,4.0,,c\n')
+        self.assertEqual(list(df.columns), ['id', 'price', 'day', 'name'])
+
+    def test_headerless_columns_are_numbered_alike(self):
+        df = self.assertEnginesAgree(b'1,2.5,7\n3,4.5,8\n')
+        self.assertEqual(list(df.columns), ['0', '1', '2'])
+        self.assertEqual(len(df), 2)
+
+    def test_falls_back_to_the_c_engine(self):
+        # pyarrow rejects the short last row, which the C engine fills with NaN
+        data = b'a,b,c\n1,2,3\n4,5\n'
+        expected, _ = self.ingest(data, 'c')
+
+        df, metrics = self.ingest(data, 'auto')
+
+        self.assertEqual(metrics['engine'], 'c')
+        self.assertTrue(metrics['fallback'])
+        pd.testing.assert_frame_equal(df, expected)
+        self.assertTrue(np.isnan(df['c'].iloc[1]))
+
+
+class ViewTestCase(StoreTestCase, TestCase):
+    """A logged-in client whose session holds one dataset."""
+
+    def setUp(self):
+        super().setUp()
+        user = get_user_model().objects.create_user('analyst', 'analyst@example.com', 'password')
+        self.client.force_login(user)
+        self.dataset_id = new_dataset_id()
+        write_dataset(self.dataset_id, pd.DataFrame({'price': [1.0, np.nan, 3.0], 'name': ['a', 'b', None]}))
+        self.set_session(dataset_id=self.dataset_id)
+
+    def set_session(self, **values):
+        session = self.client.session
+        for key, value in values.items():
+            if value is None:
+                session.pop(key, None)
+            else:
+                session[key] = value
+        session.save()
+
+    # Requests are made over HTTPS, as SECURE_SSL_REDIRECT is on outside DEBUG
+    def get(self, name, params=None, **kwargs):
+        return self.client.get(reverse(f'main:{name}', kwargs=kwargs), params, secure=True)
+
+    def post(self, name, data):
+        return self.client.post(reverse(f'main:{name}'), data, secure=True)
+
+    def post_json(self, name, body):
+        return self.client.post(reverse(f'main:{name}'), json.dumps(body), content_type='application/json', secure=True)
+
+
+class AnalysisViewTests(ViewTestCase):
+    def test_reads_the_manifest_and_preview_rows_only(self):
+        rng = np.random.default_rng(3)
+        frame = pd.DataFrame({
+            'price': np.where(rng.random(120) < 0.3, np.nan, rng.normal(10, 2, 120)),
+            'name': rng.choice(['a', 'b', None], 120),
+        })
+        write_dataset(self.dataset_id, frame)
+
+        with mock.patch('accounts.utils.read_dataset') as read:
+            response = self.get('analysis')
+
+        self.assertEqual(response.status_code, 200)
+        read.assert_not_called()
+        self.assertEqual(get_dataframe_cache().stats()['entries'], 0)
+        self.assertEqual(response.context['file_info'], {
+            'rows': 120,
+            'columns': 2,
+            'column_names': ['price', 'name'],
+            'data_types': frame.dtypes.astype(str).to_dict(),
+            'missing_values': frame.isnull().sum().to_dict(),
+        })
+        self.assertEqual(response.context['table_data'], dataframe_to_records(frame.head(50)))
+
+    def test_redirects_without_a_dataset(self):
+        self.set_session(dataset_id=None)
+        self.assertRedirects(self.get('analysis'), reverse('main:home'), fetch_redirect_response=False)
+
+
+class ApplyCleaningViewTests(ViewTestCase):
+    fill = {'column': 'price', 'operation': 'missing-values', 'action': 'fill-zero'}
+
+    def test_login_required(self):
+        self.client.logout()
+
+        response = self.post('apply_cleaning', self.fill)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(read_manifest(self.dataset_id)['version'], 1)
+
+    def test_apply_cleaning(self):
+        fill = {**self.fill, 'version': '1'}
+
+        self.assertEqual(self.get('apply_cleaning').status_code, 405)
+        self.assertEqual(self.post('apply_cleaning', {'column': 'price'}).status_code, 400)
+        self.assertEqual(self.post('apply_cleaning', {**fill, 'version': 'latest'}).status_code, 400)
+        self.assertEqual(self.post('apply_cleaning', {**fill, 'column': 'missing'}).status_code, 400)
+
+        response = self.post('apply_cleaning', fill)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(response.json()['version'], 2)
+        self.assertEqual(read_dataset(self.dataset_id)['price'].tolist(), [1.0, 0.0, 3.0])
+
+        # Version 1 is no longer the current one
+        self.assertEqual(self.post('apply_cleaning', fill).status_code, 409)
+        self.assertEqual(read_manifest(self.dataset_id)['version'], 2)
+
+    def test_without_a_dataset(self):
+        self.set_session(dataset_id=None)
+
+        self.assertEqual(self.post('apply_cleaning', self.fill).status_code, 404)
+        # Datasets outside the session are not reachable by ID
+        self.assertEqual(self.post('apply_cleaning', {**self.fill, 'dataset_id': self.dataset_id}).status_code, 404)
+
+
+class ApplyCleaningPlanViewTests(ViewTestCase):
+    steps = [
+        {'column': 'price', 'operation': 'missing-values', 'action': 'fill-zero'},
+        {'column': 'price', 'operation': 'normalize', 'method': 'minmax'},
+    ]
+
+    def test_invalid_steps(self):
+        self.assertEqual(self.post_json('apply_cleaning_plan', {'steps': []}).status_code, 400)
+        unknown = {'steps': [{'column': 'price', 'operation': 'unknown'}]}
+        self.assertEqual(self.post_json('apply_cleaning_plan', unknown).status_code, 400)
+
+    def test_dry_run_writes_nothing(self):
+        response = self.post_json('apply_cleaning_plan', {'steps': self.steps, 'dry_run': True})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['plan']), 1)
+        self.assertEqual(read_manifest(self.dataset_id)['version'], 1)
+
+    def test_apply_plan(self):
+        response = self.post_json('apply_cleaning_plan', {'steps': self.steps, 'version': 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], 2)
+        self.assertEqual(read_dataset(self.dataset_id)['price'].tolist(), [1 / 3, 0.0, 1.0])
+        self.assertEqual(self.post_json('apply_cleaning_plan', {'steps': self.steps, 'version': 1}).status_code, 409)
+
+
+class VersionViewTests(ViewTestCase):
+    def test_undo_redo_and_checkout(self):
+        self.post('apply_cleaning', {'column': 'price', 'operation': 'missing-values', 'action': 'fill-zero'})
+
+        response = self.get('api_versions')
+        self.assertEqual([entry['version'] for entry in response.json()['versions']], [1, 2])
+        self.assertTrue(response.json()['can_undo'])
+
+        response = self.post('api_versions', {'action': 'undo'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], 1)
+        self.assertTrue(response.json()['can_redo'])
+        self.assertEqual(self.post('api_versions', {'action': 'undo'}).status_code, 409)
+
+        response = self.post('api_versions', {'action': 'redo'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], 2)
+        self.assertEqual(self.post('api_versions', {'action': 'redo'}).status_code, 409)
+
+        self.assertEqual(self.post('api_versions', {'action': 'checkout', 'version': '1'}).status_code, 200)
+        self.assertEqual(self.post('api_versions', {'action': 'checkout', 'version': '9'}).status_code, 409)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.post('api_versions', {'action': 'checkout'}).status_code, 400)
+        self.assertEqual(self.post('api_versions', {'action': 'rewind'}).status_code, 400)
+        self.set_session(dataset_id=None)
+        self.assertEqual(self.get('api_versions').status_code, 404)
+
+
+class PreviewCleaningViewTests(ViewTestCase):
+    fill = {'column': 'price', 'operation': 'missing-values', 'action': 'fill-zero'}
+
+    def test_preview_writes_nothing(self):
+        response = self.post('preview_cleaning', self.fill)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(read_manifest(self.dataset_id)['version'], 1)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.post('preview_cleaning', {**self.fill, 'column': 'missing'}).status_code, 400)
+        self.set_session(dataset_id=None)
+        self.assertEqual(self.post('preview_cleaning', self.fill).status_code, 404)
+
+
+@override_settings(INGEST_BACKEND='sync')
+class IngestionJobTests(ViewTestCase):
+    csv = b'id,price\n1,2.5\n2,\n3,4.0\n'
+
+    def upload(self, name='upload.csv', data=csv, **fields):
+        return self.client.post(
+            reverse('main:upload_file'), {'file': SimpleUploadedFile(name, data), **fields}, secure=True,
+        )
+
+    def session_job(self):
+        return IngestionJob.objects.get(pk=self.client.session[INGEST_JOB_SESSION_KEY])
+
+    def test_job_runs_to_finished(self):
+        statuses = []
+
+        def write_chunks(dataset_id, chunks, **kwargs):
+            statuses.append(IngestionJob.objects.get().status)
+            return write_dataset_chunks(dataset_id, chunks, **kwargs)
+
+        with mock.patch('main.jobs.write_dataset_chunks', write_chunks):
+            self.assertRedirects(self.upload(), reverse('main:analysis'), fetch_redirect_response=False)
+
+        job = self.session_job()
+        self.assertEqual(statuses, [IngestionJob.STATUS_RUNNING])
+        self.assertEqual(job.status, IngestionJob.STATUS_FINISHED)
+        self.assertEqual(job.rows_read, 3)
+        self.assertEqual(job.bytes_parsed, job.bytes_total)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(read_dataset(job.dataset_id)['id'].tolist(), [1, 2, 3])
+        # The spooled upload is removed once parsed
+        self.assertFalse(any(path.name.startswith('.upload-') for path in get_dataset_dir(job.dataset_id).iterdir()))
+
+    def test_new_job_is_pending(self):
+        job = create_ingestion_job(SimpleUploadedFile('upload.csv', self.csv), new_dataset_id())
+
+        self.assertEqual(job.status, IngestionJob.STATUS_PENDING)
+        self.assertEqual(job.bytes_total, len(self.csv))
+        self.assertEqual(job.progress, 0.0)
+
+    def test_failed_job_reports_its_error(self):
+        self.upload('upload.xlsx', b'not a workbook')
+
+        job = self.session_job()
+        self.assertEqual(job.status, IngestionJob.STATUS_FAILED)
+        self.assertTrue(job.error)
+
+        response = self.get('api_job_status', job_id=job.id)
+        self.assertEqual(response.json()['status'], IngestionJob.STATUS_FAILED)
+        self.assertEqual(response.json()['redirect'], reverse('main:analysis'))
+
+    def test_polling(self):
+        self.upload()
+        job = self.session_job()
+
+        response = self.get('api_job_status', job_id=job.id)
+
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(payload['status'], IngestionJob.STATUS_FINISHED)
+        self.assertEqual(payload['progress'], 1.0)
+        self.assertEqual(payload['rows_read'], 3)
+        self.assertEqual(payload['bytes_parsed'], len(self.csv))
+        self.assertEqual(payload['redirect'], reverse('main:analysis'))
+
+    def test_polling_is_limited_to_the_job_owner(self):
+        self.upload()
+        job = self.session_job()
+        url = reverse('main:api_job_status', kwargs={'job_id': job.id})
+
+        self.assertEqual(Client().get(url, secure=True).status_code, 404)
+        other = Client()
+        other.force_login(get_user_model().objects.create_user('other', 'other@example.com', 'password'))
+        self.assertEqual(other.get(url, secure=True).status_code, 404)
+        # The uploading user can poll from another session
+        owner = Client()
+        owner.force_login(job.user)
+        self.assertEqual(owner.get(url, secure=True).status_code, 200)
+        self.assertEqual(self.get('api_job_status', job_id=IngestionJob().id).status_code, 404)
+
+    @override_settings(INGEST_JOB_TIMEOUT=60)
+    def test_stale_job_expires(self):
+        fresh = create_ingestion_job(SimpleUploadedFile('upload.csv', self.csv), new_dataset_id())
+        stale = create_ingestion_job(SimpleUploadedFile('upload.csv', self.csv), new_dataset_id())
+        IngestionJob.objects.filter(pk=stale.pk).update(
+            status=IngestionJob.STATUS_RUNNING, updated_at=timezone.now() - timedelta(seconds=61),
+        )
+
+        for job, status in ((fresh, IngestionJob.STATUS_PENDING), (stale, IngestionJob.STATUS_FAILED)):
+            with self.subTest(status=status):
+                self.set_session(**{INGEST_JOB_SESSION_KEY: str(job.id)})
+                response = self.get('api_job_status', job_id=job.id)
+                self.assertEqual(response.json()['status'], status)
+                self.assertEqual(IngestionJob.objects.get(pk=job.pk).status, status)
+        self.assertIsNotNone(IngestionJob.objects.get(pk=stale.pk).finished_at)
+
+
+def workbook_bytes(sheets):
+    """An .xlsx file with a sheet of rows for each name in ``sheets``."""
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for name, rows in sheets.items():
+        sheet = workbook.create_sheet(name)
+        for row in rows:
+            sheet.append(row)
+    data = io.BytesIO()
+    workbook.save(data)
+    return data.getvalue()
+
+
+class ExcelReaderTests(SimpleTestCase):
+    sheets = {
+        'Sales': [['region', 'amount'], ['north', 10], ['south', None], [None, None], ['east', 30]],
+        'Blank header': [[None, 'b', None], [1, 2, 3], [4, 5, 6]],
+        'Repeated header': [['a', 'a', None, 'a'], [1, 2, 3, 4]],
+        'Empty': [],
+    }
+
+    def setUp(self):
+        self.file = io.BytesIO(workbook_bytes(self.sheets))
+
+    def read(self, sheet_name, chunk_rows=None):
+        return pd.concat(list(read_excel_chunks(self.file, sheet_name, chunk_rows=chunk_rows)), ignore_index=True)
+
+    def test_lists_sheets_with_row_counts(self):
+        self.assertEqual(list_excel_sheets(self.file), [
+            {'name': 'Sales', 'rows': 4},
+            {'name': 'Blank header', 'rows': 2},
+            {'name': 'Repeated header', 'rows': 1},
+            {'name': 'Empty', 'rows': 0},
+        ])
+
+    def test_reads_the_selected_sheet_in_chunks(self):
+        chunks = list(read_excel_chunks(self.file, 'Sales', chunk_rows=2))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+        # Blank rows are skipped
+        self.assertEqual(pd.concat(chunks)['region'].tolist(), ['north', 'south', 'east'])
+
+    def test_headers_are_named_like_pandas(self):
+        for sheet_name in ('Blank header', 'Repeated header', 'Empty'):
+            with self.subTest(sheet_name=sheet_name):
+                expected = pd.read_excel(io.BytesIO(self.file.getvalue()), sheet_name=sheet_name)
+                df = self.read(sheet_name, chunk_rows=1)
+                self.assertEqual(list(df.columns), list(expected.columns))
+                self.assertEqual(df.values.tolist(), expected.values.tolist())
+
+    def test_sheet_without_a_header_row(self):
+        file = io.BytesIO(workbook_bytes({'Data': [[None, None], [1, 2], [3, 4]]}))
+
+        df = pd.concat(list(read_excel_chunks(file, 'Data')))
+
+        self.assertEqual(list(df.columns), ['Unnamed: 0', 'Unnamed: 1'])
+        self.assertEqual(df.values.tolist(), [[1, 2], [3, 4]])
+
+
+@override_settings(INGEST_BACKEND='sync')
+class ExcelUploadTests(ViewTestCase):
+    workbook = workbook_bytes({
+        'First': [['a'], [1], [2]],
+        'Second': [['b', 'c'], ['x', 1.5]],
+        'Third': [['d'], [True]],
+    })
+
+    def upload(self, **fields):
+        upload = SimpleUploadedFile('book.xlsx', self.workbook)
+        self.client.post(reverse('main:upload_file'), {'file': upload, **fields}, secure=True)
+        return IngestionJob.objects.get(pk=self.client.session[INGEST_JOB_SESSION_KEY])
+
+    def test_first_sheet_by_default(self):
+        job = self.upload()
+
+        self.assertEqual(job.status, IngestionJob.STATUS_FINISHED)
+        self.assertEqual(read_dataset(job.dataset_id)['a'].tolist(), [1, 2])
+        self.assertEqual([sheet.get('dataset_id') for sheet in job.sheets], [job.dataset_id, None, None])
+
+    def test_selected_sheet(self):
+        job = self.upload(sheet='Second')
+
+        self.assertEqual(job.rows_read, 1)
+        self.assertEqual(list(read_dataset(job.dataset_id).columns), ['b', 'c'])
+
+    def test_unknown_sheet_fails_the_job(self):
+        job = self.upload(sheet='Missing')
+
+        self.assertEqual(job.status, IngestionJob.STATUS_FAILED)
+        self.assertIn('First, Second, Third', job.error)
+
+    def test_all_sheets_become_session_datasets(self):
+        job = self.upload(all_sheets='1')
+        self.assertEqual(job.rows_read, 4)
+
+        self.get('analysis')
+
+        datasets = self.client.session[DATASETS_SESSION_KEY]
+        self.assertEqual([dataset['name'] for dataset in datasets], ['First', 'Second', 'Third'])
+        self.assertEqual(datasets[0]['id'], job.dataset_id)
+        self.assertEqual(len({dataset['id'] for dataset in datasets}), 3)
+        self.assertEqual(read_dataset(datasets[2]['id'])['d'].tolist(), [True])
+        self.assertEqual(self.client.session['dataset_id'], job.dataset_id)
+
+        self.get('analysis', {'dataset': datasets[1]['id']})
+        self.assertEqual(self.client.session['dataset_id'], datasets[1]['id'])
+        # Datasets outside the upload cannot be activated
+        self.get('analysis', {'dataset': new_dataset_id()})
+        self.assertEqual(self.client.session['dataset_id'], datasets[1]['id'])
+
+
+@override_settings(ROWS_API_MAX_LIMIT=10)
+class RowsApiTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.frame = pd.DataFrame({
+            'n': np.arange(25),
+            'price': np.where(np.arange(25) % 5 == 0, np.nan, np.arange(25) / 2),
+            'day': pd.date_range('2024-01-01', periods=25, freq='D'),
+        })
+        write_dataset(self.dataset_id, self.frame)
+
+    def rows(self, **params):
+        return self.get('api_rows', params)
+
+    def test_window_as_columns(self):
+        payload = self.rows(offset=4, limit=3).json()
+
+        self.assertEqual(
+            {key: payload[key] for key in ('offset', 'limit', 'returned_rows', 'total_rows', 'columns')},
+            {'offset': 4, 'limit': 3, 'returned_rows': 3, 'total_rows': 25, 'columns': ['n', 'price', 'day']},
+        )
+        self.assertEqual(payload['data'], {
+            'n': [4, 5, 6],
+            'price': [2.0, None, 3.0],
+            'day': ['2024-01-05T00:00:00', '2024-01-06T00:00:00', '2024-01-07T00:00:00'],
+        })
+
+    def test_limit_is_capped(self):
+        payload = self.rows().json()
+
+        self.assertEqual(payload['limit'], 10)
+        self.assertEqual(payload['data']['n'], list(range(10)))
+
+    def test_window_past_the_end(self):
+        self.assertEqual(self.rows(offset=20, limit=10).json()['data']['n'], list(range(20, 25)))
+        payload = self.rows(offset=100).json()
+        self.assertEqual(payload['returned_rows'], 0)
+        self.assertEqual(payload['data'], {'n': [], 'price': [], 'day': []})
+
+    def test_column_projection(self):
+        response = self.client.get(reverse('main:api_rows'), {'columns': ['price', 'n'], 'limit': 2}, secure=True)
+
+        self.assertEqual(response.json()['columns'], ['price', 'n'])
+        self.assertEqual(response.json()['data'], {'price': [None, 0.5], 'n': [0, 1]})
+
+    def test_cached_frame_gives_the_same_rows(self):
+        expected = self.rows(offset=3, limit=4, columns='day').json()
+        manifest = read_manifest(self.dataset_id)
+        get_dataframe_cache().put((self.dataset_id, manifest['version']), read_dataset(self.dataset_id, manifest))
+
+        self.assertEqual(self.rows(offset=3, limit=4, columns='day').json(), expected)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.rows(columns='missing').status_code, 400)
+        self.assertEqual(self.rows(offset=-1).status_code, 400)
+        self.assertEqual(self.rows(limit='all').status_code, 400)
+        self.set_session(dataset_id=None)
+        self.assertEqual(self.rows().status_code, 404)
+
+
+class TableQueryTests(SimpleTestCase):
+    frame = pd.DataFrame({
+        'name': ['banana', 'Apple', None, 'cherry', 'apple', 'Banana', 'date', None],
+        'price': [3.0, np.nan, 1.0, 2.0, 2.0, np.nan, 5.0, 2.0],
+        'day': pd.to_datetime(['2024-03-01', '2024-01-01', None, '2024-02-01', '2024-01-01', None, '2024-05-01',
+                               '2024-04-01']),
+        'kind': pd.Categorical(['b', 'a', 'a', None, 'B', 'c', 'a', 'b']),
+    })
+    dataset_key = ('dataset', 1)
+
+    def setUp(self):
+        self.addCleanup(get_query_cache().clear)
+
+    def query(self, **kwargs):
+        return query_table(self.frame, self.dataset_key, **kwargs)
+
+    def expected_order(self, columns, ascending):
+        # Text sorts case-insensitively; pandas puts missing values last in either direction
+        keys = self.frame[columns].assign(name=self.frame['name'].str.lower())[columns]
+        return keys.sort_values(columns, ascending=ascending, na_position='last', kind='stable').index.tolist()
+
+    def test_sorts_by_several_keys_with_missing_values_last(self):
+        for sort in (
+            [('price', False)],
+            [('price', False), ('name', False)],
+            [('price', True), ('name', False)],
+            [('name', True), ('day', True)],
+            [('day', False), ('price', True)],
+        ):
+            with self.subTest(sort=sort):
+                _, row_ids, matched = self.query(sort=sort, limit=100)
+                columns = [column for column, _ in sort]
+                ascending = [not descending for _, descending in sort]
+                self.assertEqual(row_ids, self.expected_order(columns, ascending))
+                self.assertEqual(matched, len(self.frame))
+
+    def test_sorts_categories_by_their_lowercased_value(self):
+        _, row_ids, _ = self.query(sort=[('kind', False)], limit=100)
+
+        self.assertEqual(self.frame['kind'].iloc[row_ids].tolist(), ['a', 'a', 'a', 'b', 'B', 'b', 'c', np.nan])
+
+    def test_filter_search_and_page(self):
+        filters = [('price', 'gte', '2'), ('day', 'notnull', None)]
+        matches = (self.frame['price'] >= 2) & self.frame['day'].notna()
+        expected = self.frame.index[matches].tolist()
+
+        page, row_ids, matched = self.query(filters=filters, offset=1, limit=2)
+
+        self.assertEqual(matched, len(expected))
+        self.assertEqual(row_ids, expected[1:3])
+        pd.testing.assert_frame_equal(page, self.frame.iloc[expected[1:3]])
+
+        searched = matches & self.frame['name'].str.contains('a', case=False, na=False)
+        _, row_ids, matched = self.query(
+            sort=[('price', True)], filters=filters, search='A', search_columns=['name'], limit=10,
+        )
+        self.assertEqual(matched, 3)
+        self.assertEqual(row_ids, self.frame[searched].sort_values('price', ascending=False).index.tolist())
+
+    def test_filter_operations(self):
+        for filters, expected in (
+            ([('name', 'contains', 'APP')], [1, 4]),
+            ([('name', 'eq', 'date')], [6]),
+            ([('price', 'lt', '2')], [2]),
+            ([('price', 'isnull', None)], [1, 5]),
+            ([('day', 'gt', '2024-03-01')], [6, 7]),
+            # Missing values are not equal to anything, as in pandas
+            ([('name', 'ne', 'date'), ('price', 'lte', '2')], [2, 3, 4, 7]),
+        ):
+            with self.subTest(filters=filters):
+                self.assertEqual(self.query(filters=filters, limit=100)[1], expected)
+
+    def test_unfiltered_pages(self):
+        page, row_ids, matched = self.query(offset=6, limit=5, columns=['price'])
+
+        self.assertEqual(row_ids, [6, 7])
+        self.assertEqual(matched, 8)
+        self.assertEqual(list(page.columns), ['price'])
+
+    def test_repeat_queries_are_served_from_the_cache(self):
+        sort = [('price', True), ('name', False)]
+        with mock.patch('main.table_query._sort_order', wraps=_sort_order) as sort_order:
+            first = self.query(sort=sort, filters=[('price', 'notnull', None)], limit=3)[1]
+            second = self.query(sort=sort, filters=[('price', 'notnull', None)], offset=3, limit=3)[1]
+
+        self.assertEqual(sort_order.call_count, 1)
+        self.assertEqual(first + second, self.query(sort=sort, filters=[('price', 'notnull', None)], limit=6)[1])
+
+    def test_sort_keys_are_shared_between_queries_of_a_version(self):
+        with mock.patch('main.table_query._compute_sort_key', wraps=_compute_sort_key) as compute:
+            self.query(sort=[('price', False)])
+            self.query(sort=[('price', True)], search='a')
+            self.assertEqual(compute.call_count, 1)
+
+            query_table(self.frame, ('dataset', 2), sort=[('price', False)])
+            self.assertEqual(compute.call_count, 2)
+
+    def test_parse_sort_and_filters(self):
+        columns = list(self.frame.columns)
+
+        self.assertEqual(parse_sort('[{"column": "price", "direction": "desc"}]', columns), [('price', True)])
+        self.assertEqual(parse_filters('[{"column": "name", "value": ""}, {"column": "day", "op": "isnull"}]', columns),
+                         [('day', 'isnull', None)])
+        for raw in ('{}', '[{"column": "missing"}]', '[{"column": "price", "direction": "up"}]', 'not json'):
+            with self.subTest(raw=raw), self.assertRaises(ValueError):
+                parse_sort(raw, columns)
+        with self.assertRaises(ValueError):
+            parse_filters('[{"column": "price", "op": "like", "value": 1}]', columns)
+        with self.assertRaises(ValueError):
+            self.query(filters=[('price', 'gt', 'cheap')])
+
+
+class ProfileTests(SimpleTestCase):
+    def test_numeric_profile_matches_pandas(self):
+        series = pd.Series([4.0, 1.0, np.nan, 2.5, 1.0, 10.0, -3.0, 0.0, 7.5, 1.0, 100.0])
+        values = series.dropna()
+
+        profile = profile_column('x', series, len(series))
+
+        self.assertEqual(profile['type'], 'numeric')
+        describe = values.describe()
+        self.assertEqual(
+            {key: profile['basic'][key] for key in ('count', 'missing', 'min', 'max', 'mode')},
+            {'count': 10, 'missing': 1, 'min': -3.0, 'max': 100.0, 'mode': [1.0]},
+        )
+        self.assertAlmostEqual(profile['basic']['sum'], values.sum())
+        self.assertAlmostEqual(profile['basic']['mean'], describe['mean'])
+        self.assertAlmostEqual(profile['basic']['median'], describe['50%'])
+        self.assertAlmostEqual(profile['dispersion']['stdDev'], describe['std'])
+        self.assertAlmostEqual(profile['dispersion']['q1'], describe['25%'])
+        self.assertAlmostEqual(profile['dispersion']['q3'], describe['75%'])
+        self.assertAlmostEqual(profile['shape']['skewness'], values.skew())
+        self.assertAlmostEqual(profile['shape']['kurtosis'], values.kurt())
+        self.assertAlmostEqual(profile['percentiles']['p90'], np.quantile(values, 0.9))
+        iqr = describe['75%'] - describe['25%']
+        outliers = ((values < describe['25%'] - 1.5 * iqr) | (values > describe['75%'] + 1.5 * iqr)).sum()
+        self.assertEqual(profile['shape']['outliers'], outliers)
+        self.assertEqual(sum(bucket['count'] for bucket in profile['distribution']), 10)
+        self.assertEqual(
+            [profile['dataQuality'][key] for key in ('zeroCount', 'negativeCount', 'positiveCount')], [1, 1, 8],
+        )
+
+    def test_nullable_and_all_missing_numbers(self):
+        profile = profile_column('x', pd.Series([1, None, 3], dtype='Int64'), 3)
+        self.assertEqual((profile['basic']['count'], profile['basic']['mean']), (2, 2.0))
+
+        profile = profile_column('x', pd.Series([np.nan, np.nan]), 2)
+        self.assertEqual(profile, {'type': 'empty', 'column': 'x', 'basic': {'count': 0, 'missing': 2}})
+
+    def test_text_profile(self):
+        series = pd.Series(['b', 'a', 'b', None, '', 'null', 'b', 'c', 'a'])
+
+        profile = profile_column('x', series, len(series), top_k=2)
+
+        self.assertEqual(profile['type'], 'categorical')
+        self.assertEqual(profile['basic']['count'], 8)
+        self.assertEqual(profile['basic']['missing'], 1)
+        self.assertEqual(profile['basic']['uniqueValues'], 5)
+        self.assertEqual((profile['basic']['mostFrequent'], profile['basic']['mostFrequentCount']), ('b', 3))
+        self.assertEqual([bucket['value'] for bucket in profile['distribution']], ['b', 'a'])
+        self.assertEqual(profile['dataQuality']['emptyStringCount'], 1)
+        self.assertEqual(profile['dataQuality']['nullLikeCount'], 1)
+        self.assertEqual(profile['dataQuality']['validValues'], 6)
+
+    def test_categorical_profile_skips_unused_categories(self):
+        series = pd.Series(pd.Categorical(['x', 'y', 'x'], categories=['x', 'y', 'z']))
+
+        profile = profile_column('x', series, 3)
+
+        self.assertEqual(profile['basic']['uniqueValues'], 2)
+        self.assertEqual([bucket['value'] for bucket in profile['distribution']], ['x', 'y'])
+
+    def test_datetime_profile(self):
+        series = pd.Series(pd.to_datetime(['2024-01-02', '2024-01-02', None, '2024-03-04 10:30:00'], format='ISO8601'))
+
+        profile = profile_column('x', series, len(series))
+
+        # Dates are profiled by their distinct values, like text
+        self.assertEqual(profile['type'], 'categorical')
+        self.assertEqual(profile['basic']['count'], 3)
+        self.assertEqual(profile['basic']['uniqueValues'], 2)
+        self.assertEqual(profile['basic']['mostFrequent'], '2024-01-02 00:00:00')
+        self.assertEqual(profile['distribution'][1]['value'], '2024-03-04 10:30:00')
+
+    def test_booleans_are_not_numeric(self):
+        profile = profile_column('x', pd.Series([True, False, True]), 3)
+
+        self.assertEqual(profile['type'], 'categorical')
+        self.assertEqual(profile['basic']['mostFrequent'], 'True')
+
+
+class ProfileApiTests(ViewTestCase):
+    def profile(self, **params):
+        return self.get('api_profile', params)
+
+    def test_profile_of_every_column(self):
+        payload = self.profile().json()
+
+        self.assertEqual(payload['rows'], 3)
+        self.assertEqual(list(payload['columns']), ['price', 'name'])
+        self.assertEqual(payload['columns']['price']['basic']['mean'], 2.0)
+        self.assertEqual(payload['columns']['name']['basic']['uniqueValues'], 2)
+
+    def test_column_selection(self):
+        self.assertEqual(list(self.profile(columns='name').json()['columns']), ['name'])
+        self.assertEqual(self.profile(columns='missing').status_code, 400)
+        self.set_session(dataset_id=None)
+        self.assertEqual(self.profile().status_code, 404)
+
+    def test_profile_is_computed_once_per_version(self):
+        with mock.patch('main.profiling.profile_dataset', wraps=profile_dataset) as compute:
+            first = self.profile().json()
+            self.assertEqual(self.profile().json(), first)
+            self.assertEqual(compute.call_count, 1)
+
+            # The stored profile is used once the worker's cache is gone
+            get_query_cache().clear()
+            self.assertEqual(self.profile().json(), first)
+            self.assertEqual(compute.call_count, 1)
+
+            self.post('apply_cleaning', {'column': 'price', 'operation': 'missing-values', 'action': 'fill-zero'})
+            second = self.profile().json()
+            self.assertEqual(compute.call_count, 2)
+
+        self.assertEqual(second['columns']['price']['basic']['count'], 3)
+        self.assertEqual(second['columns']['price']['basic']['mean'], 4 / 3)
+        # The earlier version keeps its own profile
+        manifest = checkout_version(self.dataset_id, 1)
+        self.assertEqual(json.loads(get_dataset_profile(self.dataset_id, manifest)), first)
+
+
+class ParallelProfileTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(7)
+        frame = pd.DataFrame({f'n{i}': rng.normal(i, 1 + i, 500) for i in range(6)})
+        frame['n0'] = frame['n0'].mask(frame['n0'] > 0.5)
+        frame['text'] = rng.choice(['a', 'b', 'c', None], 500)
+        frame['day'] = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 30, 500), unit='D')
+        frame['flag'] = rng.random(500) > 0.3
+        self.dataset_id, base = self.write(frame)
+        # Derived columns are in the new version's file, the others in the parent's
+        self.frame = frame.assign(n1=frame['n1'].round(), extra=frame['n2'] * 2)
+        self.manifest = write_dataset(self.dataset_id, self.frame, base=base, changed_columns={'n1', 'extra'})
+        self.addCleanup(profiling._reset_pool)
+
+    def test_pool_matches_the_serial_path(self):
+        with mock.patch.object(profiling, 'get_pool_size', return_value=2), \
+                mock.patch.object(profiling, 'PARALLEL_MIN_COLUMNS', 2), \
+                mock.patch.object(profiling, '_get_pool', wraps=profiling._get_pool) as get_pool, \
+                self.assertNoLogs('main.profiling', level='ERROR'):
+            profiles = profile_dataset(self.dataset_id, self.manifest)
+
+        get_pool.assert_called_once()
+        self.assertEqual(list(profiles), list(self.frame.columns))
+        self.assertEqual(dumps(profiles), dumps(profile_frame(self.frame)))
+
+    def test_narrow_frames_are_profiled_in_process(self):
+        with mock.patch.object(profiling, 'get_pool_size', return_value=2), \
+                mock.patch.object(profiling, '_get_pool') as get_pool:
+            profiles = profile_dataset(self.dataset_id, {**self.manifest, 'columns': self.manifest['columns'][:3]})
+
+        get_pool.assert_not_called()
+        self.assertEqual(list(profiles), ['n0', 'n1', 'n2'])
+
+    def test_broken_pool_falls_back_to_the_serial_path(self):
+        pool = mock.Mock()
+        pool.map.side_effect = profiling.BrokenProcessPool
+        with mock.patch.object(profiling, 'get_pool_size', return_value=2), \
+                mock.patch.object(profiling, '_get_pool', return_value=pool), self.assertLogs('main.profiling'):
+            profiles = profile_dataset(self.dataset_id, self.manifest)
+
+        self.assertEqual(dumps(profiles), dumps(profile_frame(self.frame)))
+
+
+class CorrelationTests(StoreTestCase):
+    def frame(self, missing):
+        rng = np.random.default_rng(3)
+        rows = 300
+        df = pd.DataFrame({
+            'a': rng.normal(size=rows),
+            'ties': rng.integers(0, 6, rows).astype(float),
+            'counts': pd.array(rng.integers(0, 4, rows), dtype='Int64'),
+            'c': rng.exponential(size=rows),
+            'flag': rng.random(rows) > 0.5,
+            'label': rng.choice(['x', 'y'], rows),
+        })
+        df['b'] = df['a'] * 0.3 + rng.normal(size=rows)
+        df['rank_only'] = np.exp(df['a'] * 5)
+        if missing:
+            for column, share in (('a', 0.1), ('ties', 0.3), ('counts', 0.2), ('b', 0.05)):
+                df[column] = df[column].mask(rng.random(rows) < share)
+            df['c'] = df['c'].mask(df['a'].isna())
+            df.loc[df.index[0], 'rank_only'] = np.inf
+            df['sparse'] = np.where(np.arange(rows) < 2, [1.0, 2.0] + [0.0] * (rows - 2), np.nan)
+            df['constant'] = 1.0
+        return df
+
+    def test_matches_pandas(self):
+        for missing in (False, True):
+            df = self.frame(missing)
+            numeric = df.drop(columns=['flag', 'label']).astype('float64')
+            for method in ('pearson', 'spearman'):
+                with self.subTest(missing=missing, method=method):
+                    matrix = correlation_matrix(df, method)
+                    expected = numeric.corr(method, min_periods=2)
+                    self.assertEqual(matrix.columns, list(expected.columns))
+                    np.testing.assert_allclose(matrix.values, expected.to_numpy(), rtol=0, atol=1e-12)
+                    # Infinite values count as missing
+                    present = np.isfinite(numeric.to_numpy()).astype(int)
+                    self.assertEqual(matrix.counts.tolist(), (present.T @ present).tolist())
+
+    def test_stored_matrix_is_reused(self):
+        df = self.frame(missing=True)
+        dataset_id, manifest = self.write(df)
+        matrix = get_correlation_matrix(dataset_id, manifest, 'spearman')
+        get_query_cache().clear()
+
+        with mock.patch('main.correlation.correlation_matrix') as compute:
+            stored = get_correlation_matrix(dataset_id, manifest, 'spearman')
+
+        compute.assert_not_called()
+        self.assertEqual(stored.columns, matrix.columns)
+        np.testing.assert_array_equal(stored.values, matrix.values)
+
+
+class AggregationTests(SimpleTestCase):
+    def frame(self):
+        rng = np.random.default_rng(17)
+        rows = 500
+        df = pd.DataFrame({
+            'region': rng.choice(['north', 'south', 'east', 'west', 'centre'], rows, p=[0.4, 0.25, 0.15, 0.12, 0.08]),
+            'store': rng.integers(0, 6, rows).astype('float64'),
+            'sales': rng.normal(100, 20, rows),
+        })
+        df['region'] = df['region'].mask(rng.random(rows) < 0.1)
+        df['store'] = df['store'].mask(rng.random(rows) < 0.1)
+        df['sales'] = df['sales'].mask(rng.random(rows) < 0.2)
+        # A group whose values are all missing
+        df.loc[df['store'] == 5, 'sales'] = np.nan
+        return df
+
+    def expected(self, x, y, agg):
+        groups = (y.notna() if agg == 'count' else y).groupby(x, dropna=False, sort=True)
+        aggregated = groups.sum() if agg == 'count' else groups.agg(agg)
+        labels = ['Unknown' if pd.isna(label) else str(label) for label in aggregated.index]
+        return labels, aggregated.to_numpy(dtype=np.float64), groups.size().tolist()
+
+    def assertMatchesGroupby(self, result, x, y, agg):
+        labels, values, counts = self.expected(x, y, agg)
+        self.assertEqual(result['labels'], labels)
+        np.testing.assert_allclose(np.array(result['values'], dtype=np.float64), values, rtol=1e-12)
+        self.assertEqual(result['counts'], counts)
+
+    def test_matches_pandas_groupby(self):
+        df = self.frame()
+        for x in ('region', 'store'):
+            for agg in AGGREGATIONS:
+                with self.subTest(x=x, agg=agg):
+                    result = aggregate(df, 'bar', x, 'sales', agg)
+                    self.assertFalse(result['binned'])
+                    self.assertEqual(result['other_groups'], 0)
+                    self.assertMatchesGroupby(result, df[x], df['sales'], agg)
+
+    def test_empty_group_is_null(self):
+        result = aggregate(self.frame(), 'bar', 'store', 'sales', 'mean')
+        self.assertIsNone(result['values'][result['labels'].index('5.0')])
+
+    def test_keeps_the_most_frequent_groups(self):
+        df = self.frame()
+        frequent = df['region'].value_counts().index[:2]
+        kept = df['region'].isin(frequent) | df['region'].isna()
+        for agg in AGGREGATIONS:
+            with self.subTest(agg=agg):
+                result = grouped(df['region'], df['sales'], agg, limit=2)
+                self.assertEqual(result['other_groups'], 3)
+                self.assertEqual(len(result['labels']), 3)
+                self.assertMatchesGroupby(result, df['region'][kept], df['sales'][kept], agg)
+
+    def test_bins_numeric_x_beyond_the_limit(self):
+        df = self.frame()
+        result = grouped(df['sales'], df['store'], 'count', limit=4)
+        self.assertTrue(result['binned'])
+        self.assertEqual(len(result['labels']), 4)
+        counts, edges = np.histogram(df['sales'].dropna(), bins=4)
+        np.testing.assert_allclose(result['edges'], edges)
+        self.assertEqual(result['counts'], counts.tolist())
+        with_store = df[df['store'].notna()]['sales'].dropna()
+        self.assertEqual(result['values'], np.histogram(with_store, bins=edges)[0].astype(float).tolist())
+
+    def test_rejects_text_y_unless_counting(self):
+        df = self.frame()
+        with self.assertRaises(ValueError):
+            aggregate(df, 'bar', 'store', 'region', 'sum')
+        result = aggregate(df, 'bar', 'store', 'region', 'count')
+        self.assertMatchesGroupby(result, df['store'], df['region'], 'count')
+
+
+def reference_lttb(x, y, threshold):
+    """Steinarsson's LTTB, one bucket at a time."""
+    def edge(bucket):
+        # Exact floor(bucket * (n - 2) / (threshold - 2)) + 1
+        return bucket * (len(x) - 2) // (threshold - 2) + 1
+
+    selected, a = [0], 0
+    for bucket in range(threshold - 2):
+        start, end = edge(bucket), edge(bucket + 1)
+        next_end = min(edge(bucket + 2), len(x))
+        cx, cy = x[end:next_end].mean(), y[end:next_end].mean()
+        areas = [abs((x[a] - cx) * (y[i] - y[a]) - (x[a] - x[i]) * (cy - y[a])) for i in range(start, end)]
+        a = start + int(np.argmax(areas))
+        selected.append(a)
+    return selected + [len(x) - 1]
+
+
+class DownsamplingTests(SimpleTestCase):
+    def series(self, n):
+        rng = np.random.default_rng(18)
+        x = np.sort(rng.uniform(0, 100, n))
+        y = np.sin(x / 5) + rng.normal(0, 0.1, n)
+        return x, y
+
+    def test_lttb_keeps_the_threshold_count_in_order(self):
+        for n, threshold in ((1000, 3), (1000, 50), (1000, 999), (101, 100), (500, 388), (5000, 1234)):
+            with self.subTest(n=n, threshold=threshold):
+                x, y = self.series(n)
+                keep = lttb(x, y, threshold)
+                self.assertEqual(len(keep), threshold)
+                self.assertEqual(keep[0], 0)
+                self.assertEqual(keep[-1], n - 1)
+                self.assertTrue((np.diff(keep) > 0).all())
+                self.assertEqual(keep.tolist(), reference_lttb(x, y, threshold))
+
+    def test_lttb_keeps_a_spike(self):
+        x, y = self.series(1000)
+        y[437] = 50
+        self.assertIn(437, lttb(x, y, 20))
+
+    def test_lttb_returns_short_series_whole(self):
+        x, y = self.series(10)
+        self.assertEqual(lttb(x, y, 10).tolist(), list(range(10)))
+        self.assertEqual(lttb(x, y, 50).tolist(), list(range(10)))
+
+    def test_grid_sample_caps_points_per_cell(self):
+        rng = np.random.default_rng(18)
+        # A dense cluster, a sparse background and one outlier
+        x = np.concatenate([rng.normal(0, 0.5, 20000), rng.uniform(-10, 10, 500), [40]])
+        y = np.concatenate([rng.normal(0, 0.5, 20000), rng.uniform(-10, 10, 500), [40]])
+        target = 400
+        keep, weights = grid_sample(x, y, target)
+
+        side = math.isqrt(target)
+        cells = [np.minimum(((values - values.min()) / np.ptp(values) * side).astype(int), side - 1)
+                 for values in (x, y)]
+        cells = cells[0] * side + cells[1]
+        counts = np.bincount(cells)
+        kept = np.bincount(cells[keep], minlength=len(counts))
+        cap = kept.max()
+
+        self.assertLessEqual(len(keep), target)
+        self.assertTrue((np.diff(keep) > 0).all())
+        # Every occupied cell keeps min(its rows, cap) points, so sparse cells and the outlier survive
+        np.testing.assert_array_equal(kept, np.minimum(counts, cap))
+        self.assertGreater(np.minimum(counts, cap + 1).sum(), target)
+        self.assertIn(len(x) - 1, keep)
+        # Weights are the rows each kept point stands for
+        np.testing.assert_allclose(weights, counts[cells[keep]] / kept[cells[keep]])
+        self.assertAlmostEqual(weights.sum(), len(x))
+        np.testing.assert_array_equal(grid_sample(x, y, target)[0], keep)
+
+    def test_grid_sample_returns_small_series_whole(self):
+        x, y = self.series(100)
+        keep, weights = grid_sample(x, y, 100)
+        self.assertEqual(keep.tolist(), list(range(100)))
+        self.assertEqual(weights.tolist(), [1.0] * 100)
+
+
+class CopyOnWriteSettingTests(SimpleTestCase):
+    def ready(self, version):
+        fake = SimpleNamespace(__version__=version, options=SimpleNamespace(mode=SimpleNamespace()))
+        with mock.patch('main.apps.pd', fake):
+            apps.get_app_config('main').ready()
+        return getattr(fake.options.mode, 'copy_on_write', None)
+
+    def test_enabled_on_pandas_2(self):
+        self.assertIs(self.ready('2.2.3'), True)
+
+    def test_left_alone_on_pandas_3(self):
+        # Always on there; setting the deprecated option only warns
+        self.assertIsNone(self.ready('3.0.6'))
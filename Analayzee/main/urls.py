@@ -9,5 +9,14 @@ urlpatterns = [
     path('analysis/', views.analysis_view, name='analysis'),
     path('api/file-info/', views.api_file_info, name='api_file_info'),
     path('api/charts-data/', views.api_charts_data, name='api_charts_data'),
+    path('api/rows/', views.api_rows, name='api_rows'),
+    path('api/table/', views.api_table, name='api_table'),
+    path('api/profile/', views.api_profile, name='api_profile'),
+    path('api/correlation/', views.api_correlation, name='api_correlation'),
+    path('api/aggregate/', views.api_aggregate, name='api_aggregate'),
+    path('api/versions/', views.api_versions, name='api_versions'),
+    path('api/jobs/<uuid:job_id>/', views.api_job_status, name='api_job_status'),
     path('apply-cleaning/', views.apply_cleaning_view, name='apply_cleaning'),
+    path('apply-cleaning-plan/', views.apply_cleaning_plan_view, name='apply_cleaning_plan'),
+    path('preview-cleaning/', views.preview_cleaning_view, name='preview_cleaning'),
 ] 
\ No newline at end of file
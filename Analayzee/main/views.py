@@ -1,14 +1,42 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
+from django.urls import reverse
+from django.conf import settings
 import pandas as pd
-import numpy as np
 import os
 import json
-from accounts.utils import set_dataframe_in_store, get_dataframe_from_store
+from accounts.utils import (
+    get_dataframe_from_store,
+    get_dataframe_rows,
+    get_dataset_search_index,
+    get_dataset_manifest,
+    get_dataset_versions,
+    move_dataset_version,
+    get_or_create_dataset_id,
+    set_session_datasets,
+    get_session_datasets,
+    activate_dataset,
+)
+from .jobs import (
+    INGEST_JOB_SESSION_KEY,
+    create_ingestion_job,
+    submit_ingestion_job,
+    get_session_ingestion_job,
+    expire_stale_job,
+)
+from .models import IngestionJob
+from .aggregation import AGGREGATIONS, CHART_TYPES, get_aggregate
+from .cleaning import PREVIEW_ROWS, StaleVersionError, build_plan, clean_dataset, clean_dataset_with_plan, describe_plan
+from .cleaning_preview import preview_cleaning
+from .correlation import METHODS as CORRELATION_METHODS, get_correlation_matrix
+from .downsampling import CHART_TYPES as SERIES_CHART_TYPES, DEFAULT_POINTS, get_chart_series
+from .profiling import get_approximate_profile, get_dataset_profile
+from .serializers import dataframe_to_columns, dataframe_to_records, dumps, json_response
+from .table_query import parse_sort, parse_filters, query_table
 
 
 def home_view(request):
@@ -29,7 +57,7 @@ def upload_file_view(request):
     uploaded_file = request.FILES['file']
     
     # Check file type
-    allowed_extensions = ['.csv', '.xlsx', '.xls']
+    allowed_extensions = ['.csv', '.tsv', '.xlsx', '.xls']
     file_extension = os.path.splitext(uploaded_file.name)[1].lower()
     
     if file_extension not in allowed_extensions:
@@ -37,14 +65,14 @@ def upload_file_view(request):
         return redirect('main:home')
     
     try:
-        # Read file based on extension
-        if file_extension == '.csv':
-            df = pd.read_csv(uploaded_file)
-        else:  # Excel files
-            df = pd.read_excel(uploaded_file)
-        
-        # Store DataFrame in session
-        set_dataframe_in_store(request, df)
+        # Parsing happens in the background; the analysis page waits for the job
+        dataset_id = get_or_create_dataset_id(request)
+        sheet_name = ''
+        if file_extension in ('.xlsx', '.xls'):
+            sheet_name = IngestionJob.ALL_SHEETS if request.POST.get('all_sheets') else request.POST.get('sheet', '').strip()
+        job = create_ingestion_job(uploaded_file, dataset_id, user=request.user, sheet_name=sheet_name)
+        request.session[INGEST_JOB_SESSION_KEY] = str(job.id)
+        submit_ingestion_job(job)
         
         messages.success(request, f'File "{uploaded_file.name}" uploaded successfully!')
         return redirect('main:analysis')
@@ -56,58 +84,66 @@ def upload_file_view(request):
 
 def analysis_view(request):
     """Analysis page showing the uploaded file data"""
+    job = get_session_ingestion_job(request)
+    if job is not None:
+        if not job.is_done:
+            return render(request, 'main/ingest_progress.html', {
+                'title': 'Processing File - Analayzee',
+                'job': job,
+            })
+        del request.session[INGEST_JOB_SESSION_KEY]
+        if job.status == IngestionJob.STATUS_FAILED:
+            messages.error(request, f'Error reading file: {job.error}')
+            return redirect('main:home')
+        set_session_datasets(request, [
+            {'id': sheet['dataset_id'], 'name': sheet['name']}
+            for sheet in job.sheets
+            if sheet.get('dataset_id')
+        ])
+    
+    # Switch between the sheets of a multi-sheet upload
+    if request.GET.get('dataset'):
+        if not activate_dataset(request, request.GET['dataset']):
+            messages.error(request, 'Dataset not found.')
+        return redirect('main:analysis')
+
     try:
-        df = get_dataframe_from_store(request)
+        # Shape, dtypes and missing counts come from the manifest; only the preview rows are read
+        metadata = get_dataframe_from_store(request, metadata_only=True)
         
-        if df is None:
+        if metadata is None:
             messages.warning(request, 'No file data found. Please upload a file first.')
             return redirect('main:home')
         
-        # Clean the data for JSON serialization
-        def clean_for_json(obj):
-            if pd.isna(obj):
-                return None
-            elif isinstance(obj, (np.integer, np.floating)):
-                return float(obj) if not np.isnan(obj) else None
-            elif isinstance(obj, np.ndarray):
-                return obj.tolist()
-            elif isinstance(obj, pd.Timestamp):
-                return obj.isoformat()
-            else:
-                return obj
-        
-        # Clean the DataFrame data
-        cleaned_data = []
-        for _, row in df.head(50).iterrows():
-            cleaned_row = {}
-            for col in df.columns:
-                cleaned_row[col] = clean_for_json(row[col])
-            cleaned_data.append(cleaned_row)
-        
-        # Serialize to JSON with error handling
+        # Serialize the preview column by column
+        df, _ = get_dataframe_rows(request, 0, PREVIEW_ROWS)
+        cleaned_data = dataframe_to_records(df)
         try:
-            table_data_json = json.dumps(cleaned_data)
-            column_names_json = json.dumps(list(df.columns))
+            table_data_json = dumps(cleaned_data)
+            column_names_json = dumps(metadata['column_names'])
         except Exception as e:
             print(f"JSON serialization error: {e}")
             # Fallback to empty data
-            table_data_json = json.dumps([])
-            column_names_json = json.dumps([])
+            table_data_json = dumps([])
+            column_names_json = dumps([])
         
         # Prepare data for template
         context = {
             'title': 'File Analysis - Analayzee',
             'file_info': {
-                'rows': len(df),
-                'columns': len(df.columns),
-                'column_names': list(df.columns),
-                'data_types': df.dtypes.to_dict(),
-                'missing_values': df.isnull().sum().to_dict(),
+                'rows': metadata['rows'],
+                'columns': metadata['columns'],
+                'column_names': metadata['column_names'],
+                'data_types': metadata['data_types'],
+                'missing_values': metadata['missing_values'],
             },
             'table_data': cleaned_data,  # Use cleaned data
-            'column_names': list(df.columns),
+            'column_names': metadata['column_names'],
             'table_data_json': table_data_json,  # Pre-serialized JSON
             'column_names_json': column_names_json,  # Pre-serialized JSON
+            'dataset_json': dumps({'dataset_id': metadata['dataset_id'], 'version': metadata['version']}),
+            'datasets': get_session_datasets(request),
+            'active_dataset_id': request.session.get('dataset_id'),
         }
         
         return render(request, 'main/analysis.html', context)
@@ -120,22 +156,55 @@ def analysis_view(request):
 
 def api_file_info(request):
     """API endpoint to get file info for AJAX requests"""
-    df = get_dataframe_from_store(request)
+    metadata = get_dataframe_from_store(request, metadata_only=True)
     
-    if df is None:
+    if metadata is None:
         return JsonResponse({'error': 'No file data found'}, status=404)
     
     return JsonResponse({
-        'rows': len(df),
-        'columns': len(df.columns),
-        'column_names': list(df.columns),
-        'data_types': df.dtypes.astype(str).to_dict(),
-        'missing_values': df.isnull().sum().to_dict(),
+        'rows': metadata['rows'],
+        'columns': metadata['columns'],
+        'column_names': metadata['column_names'],
+        'data_types': metadata['data_types'],
+        'missing_values': metadata['missing_values'],
+        'memory_usage': metadata['memory_usage'],
+    })
+
+
+def api_job_status(request, job_id):
+    """API endpoint to poll the progress of a background ingestion job"""
+    job = IngestionJob.objects.filter(pk=job_id).first()
+    owns_job = job is not None and (
+        request.session.get(INGEST_JOB_SESSION_KEY) == str(job.id)
+        or (request.user.is_authenticated and job.user_id == request.user.id)
+    )
+    if not owns_job:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    
+    job = expire_stale_job(job)
+    return JsonResponse({
+        'id': str(job.id),
+        'file_name': job.file_name,
+        'status': job.status,
+        'bytes_total': job.bytes_total,
+        'bytes_parsed': job.bytes_parsed,
+        'rows_read': job.rows_read,
+        'progress': round(job.progress, 4),
+        'error': job.error,
+        'redirect': reverse('main:analysis') if job.is_done else None,
     })
 
 
 def api_charts_data(request):
-    """API endpoint to get data specifically for charts"""
+    """API endpoint to get column information for charts
+    
+    With ``x`` and ``y`` it returns a line or scatter series instead
+    (``chart_type``, default line), downsampled to about ``points`` points:
+    LTTB for lines, grid sampling for scatter plots.
+    """
+    if request.GET.get('y'):
+        return chart_series_response(request)
+    
     df = get_dataframe_from_store(request)
     
     if df is None:
@@ -152,9 +221,8 @@ def api_charts_data(request):
             else:
                 categorical_columns.append(column)
         
-        return JsonResponse({
+        return json_response({
             'success': True,
-            'data': df.to_dict('records'),
             'columns': list(df.columns),
             'numeric_columns': numeric_columns,
             'categorical_columns': categorical_columns,
@@ -168,280 +236,506 @@ def api_charts_data(request):
         }, status=500)
 
 
-@login_required
-@csrf_exempt
-@require_http_methods(["POST"])
-def apply_cleaning_view(request):
-    """Handle data cleaning operations"""
+def chart_series_response(request):
+    chart_type = request.GET.get('chart_type', 'line')
+    if chart_type not in SERIES_CHART_TYPES:
+        return JsonResponse({'error': f'chart_type must be one of {", ".join(SERIES_CHART_TYPES)}'}, status=400)
     try:
-        # Get parameters from request
-        column = request.POST.get('column')
-        operation = request.POST.get('operation')
-        data_json = request.POST.get('data')
-        
-        if not all([column, operation, data_json]):
-            return JsonResponse({
-                'success': False,
-                'error': 'Missing required parameters'
-            })
-        
-        # Parse data
-        data = json.loads(data_json)
-        df = pd.DataFrame(data)
-        
-        # Apply cleaning operation
-        stats = apply_cleaning_operation(df, column, operation, request.POST)
-        
-        # Store updated DataFrame
-        set_dataframe_in_store(request, df)
-        
+        points = int(request.GET.get('points', DEFAULT_POINTS))
+    except ValueError:
+        return JsonResponse({'error': 'points must be an integer'}, status=400)
+    
+    manifest = get_dataset_manifest(request)
+    if manifest is None:
+        return JsonResponse({'error': 'No file data found'}, status=404)
+    
+    x = request.GET.get('x')
+    y = request.GET.get('y')
+    if not x:
+        return JsonResponse({'error': 'Missing required parameters'}, status=400)
+    unknown = [col for col in (x, y) if col not in manifest['columns']]
+    if unknown:
+        return JsonResponse({'error': f'Unknown columns: {", ".join(unknown)}'}, status=400)
+    
+    try:
+        payload = get_chart_series(
+            (manifest['dataset_id'], manifest['version']),
+            lambda columns: get_dataframe_from_store(request, columns=columns),
+            chart_type, x, y, points,
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
         return JsonResponse({
+            'error': f'Error processing data: {str(e)}'
+        }, status=500)
+    
+    return HttpResponse(payload, content_type='application/json')
+
+
+def api_rows(request):
+    """API endpoint returning a window of rows as column-oriented arrays
+    
+    Query parameters: ``offset`` (default 0), ``limit`` (default 100, capped
+    at ROWS_API_MAX_LIMIT) and ``columns`` (repeatable; all columns if omitted).
+    """
+    max_limit = getattr(settings, 'ROWS_API_MAX_LIMIT', 10000)
+    try:
+        offset = int(request.GET.get('offset', 0))
+        limit = min(int(request.GET.get('limit', 100)), max_limit)
+    except ValueError:
+        return JsonResponse({'error': 'offset and limit must be integers'}, status=400)
+    if offset < 0 or limit < 0:
+        return JsonResponse({'error': 'offset and limit must not be negative'}, status=400)
+    
+    metadata = get_dataframe_from_store(request, metadata_only=True)
+    if metadata is None:
+        return JsonResponse({'error': 'No file data found'}, status=404)
+    
+    columns = request.GET.getlist('columns') or metadata['column_names']
+    unknown = [col for col in columns if col not in metadata['column_names']]
+    if unknown:
+        return JsonResponse({'error': f'Unknown columns: {", ".join(unknown)}'}, status=400)
+    
+    try:
+        df, total_rows = get_dataframe_rows(request, offset, limit, columns=columns)
+        if df is None:
+            return JsonResponse({'error': 'No file data found'}, status=404)
+        
+        return json_response({
             'success': True,
-            'cleaned_data': df.to_dict('records'),
-            'stats': stats
+            'offset': offset,
+            'limit': limit,
+            'returned_rows': len(df),
+            'total_rows': total_rows,
+            'columns': columns,
+            'data': dataframe_to_columns(df),
         })
         
+    except Exception as e:
+        return JsonResponse({
+            'error': f'Error processing data: {str(e)}'
+        }, status=500)
+
+
+def api_table(request):
+    """API endpoint for the analysis table: sort, filter, search and one page of rows
+    
+    Query parameters: ``offset``, ``limit``, ``sort`` (JSON list of
+    ``{"column", "direction"}``), ``filters`` (JSON list of ``{"column", "op",
+    "value"}``), ``search``, ``search_mode`` (``contains`` or ``prefix``), and
+    repeatable ``search_columns`` and ``columns``.
+    """
+    max_limit = getattr(settings, 'ROWS_API_MAX_LIMIT', 10000)
+    try:
+        offset = int(request.GET.get('offset', 0))
+        limit = min(int(request.GET.get('limit', 25)), max_limit)
+    except ValueError:
+        return JsonResponse({'error': 'offset and limit must be integers'}, status=400)
+    if offset < 0 or limit < 0:
+        return JsonResponse({'error': 'offset and limit must not be negative'}, status=400)
+    
+    metadata = get_dataframe_from_store(request, metadata_only=True)
+    if metadata is None:
+        return JsonResponse({'error': 'No file data found'}, status=404)
+    
+    all_columns = metadata['column_names']
+    columns = request.GET.getlist('columns') or all_columns
+    search_columns = request.GET.getlist('search_columns') or columns
+    unknown = [col for col in columns + search_columns if col not in all_columns]
+    if unknown:
+        return JsonResponse({'error': f'Unknown columns: {", ".join(unknown)}'}, status=400)
+    
+    search_mode = request.GET.get('search_mode', 'contains')
+    if search_mode not in ('contains', 'prefix'):
+        return JsonResponse({'error': 'search_mode must be contains or prefix'}, status=400)
+    
+    try:
+        sort = parse_sort(request.GET.get('sort'), all_columns)
+        filters = parse_filters(request.GET.get('filters'), all_columns)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    df = get_dataframe_from_store(request)
+    if df is None:
+        return JsonResponse({'error': 'No file data found'}, status=404)
+    
+    search = request.GET.get('search', '').strip()
+    try:
+        page, row_ids, matched_rows = query_table(
+            df, (metadata['dataset_id'], metadata['version']),
+            sort=sort,
+            filters=filters,
+            search=search,
+            search_columns=search_columns,
+            columns=columns,
+            offset=offset,
+            limit=limit,
+            search_index=get_dataset_search_index(request) if search else None,
+            search_mode=search_mode,
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'error': f'Error processing data: {str(e)}'
+        }, status=500)
+    
+    return json_response({
+        'success': True,
+        'offset': offset,
+        'limit': limit,
+        'total_rows': len(df),
+        'matched_rows': matched_rows,
+        'columns': columns,
+        'row_ids': row_ids,
+        'data': dataframe_to_columns(page),
+    })
+
+
+def api_profile(request):
+    """API endpoint returning the per-column profile (summary statistics) of the dataset
+    
+    The profile is computed once per dataset version and cached. ``columns``
+    (repeatable) limits the response to those columns. ``approximate=1``
+    answers from the sketches built at ingest without reading any data.
+    """
+    manifest = get_dataset_manifest(request)
+    if manifest is None:
+        return JsonResponse({'error': 'No file data found'}, status=404)
+    
+    columns = request.GET.getlist('columns')
+    unknown = [col for col in columns if col not in manifest['columns']]
+    if unknown:
+        return JsonResponse({'error': f'Unknown columns: {", ".join(unknown)}'}, status=400)
+    
+    if request.GET.get('approximate') in ('1', 'true'):
+        profile = get_approximate_profile(manifest['dataset_id'], manifest)
+        if profile is None:
+            return JsonResponse({'error': 'No sketches were built for this dataset'}, status=404)
+        if columns:
+            profile['columns'] = {col: profile['columns'][col] for col in columns}
+        return json_response(profile)
+    
+    try:
+        profile = get_dataset_profile(manifest['dataset_id'], manifest)
+    except Exception as e:
+        return JsonResponse({
+            'error': f'Error profiling data: {str(e)}'
+        }, status=500)
+    
+    if not columns:
+        # Already encoded: no need to decode and re-encode the whole profile
+        return HttpResponse(profile, content_type='application/json')
+    
+    profile = json.loads(profile)
+    return json_response({
+        'rows': profile['rows'],
+        'columns': {col: profile['columns'][col] for col in columns},
+    })
+
+
+def api_aggregate(request):
+    """API endpoint returning a chart's series as buckets instead of rows
+    
+    Query parameters: ``chart_type`` (bar, line, pie, doughnut, histogram),
+    ``x`` and ``y`` columns, ``agg`` (sum, mean, median, min, max, count) for
+    bar and line charts, and ``bins``: the number of ranges for histograms and
+    numeric x axes, or the number of slices for pie charts.
+    """
+    chart_type = request.GET.get('chart_type', 'bar')
+    if chart_type not in CHART_TYPES:
+        return JsonResponse({'error': f'chart_type must be one of {", ".join(CHART_TYPES)}'}, status=400)
+    agg = request.GET.get('agg', 'sum')
+    if agg not in AGGREGATIONS:
+        return JsonResponse({'error': f'agg must be one of {", ".join(AGGREGATIONS)}'}, status=400)
+    try:
+        bins = int(request.GET['bins']) if request.GET.get('bins') else None
+    except ValueError:
+        return JsonResponse({'error': 'bins must be an integer'}, status=400)
+    
+    manifest = get_dataset_manifest(request)
+    if manifest is None:
+        return JsonResponse({'error': 'No file data found'}, status=404)
+    
+    x = request.GET.get('x') or None
+    y = request.GET.get('y') or None
+    if y is None or (x is None and chart_type in ('bar', 'line')):
+        return JsonResponse({'error': 'Missing required parameters'}, status=400)
+    unknown = [col for col in (x, y) if col is not None and col not in manifest['columns']]
+    if unknown:
+        return JsonResponse({'error': f'Unknown columns: {", ".join(unknown)}'}, status=400)
+    
+    try:
+        payload = get_aggregate(
+            (manifest['dataset_id'], manifest['version']),
+            lambda columns: get_dataframe_from_store(request, columns=columns),
+            chart_type, x, y, agg, bins,
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'error': f'Error processing data: {str(e)}'
+        }, status=500)
+    
+    return HttpResponse(payload, content_type='application/json')
+
+
+def api_correlation(request):
+    """API endpoint returning the correlation matrix of the numeric columns
+    
+    Query parameters: ``method`` (``pearson`` or ``spearman``), repeatable
+    ``columns`` to restrict the matrix, and ``top``/``min_abs`` to return only
+    the strongest distinct pairs (``{"x", "y", "r", "n"}``) instead of the
+    whole matrix. Pairs are compared over the rows where both have a value.
+    """
+    method = request.GET.get('method', 'pearson')
+    if method not in CORRELATION_METHODS:
+        return JsonResponse({'error': f'method must be one of {", ".join(CORRELATION_METHODS)}'}, status=400)
+    try:
+        top = int(request.GET['top']) if request.GET.get('top') else None
+        min_abs = float(request.GET.get('min_abs') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'top must be an integer and min_abs a number'}, status=400)
+    if top is not None and top < 0:
+        return JsonResponse({'error': 'top must not be negative'}, status=400)
+    
+    manifest = get_dataset_manifest(request)
+    if manifest is None:
+        return JsonResponse({'error': 'No file data found'}, status=404)
+    
+    try:
+        matrix = get_correlation_matrix(manifest['dataset_id'], manifest, method)
+    except Exception as e:
+        return JsonResponse({
+            'error': f'Error computing correlations: {str(e)}'
+        }, status=500)
+    
+    columns = request.GET.getlist('columns')
+    if columns:
+        unknown = [col for col in columns if col not in matrix.columns]
+        if unknown:
+            return JsonResponse({'error': f'Not numeric columns: {", ".join(unknown)}'}, status=400)
+        matrix = matrix.subset(columns)
+    
+    payload = {'success': True, 'method': method, 'columns': matrix.columns}
+    if top is not None or min_abs:
+        payload['pairs'] = matrix.top_pairs(top, min_abs)
+    else:
+        payload['matrix'] = matrix.to_dict()
+    return json_response(payload)
+
+
+@login_required
+@csrf_exempt
+@require_http_methods(["POST"])
+def apply_cleaning_view(request):
+    """Apply a cleaning operation to the stored dataset
+    
+    POST parameters: ``column``, ``operation`` and its options, plus
+    optional ``dataset_id`` (one of the session's datasets, default the
+    active one) and ``version``, the version the client last saw. The
+    operation runs on the server and is written as the next version; only
+    the stats, the new version and a preview of the first rows come back.
+    """
+    column = request.POST.get('column')
+    operation = request.POST.get('operation')
+    if not all([column, operation]):
+        return JsonResponse({
+            'success': False,
+            'error': 'Missing required parameters'
+        }, status=400)
+    
+    manifest = get_dataset_manifest(request, request.POST.get('dataset_id') or None)
+    if manifest is None:
+        return JsonResponse({'success': False, 'error': 'No file data found'}, status=404)
+    
+    try:
+        version = int(request.POST['version']) if request.POST.get('version') else None
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'version must be an integer'}, status=400)
+    
+    try:
+        stats, new_manifest, preview = clean_dataset(
+            manifest['dataset_id'], manifest, column, operation, request.POST, expected_version=version,
+        )
+    except StaleVersionError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=409)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({
             'success': False,
             'error': str(e)
-        })
+        }, status=500)
+    
+    if new_manifest is None:
+        return json_response({'success': False, 'error': stats['error'], 'stats': stats})
+    
+    return json_response({
+        'success': True,
+        'stats': stats,
+        'dataset_id': new_manifest['dataset_id'],
+        'version': new_manifest['version'],
+        'total_rows': new_manifest['rows'],
+        'columns': new_manifest['columns'],
+        'preview': dataframe_to_records(preview),
+    })
 
 
-def apply_cleaning_operation(df, column, operation, params):
-    """Apply specific cleaning operation to DataFrame"""
-    stats = {}
-    
-    if operation == 'missing-values':
-        stats = handle_missing_values(df, column, params)
-    elif operation == 'outliers':
-        stats = handle_outliers(df, column, params)
-    elif operation == 'data-type':
-        stats = convert_data_type(df, column, params)
-    elif operation == 'text-cleaning':
-        stats = clean_text(df, column, params)
-    elif operation == 'duplicates':
-        stats = remove_duplicates(df, params)
-    elif operation == 'normalize':
-        stats = normalize_data(df, column, params)
-    
-    return stats
-
-
-def handle_missing_values(df, column, params):
-    """Handle missing values in a column"""
-    action = params.get('action', 'fill-mean')
-    missing_count = df[column].isnull().sum()
-    stats = {'missing_filled': missing_count}
-    
-    if action == 'fill-mean' and pd.api.types.is_numeric_dtype(df[column]):
-        df[column].fillna(df[column].mean(), inplace=True)
-    elif action == 'fill-median' and pd.api.types.is_numeric_dtype(df[column]):
-        df[column].fillna(df[column].median(), inplace=True)
-    elif action == 'fill-mode':
-        mode_value = df[column].mode().iloc[0] if not df[column].mode().empty else None
-        df[column].fillna(mode_value, inplace=True)
-    elif action == 'fill-zero':
-        df[column].fillna(0, inplace=True)
-    elif action == 'fill-custom':
-        custom_value = params.get('custom_value', '')
-        df[column].fillna(custom_value, inplace=True)
-    elif action == 'drop':
-        df.dropna(subset=[column], inplace=True)
-        stats['rows_dropped'] = missing_count
-    
-    return stats
-
-
-def handle_outliers(df, column, params):
-    """Handle outliers in a column"""
-    method = params.get('method', 'iqr')
-    action = params.get('action', 'cap')
-    threshold = params.get('threshold', 1.5)
-    
-    if not pd.api.types.is_numeric_dtype(df[column]):
-        return {'error': 'Column is not numeric'}
-    
-    outliers_mask = pd.Series([False] * len(df))
-    
-    if method == 'iqr':
-        Q1 = df[column].quantile(0.25)
-        Q3 = df[column].quantile(0.75)
-        IQR = Q3 - Q1
-        lower_bound = Q1 - threshold * IQR
-        upper_bound = Q3 + threshold * IQR
-        outliers_mask = (df[column] < lower_bound) | (df[column] > upper_bound)
-    elif method == 'zscore':
-        z_scores = np.abs((df[column] - df[column].mean()) / df[column].std())
-        outliers_mask = z_scores > threshold
-    elif method == 'percentile':
-        lower_percentile = (100 - threshold * 100) / 2
-        upper_percentile = 100 - lower_percentile
-        lower_bound = df[column].quantile(lower_percentile / 100)
-        upper_bound = df[column].quantile(upper_percentile / 100)
-        outliers_mask = (df[column] < lower_bound) | (df[column] > upper_bound)
-    
-    outlier_count = outliers_mask.sum()
-    stats = {'outliers_found': outlier_count}
-    
-    if action == 'cap':
-        if method == 'iqr':
-            df.loc[df[column] < lower_bound, column] = lower_bound
-            df.loc[df[column] > upper_bound, column] = upper_bound
-        elif method == 'zscore':
-            mean_val = df[column].mean()
-            std_val = df[column].std()
-            df.loc[df[column] < mean_val - threshold * std_val, column] = mean_val - threshold * std_val
-            df.loc[df[column] > mean_val + threshold * std_val, column] = mean_val + threshold * std_val
-        elif method == 'percentile':
-            df.loc[df[column] < lower_bound, column] = lower_bound
-            df.loc[df[column] > upper_bound, column] = upper_bound
-        stats['outliers_capped'] = outlier_count
-    elif action == 'remove':
-        df.drop(df[outliers_mask].index, inplace=True)
-        stats['outliers_removed'] = outlier_count
-    elif action == 'mark':
-        df[f'{column}_is_outlier'] = outliers_mask
-        stats['outliers_marked'] = outlier_count
-    
-    return stats
-
-
-def convert_data_type(df, column, params):
-    """Convert data type of a column"""
-    target_type = params.get('target_type', 'string')
-    method = params.get('method', 'coerce')
-    
-    stats = {'original_type': str(df[column].dtype)}
+@login_required
+@csrf_exempt
+@require_http_methods(["POST"])
+def preview_cleaning_view(request):
+    """Preview a cleaning operation on a sample of the stored dataset
+    
+    Takes the same parameters as ``apply_cleaning_view`` but runs the
+    operation on a cached stratified sample and stores nothing. The stats
+    are estimates for the whole dataset; ``rows`` compares the cleaned
+    column before and after for sampled rows, changed rows first.
+    """
+    column = request.POST.get('column')
+    operation = request.POST.get('operation')
+    if not all([column, operation]):
+        return JsonResponse({
+            'success': False,
+            'error': 'Missing required parameters'
+        }, status=400)
+    
+    manifest = get_dataset_manifest(request, request.POST.get('dataset_id') or None)
+    if manifest is None:
+        return JsonResponse({'success': False, 'error': 'No file data found'}, status=404)
     
     try:
-        if target_type == 'int':
-            df[column] = pd.to_numeric(df[column], errors='coerce' if method == 'coerce' else 'raise').astype('Int64')
-        elif target_type == 'float':
-            df[column] = pd.to_numeric(df[column], errors='coerce' if method == 'coerce' else 'raise')
-        elif target_type == 'string':
-            df[column] = df[column].astype(str)
-        elif target_type == 'datetime':
-            df[column] = pd.to_datetime(df[column], errors='coerce' if method == 'coerce' else 'raise')
-        elif target_type == 'boolean':
-            df[column] = df[column].map({'true': True, 'false': False, '1': True, '0': False, 1: True, 0: False})
-        
-        stats['new_type'] = str(df[column].dtype)
-        stats['conversion_successful'] = True
-        
+        preview = preview_cleaning(manifest['dataset_id'], manifest, column, operation, request.POST)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
     except Exception as e:
-        stats['conversion_successful'] = False
-        stats['error'] = str(e)
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
     
-    return stats
+    payload = {
+        'dataset_id': manifest['dataset_id'],
+        'version': manifest['version'],
+        'total_rows': manifest['rows'],
+        **preview,
+    }
+    if 'error' in preview['stats']:
+        return json_response({'success': False, 'error': preview['stats']['error'], **payload})
+    payload['rows'] = dataframe_to_records(preview['rows'])
+    return json_response({'success': True, **payload})
 
 
-def clean_text(df, column, params):
-    """Clean text data in a column"""
-    import re
+@login_required
+@csrf_exempt
+@require_http_methods(["POST"])
+def apply_cleaning_plan_view(request):
+    """Apply an ordered list of cleaning steps to the stored dataset in one go
+    
+    JSON body: ``steps`` (``[{"operation", "column", ...options}]``, options
+    as for apply_cleaning_view), optional ``dataset_id`` and ``version``, and
+    ``dry_run`` to get the plan without running it. Consecutive steps on one
+    column are fused into a single pass and the result is written once.
+    """
+    try:
+        body = json.loads(request.body or b'{}')
+        if not isinstance(body, dict) or not isinstance(body.get('steps'), list) or not body['steps']:
+            raise ValueError('steps must be a non-empty list')
+        plan = build_plan(body['steps'])
+        version = int(body['version']) if body.get('version') is not None else None
+    except (ValueError, TypeError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
     
-    stats = {'rows_processed': len(df)}
+    if body.get('dry_run'):
+        return json_response({'success': True, 'plan': describe_plan(plan)})
     
-    def clean_text_value(text):
-        if pd.isna(text) or text is None:
-            return text
-        
-        text = str(text)
-        
-        if params.get('trim_whitespace', True):
-            text = text.strip()
-        
-        if params.get('lowercase', False):
-            text = text.lower()
-        
-        if params.get('remove_special', False):
-            text = re.sub(r'[^a-zA-Z0-9\s]', '', text)
-        
-        if params.get('remove_numbers', False):
-            text = re.sub(r'\d+', '', text)
-        
-        if params.get('remove_duplicates', False):
-            words = text.split()
-            unique_words = []
-            for word in words:
-                if word not in unique_words:
-                    unique_words.append(word)
-            text = ' '.join(unique_words)
-        
-        # Custom replacements
-        custom_replacements = params.get('custom_replacements', '')
-        if custom_replacements:
-            for line in custom_replacements.split('\n'):
-                if ':' in line:
-                    old, new = line.split(':', 1)
-                    text = text.replace(old.strip(), new.strip())
-        
-        return text
-    
-    df[column] = df[column].apply(clean_text_value)
-    
-    return stats
-
-
-def remove_duplicates(df, params):
-    """Remove duplicate rows"""
-    scope = params.get('scope', 'all')
-    action = params.get('action', 'remove')
-    keep_option = params.get('keep', 'first')
-    
-    original_count = len(df)
-    
-    if scope == 'all':
-        subset = None
-    elif scope == 'selected':
-        column = params.get('column')
-        subset = [column] if column else None
-    else:  # subset
-        subset = params.get('subset_columns', [])
-    
-    if action == 'remove':
-        df.drop_duplicates(subset=subset, keep=keep_option, inplace=True)
-        removed_count = original_count - len(df)
-        stats = {'duplicates_removed': removed_count, 'rows_remaining': len(df)}
-    elif action == 'mark':
-        df['is_duplicate'] = df.duplicated(subset=subset, keep=False)
-        duplicate_count = df['is_duplicate'].sum()
-        stats = {'duplicates_marked': duplicate_count}
-    elif action == 'count':
-        duplicate_count = df.duplicated(subset=subset, keep=False).sum()
-        stats = {'duplicate_count': duplicate_count}
-    
-    return stats
-
-
-def normalize_data(df, column, params):
-    """Normalize numeric data"""
-    method = params.get('method', 'minmax')
-    range_min = params.get('range_min', 0)
-    range_max = params.get('range_max', 1)
-    
-    if not pd.api.types.is_numeric_dtype(df[column]):
-        return {'error': 'Column is not numeric'}
-    
-    stats = {'original_min': df[column].min(), 'original_max': df[column].max()}
-    
-    if method == 'minmax':
-        df[column] = (df[column] - df[column].min()) / (df[column].max() - df[column].min())
-        df[column] = df[column] * (range_max - range_min) + range_min
-    elif method == 'zscore':
-        df[column] = (df[column] - df[column].mean()) / df[column].std()
-    elif method == 'robust':
-        Q1 = df[column].quantile(0.25)
-        Q3 = df[column].quantile(0.75)
-        IQR = Q3 - Q1
-        df[column] = (df[column] - Q1) / IQR
-    elif method == 'decimal':
-        max_abs = df[column].abs().max()
-        if max_abs > 0:
-            scale = 10 ** (len(str(int(max_abs))) - 1)
-            df[column] = df[column] / scale
-    
-    stats['new_min'] = df[column].min()
-    stats['new_max'] = df[column].max()
-    
-    return stats
+    manifest = get_dataset_manifest(request, body.get('dataset_id') or None)
+    if manifest is None:
+        return JsonResponse({'success': False, 'error': 'No file data found'}, status=404)
+    
+    try:
+        results, new_manifest, preview = clean_dataset_with_plan(
+            manifest['dataset_id'], manifest, plan, expected_version=version,
+        )
+    except StaleVersionError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=409)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+    
+    if new_manifest is None:
+        failed = results[-1] if results else {'stats': {'error': 'Nothing to apply'}}
+        return json_response({
+            'success': False,
+            'error': failed['stats']['error'],
+            'results': results,
+            'plan': describe_plan(plan),
+        })
+    
+    return json_response({
+        'success': True,
+        'results': results,
+        'plan': describe_plan(plan),
+        'dataset_id': new_manifest['dataset_id'],
+        'version': new_manifest['version'],
+        'total_rows': new_manifest['rows'],
+        'columns': new_manifest['columns'],
+        'preview': dataframe_to_records(preview),
+    })
+
+
+def versions_payload(request, manifest):
+    versions = get_dataset_versions(request)
+    kept = {entry['version'] for entry in versions}
+    return {
+        'success': True,
+        'dataset_id': manifest['dataset_id'],
+        'version': manifest['version'],
+        'can_undo': manifest.get('parent') in kept,
+        'can_redo': any(entry['version'] > manifest['version'] for entry in versions),
+        'versions': versions,
+    }
+
+
+@login_required
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def api_versions(request):
+    """API endpoint for the version history of the session's dataset
+    
+    GET lists the kept versions. POST with ``action`` ``undo``, ``redo`` or
+    ``checkout`` (with ``version``) makes another version current and also
+    returns its columns and a preview of its first rows.
+    """
+    manifest = get_dataset_manifest(request)
+    if manifest is None:
+        return JsonResponse({'success': False, 'error': 'No file data found'}, status=404)
+    if request.method == 'GET':
+        return json_response(versions_payload(request, manifest))
+    
+    action = request.POST.get('action')
+    if action not in ('undo', 'redo', 'checkout'):
+        return JsonResponse({'success': False, 'error': 'action must be undo, redo or checkout'}, status=400)
+    try:
+        version = int(request.POST['version']) if action == 'checkout' else None
+    except (KeyError, ValueError):
+        return JsonResponse({'success': False, 'error': 'version must be an integer'}, status=400)
+    
+    manifest = move_dataset_version(request, action, version)
+    if manifest is None:
+        return JsonResponse({'success': False, 'error': f'Nothing to {action}'}, status=409)
+    
+    preview, total_rows = get_dataframe_rows(request, 0, PREVIEW_ROWS)
+    return json_response({
+        **versions_payload(request, manifest),
+        'total_rows': total_rows,
+        'columns': manifest['columns'],
+        'preview': dataframe_to_records(preview),
+    })
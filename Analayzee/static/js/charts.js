@@ -1,4 +1,8 @@
 // Charts functionality for Analayzee
+
+// Line and scatter charts are downsampled on the server to about this many points
+const CHART_TARGET_POINTS = 2000;
+
 class ChartsManager {
     constructor() {
         // Initialize properties
@@ -86,7 +90,8 @@ class ChartsManager {
             const result = await response.json();
             
             if (result.success) {
-                this.data = result.data;
+                // Rows are fetched per chart, only for the columns it plots
+                this.data = null;
                 this.columns = result.columns;
                 this.numericColumns = result.numeric_columns || [];
                 this.categoricalColumns = result.categorical_columns || [];
@@ -237,7 +242,7 @@ class ChartsManager {
         });
     }
     
-    createChart() {
+    async createChart() {
         const chartType = document.getElementById('chartType')?.value || 'bar';
         const xAxis = document.getElementById('xAxis')?.value;
         const yAxis = document.getElementById('yAxis')?.value;
@@ -248,6 +253,37 @@ class ChartsManager {
         }
         
         const chartId = `chart-${Date.now()}`;
+        
+        // Line and scatter series are downsampled on the server; everything else is aggregated into buckets
+        if (chartType === 'line' || chartType === 'scatter') {
+            try {
+                const series = await this.fetchSeries(chartType, xAxis, yAxis);
+                this.renderChart(chartId, chartType, this.prepareSeriesData(chartType, series, yAxis), xAxis, yAxis, series.numeric_x);
+                return;
+            } catch (error) {
+                console.error('Error loading chart series, charting loaded rows instead:', error);
+            }
+        } else {
+            try {
+                const series = await this.fetchAggregate(chartType, xAxis, yAxis);
+                this.renderChart(chartId, chartType, this.prepareAggregateData(chartType, series, yAxis), xAxis, yAxis);
+                return;
+            } catch (error) {
+                console.error('Error loading aggregated chart data, charting loaded rows instead:', error);
+            }
+        }
+        
+        const loaded = this.data && this.data.length > 0 && xAxis in this.data[0] && yAxis in this.data[0];
+        if (!loaded) {
+            try {
+                this.data = await fetchColumnRows([...new Set([xAxis, yAxis])]);
+            } catch (error) {
+                console.error('Error loading chart rows:', error);
+                // Template data (first rows only) is the fallback
+                this.data = this.data || parseDjangoJSON('tableData');
+            }
+        }
+        
         const chartData = this.prepareChartData(chartType, xAxis, yAxis);
         
         if (!chartData) {
@@ -258,6 +294,83 @@ class ChartsManager {
         this.renderChart(chartId, chartType, chartData, xAxis, yAxis);
     }
     
+    // Fetch a chart's bucketed series from /api/aggregate/
+    async fetchAggregate(chartType, xAxis, yAxis) {
+        const params = new URLSearchParams({ chart_type: chartType, x: xAxis, y: yAxis });
+        const agg = document.getElementById('chartAggregation')?.value;
+        const bins = document.getElementById('chartBins')?.value;
+        if (agg) params.append('agg', agg);
+        if (bins) params.append('bins', bins);
+        
+        const response = await fetch(`/api/aggregate/?${params.toString()}`);
+        const result = await response.json();
+        if (!response.ok || !result.success) {
+            throw new Error(result.error || 'Failed to aggregate chart data');
+        }
+        return result;
+    }
+    
+    // Fetch a line or scatter series from /api/charts-data/, downsampled to about CHART_TARGET_POINTS points
+    async fetchSeries(chartType, xAxis, yAxis) {
+        const params = new URLSearchParams({ chart_type: chartType, x: xAxis, y: yAxis, points: CHART_TARGET_POINTS });
+        const response = await fetch(`/api/charts-data/?${params.toString()}`);
+        const result = await response.json();
+        if (!response.ok || !result.success) {
+            throw new Error(result.error || 'Failed to load chart series');
+        }
+        return result;
+    }
+    
+    prepareSeriesData(chartType, series, yAxis) {
+        const { data } = series;
+        const points = data.x ? data.y.map((y, index) => ({ x: data.x[index], y: y })) : data.y;
+        const dataset = {
+            label: series.downsampled ? `${yAxis} (${series.returned_points} of ${series.total_points} points)` : yAxis,
+            data: points,
+            backgroundColor: this.chartColors[0],
+            borderColor: this.chartColors[0]
+        };
+        
+        if (chartType === 'scatter') {
+            // A sampled point stands for `weight` rows; denser regions get slightly larger points
+            dataset.pointRadius = series.downsampled ? data.weight.map(weight => 3 + Math.min(5, Math.log2(weight))) : 6;
+            dataset.pointHoverRadius = 8;
+        } else {
+            dataset.borderWidth = 2;
+            dataset.fill = false;
+            dataset.pointRadius = series.downsampled ? 0 : 3;
+        }
+        
+        return data.labels ? { labels: data.labels, datasets: [dataset] } : { datasets: [dataset] };
+    }
+    
+    prepareAggregateData(chartType, series, yAxis) {
+        if (chartType === 'pie' || chartType === 'doughnut') {
+            const colors = series.labels.map((_, index) => this.chartColors[index % this.chartColors.length]);
+            return {
+                labels: series.labels,
+                datasets: [{
+                    data: series.values,
+                    backgroundColor: colors,
+                    borderColor: colors.map(color => this.adjustBrightness(color, -20)),
+                    borderWidth: 2
+                }]
+            };
+        }
+        
+        return {
+            labels: series.labels,
+            datasets: [{
+                label: chartType === 'histogram' ? `Distribution of ${yAxis}` : `${yAxis} (${series.agg})`,
+                data: series.values,
+                backgroundColor: this.chartColors[0],
+                borderColor: this.chartColors[0],
+                borderWidth: 2,
+                fill: chartType === 'histogram'
+            }]
+        };
+    }
+    
     prepareChartData(chartType, xAxis, yAxis) {
         if (!this.data || this.data.length === 0) return null;
         
@@ -392,7 +505,7 @@ class ChartsManager {
         };
     }
     
-    renderChart(chartId, chartType, chartData, xAxis, yAxis) {
+    renderChart(chartId, chartType, chartData, xAxis, yAxis, linearX = false) {
         const chartGrid = document.getElementById('chartGrid');
         if (!chartGrid) return;
         
@@ -434,10 +547,17 @@ class ChartsManager {
         // Create Chart.js instance
         const ctx = document.getElementById(chartId);
         if (ctx) {
+            const options = this.getChartOptions(chartType, xAxis, yAxis);
+            if (linearX && options.scales && options.scales.x) {
+                // Numeric x values are plotted at their position, not as evenly spaced labels
+                options.scales.x.type = 'linear';
+            }
+            
             const chart = new Chart(ctx, {
-                type: chartType,
+                // Chart.js has no histogram type; a histogram is a bar chart of bin counts
+                type: chartType === 'histogram' ? 'bar' : chartType,
                 data: chartData,
-                options: this.getChartOptions(chartType, xAxis, yAxis)
+                options: options
             });
             
             this.charts.set(chartId, chart);
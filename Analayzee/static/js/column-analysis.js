@@ -1,10 +1,18 @@
 // Column Analysis functionality
 class ColumnAnalyzer {
-    constructor(data, columns) {
+    constructor(data, columns, profile = null) {
         this.data = data;
         this.columns = columns;
         this.analysis = {};
-        this.initializeAnalysis();
+        if (profile) {
+            // Computed over the whole dataset by /api/profile/
+            this.columns = columns.filter(column => profile.columns[column]);
+            this.columns.forEach(column => {
+                this.analysis[column] = this.fromProfile(profile.columns[column]);
+            });
+        } else {
+            this.initializeAnalysis();
+        }
     }
     
     // Utility function to format column names
@@ -24,6 +32,17 @@ class ColumnAnalyzer {
         return formatted;
     }
     
+    // JSON has no NaN, so undefined statistics (e.g. the skewness of two values) arrive as null
+    fromProfile(analysis) {
+        if (analysis.type !== 'numeric') return analysis;
+        ['basic', 'dispersion', 'shape', 'percentiles'].forEach(section => {
+            Object.keys(analysis[section]).forEach(key => {
+                if (analysis[section][key] === null) analysis[section][key] = NaN;
+            });
+        });
+        return analysis;
+    }
+    
     initializeAnalysis() {
         this.columns.forEach(column => {
             this.analysis[column] = this.analyzeColumn(column);
@@ -813,9 +832,9 @@ class ColumnAnalyzer {
                                     <div class="distribution-value">${item.count} (${item.percentage.toFixed(1)}%)</div>
                                 </div>
                             `).join('')}
-                            ${analysis.distribution.length > 10 ? `
+                            ${analysis.basic.uniqueValues > 10 ? `
                                 <div class="distribution-summary">
-                                    <em>... and ${analysis.distribution.length - 10} more categories</em>
+                                    <em>... and ${analysis.basic.uniqueValues - 10} more categories</em>
                                 </div>
                             ` : ''}
                         </div>
@@ -880,8 +899,19 @@ function initializeColumnAnalysis() {
     console.log('Column analysis tab found:', columnAnalysisTab);
     
     if (columnAnalysisTab) {
-        columnAnalysisTab.addEventListener('click', () => {
+        columnAnalysisTab.addEventListener('click', async () => {
             console.log('Column analysis tab clicked');
+            
+            // Prefer the server-side profile of the whole dataset
+            try {
+                const profile = await fetchProfile();
+                const columns = window.magicalTable?.columns || Object.keys(profile.columns);
+                const analyzer = new ColumnAnalyzer([], columns, profile);
+                analyzer.renderColumnCards();
+                return;
+            } catch (error) {
+                console.error('Error loading column profile, analyzing the preview instead:', error);
+            }
             console.log('window.magicalTable:', window.magicalTable);
             console.log('window.magicalTable.data:', window.magicalTable?.data);
             console.log('window.magicalTable.columns:', window.magicalTable?.columns);
@@ -37,6 +37,8 @@ class DataCleaningManager {
             this.originalData = JSON.parse(JSON.stringify(tableData));
             this.data = JSON.parse(JSON.stringify(tableData)); // Working copy
             this.columns = tableColumns;
+            // Stored dataset version the server cleans; each cleaning step moves it forward
+            this.dataset = parseDjangoJSON('datasetVersion');
             
             this.populateColumnSelect();
             console.log('Data loaded for cleaning:', {
@@ -96,6 +98,28 @@ class DataCleaningManager {
             resetButton.addEventListener('click', () => this.resetCleaning());
         }
         
+        // Undo / redo buttons step through the dataset's stored versions
+        const undoButton = document.getElementById('undoCleaning');
+        if (undoButton) {
+            undoButton.addEventListener('click', () => this.moveVersion('undo'));
+        }
+        const redoButton = document.getElementById('redoCleaning');
+        if (redoButton) {
+            redoButton.addEventListener('click', () => this.moveVersion('redo'));
+        }
+        
+        // Clicking a history entry checks that version out
+        const historyList = document.querySelector('.history-list');
+        if (historyList) {
+            historyList.addEventListener('click', (e) => {
+                const item = e.target.closest('.history-item[data-version]');
+                if (item && !item.classList.contains('current')) {
+                    this.moveVersion('checkout', item.dataset.version);
+                }
+            });
+        }
+        this.refreshVersions();
+        
         // Listen for missing action changes
         document.addEventListener('change', (e) => {
             if (e.target.id === 'missingAction') {
@@ -274,22 +298,18 @@ class DataCleaningManager {
             return;
         }
         
-        if (!this.isNumericColumn(column)) {
-            this.showError('This operation only works with numeric columns');
-            return;
-        }
-        
         this.showLoading();
         
         try {
             const config = this.getOperationConfig();
-            const result = this.applyCleaningLocally(column, operation, config);
+            const result = await this.applyCleaningOnServer(column, operation, config);
             
             if (result.success) {
                 this.showSuccess('Cleaning operation applied successfully');
-                this.addToHistory(column, operation, config);
-                this.updateData(result.cleaned_data);
-                this.showPreview(result.cleaned_data, column);
+                this.columns = result.columns;
+                this.refreshVersions();
+                this.updateData(result.preview);
+                this.showPreview(result.preview, column);
             } else {
                 this.showError(result.error || 'Failed to apply cleaning operation');
             }
@@ -301,6 +321,29 @@ class DataCleaningManager {
         this.hideLoading();
     }
     
+    // The server cleans the stored dataset and answers with stats and the first rows only
+    async applyCleaningOnServer(column, operation, config) {
+        const formData = this.cleaningFormData(column, operation, config);
+        const response = await fetch('/apply-cleaning/', { method: 'POST', body: formData });
+        const result = await response.json();
+        if (result.success && this.dataset) {
+            this.dataset.version = result.version;
+        }
+        return result;
+    }
+    
+    cleaningFormData(column, operation, config) {
+        const formData = new FormData();
+        formData.append('column', column);
+        formData.append('operation', operation);
+        if (this.dataset) {
+            formData.append('dataset_id', this.dataset.dataset_id);
+            formData.append('version', this.dataset.version);
+        }
+        Object.entries(config).forEach(([key, value]) => formData.append(key, value));
+        return formData;
+    }
+    
     applyCleaningLocally(column, operation, config) {
         try {
             // Create a copy of the current data
@@ -442,57 +485,85 @@ class DataCleaningManager {
         return config;
     }
     
-    addToHistory(column, operation, config) {
-        const historyItem = {
-            id: Date.now(),
-            column: column,
-            operation: operation,
-            config: config,
-            timestamp: new Date().toLocaleString(),
-            description: this.getOperationDescription(operation, config)
-        };
-        
-        this.cleaningHistory.unshift(historyItem);
-        this.updateHistoryDisplay();
+    // Fetch the dataset's kept versions; the history list shows them newest first
+    async refreshVersions() {
+        if (!this.dataset) return;
+        try {
+            const response = await fetch('/api/versions/');
+            const result = await response.json();
+            if (result.success) {
+                this.updateHistoryDisplay(result);
+            }
+        } catch (error) {
+            console.error('Error loading dataset versions:', error);
+        }
     }
     
-    getOperationDescription(operation, config) {
-        const operationNames = {
-            'missing-values': 'Handle Missing Values',
-            'normalize': 'Normalize Data'
-        };
-        
-        let description = operationNames[operation] || operation;
-        
-        if (config.action) {
-            description += ` - ${config.action}`;
-        } else if (config.method) {
-            description += ` - ${config.method}`;
+    // Undo, redo or check out a version; the server answers with the new current data
+    async moveVersion(action, version = null) {
+        if (!this.dataset) return;
+        const formData = new FormData();
+        formData.append('action', action);
+        if (version !== null) {
+            formData.append('version', version);
         }
         
-        return description;
+        this.showLoading();
+        try {
+            const response = await fetch('/api/versions/', { method: 'POST', body: formData });
+            const result = await response.json();
+            if (result.success) {
+                this.dataset.version = result.version;
+                this.columns = result.columns;
+                this.updateData(result.preview);
+                this.clearPreview();
+                this.updateHistoryDisplay(result);
+                this.showSuccess(`Now at version ${result.version}`);
+            } else {
+                this.showError(result.error || `Could not ${action}`);
+            }
+        } catch (error) {
+            console.error('Error changing dataset version:', error);
+            this.showError('Error changing dataset version');
+        }
+        this.hideLoading();
     }
     
-    updateHistoryDisplay() {
+    updateHistoryDisplay(state) {
+        this.cleaningHistory = state.versions.slice().reverse();
+        
+        const undoButton = document.getElementById('undoCleaning');
+        if (undoButton) undoButton.disabled = !state.can_undo;
+        const redoButton = document.getElementById('redoCleaning');
+        if (redoButton) redoButton.disabled = !state.can_redo;
+        
         const historyList = document.querySelector('.history-list');
         if (!historyList) return;
         
         historyList.innerHTML = this.cleaningHistory.map(item => `
-            <div class="history-item">
-                <h4>${item.description}</h4>
-                <p>Column: ${item.column}</p>
-                <div class="timestamp">${item.timestamp}</div>
+            <div class="history-item${item.version === state.version ? ' current' : ''}" data-version="${item.version}">
+                <h4>${this.escapeHtml(item.label || 'Original data')}</h4>
+                <p>Version ${item.version} &middot; ${item.rows} rows, ${item.columns} columns</p>
+                <div class="timestamp">${item.updated_at ? new Date(item.updated_at).toLocaleString() : ''}</div>
             </div>
         `).join('');
     }
     
+    // Labels name columns, which come from the uploaded file
+    escapeHtml(text) {
+        const element = document.createElement('div');
+        element.textContent = text;
+        return element.innerHTML;
+    }
+    
     updateData(newData) {
         this.data = newData;
+        resetProfile();
         
         // Update the magical table if it exists
         if (window.magicalTable) {
             window.magicalTable.data = newData;
-            window.magicalTable.filteredData = [...newData];
+            // The table reads its pages from the server, which now holds the cleaned data
             window.magicalTable.render();
         }
         
@@ -535,7 +606,8 @@ class DataCleaningManager {
         preview.innerHTML = tableHTML;
     }
     
-    previewCleaning() {
+    // The server runs the operation on a cached sample of the stored dataset and writes nothing
+    async previewCleaning() {
         const columnSelect = document.getElementById('cleaningColumn');
         const operationSelect = document.getElementById('cleaningOperation');
         
@@ -547,17 +619,19 @@ class DataCleaningManager {
             return;
         }
         
-        if (!this.isNumericColumn(column)) {
-            this.showError('This operation only works with numeric columns');
-            return;
-        }
-        
         this.showLoading();
         
         try {
             const config = this.getOperationConfig();
-            const previewData = this.generatePreviewData(column, operation, config);
-            this.showPreviewComparison(previewData, column);
+            const formData = this.cleaningFormData(column, operation, config);
+            const response = await fetch('/preview-cleaning/', { method: 'POST', body: formData });
+            const result = await response.json();
+            
+            if (result.success) {
+                this.showPreviewComparison(result, operation, config);
+            } else {
+                this.showError(result.error || 'Failed to preview cleaning operation');
+            }
         } catch (error) {
             console.error('Error generating preview:', error);
             this.showError('Error generating preview: ' + error.message);
@@ -566,167 +640,62 @@ class DataCleaningManager {
         this.hideLoading();
     }
     
-    generatePreviewData(column, operation, config) {
-        // Create a copy of the data for preview
-        const previewData = JSON.parse(JSON.stringify(this.data.slice(0, 20))); // Preview first 20 rows
-        
-        switch (operation) {
-            case 'missing-values':
-                return this.previewMissingValues(previewData, column, config);
-            case 'normalize':
-                return this.previewNormalize(previewData, column, config);
-            default:
-                return { before: previewData, after: previewData, changes: [] };
-        }
-    }
-    
-    previewMissingValues(data, column, config) {
-        const before = [...data];
-        const after = [...data];
-        const changes = [];
-        
-        const action = config.action || 'fill-mean';
-        
-        // Find missing values (including NaN)
-        const missingIndices = [];
-        data.forEach((row, index) => {
-            const value = row[column];
-            if (this.isEmptyValue(value)) {
-                missingIndices.push(index);
-            }
-        });
+    getOperationDescription(operation, config) {
+        const operationNames = {
+            'missing-values': 'Handle Missing Values',
+            'outliers': 'Handle Outliers',
+            'data-type': 'Convert Data Type',
+            'text-cleaning': 'Text Cleaning',
+            'duplicates': 'Remove Duplicates',
+            'normalize': 'Normalize Data'
+        };
         
-        if (missingIndices.length === 0) {
-            changes.push({ type: 'info', message: 'No missing values found in sample data' });
-            return { before, after, changes };
-        }
+        let description = operationNames[operation] || operation;
         
-        // Calculate fill value based on action
-        let fillValue = null;
-        if (action === 'fill-mean' && this.isNumericColumn(column)) {
-            const numericValues = data.map(row => row[column]).filter(val => !this.isEmptyValue(val) && typeof val === 'number');
-            fillValue = numericValues.length > 0 ? numericValues.reduce((a, b) => a + b, 0) / numericValues.length : 0;
-        } else if (action === 'fill-median' && this.isNumericColumn(column)) {
-            const numericValues = data.map(row => row[column]).filter(val => !this.isEmptyValue(val) && typeof val === 'number');
-            numericValues.sort((a, b) => a - b);
-            fillValue = numericValues.length > 0 ? numericValues[Math.floor(numericValues.length / 2)] : 0;
-        } else if (action === 'fill-mode') {
-            const values = data.map(row => row[column]).filter(val => !this.isEmptyValue(val));
-            const valueCounts = {};
-            values.forEach(val => valueCounts[val] = (valueCounts[val] || 0) + 1);
-            const maxCount = Math.max(...Object.values(valueCounts));
-            fillValue = Object.keys(valueCounts).find(key => valueCounts[key] === maxCount);
-        } else if (action === 'fill-zero') {
-            fillValue = 0;
-        } else if (action === 'fill-custom') {
-            fillValue = config.custom_value || 'Custom Value';
-        } else if (action === 'drop') {
-            // Remove rows with missing values
-            missingIndices.reverse().forEach(index => {
-                data.splice(index, 1);
-            });
-            changes.push({ type: 'info', message: `Removed ${missingIndices.length} rows with missing values` });
-            return { before, after, changes };
+        if (config.action) {
+            description += ` - ${config.action}`;
+        } else if (config.method) {
+            description += ` - ${config.method}`;
         }
         
-        // Apply changes
-        missingIndices.forEach(index => {
-            data[index][column] = fillValue;
-        });
-        
-        changes.push({ type: 'info', message: `Filled ${missingIndices.length} missing values with ${fillValue}` });
-        return { before, after, changes };
+        return description;
     }
     
-    previewNormalize(data, column, config) {
-        const before = [...data];
-        const after = [...data];
-        const changes = [];
-        
-        if (!this.isNumericColumn(column)) {
-            return { before, after, changes: [{ type: 'error', message: 'Normalization only works with numeric columns' }] };
-        }
-        
-        const method = config.method || 'minmax';
-        const rangeMin = config.range_min || 0;
-        const rangeMax = config.range_max || 1;
-        
-        const values = data.map(row => row[column]).filter(val => val !== null && val !== undefined && !isNaN(val));
-        
-        if (values.length === 0) {
-            return { before, after, changes: [{ type: 'error', message: 'No numeric values found for normalization' }] };
-        }
-        
-        const min = Math.min(...values);
-        const max = Math.max(...values);
-        const mean = values.reduce((a, b) => a + b, 0) / values.length;
-        const std = Math.sqrt(values.reduce((sum, val) => sum + Math.pow(val - mean, 2), 0) / values.length);
-        
-        data.forEach((row, index) => {
-            if (row[column] === null || row[column] === undefined || isNaN(row[column])) return;
-            
-            const oldValue = row[column];
-            let newValue = oldValue;
-            
-            if (method === 'minmax') {
-                newValue = ((row[column] - min) / (max - min)) * (rangeMax - rangeMin) + rangeMin;
-            } else if (method === 'zscore') {
-                newValue = (row[column] - mean) / std;
-            } else if (method === 'robust') {
-                const sorted = [...values].sort((a, b) => a - b);
-                const q1 = sorted[Math.floor(sorted.length * 0.25)];
-                const q3 = sorted[Math.floor(sorted.length * 0.75)];
-                const iqr = q3 - q1;
-                newValue = (row[column] - q1) / iqr;
-            }
-            
-            if (newValue !== oldValue) {
-                changes.push({
-                    type: 'normalized',
-                    index,
-                    oldValue,
-                    newValue,
-                    message: `Row ${index + 1}: ${oldValue.toFixed(2)} → ${newValue.toFixed(2)}`
-                });
-                after[index][column] = newValue;
-            }
-        });
-        
-        if (changes.length === 0) {
-            changes.push({ type: 'info', message: 'No normalization needed for sample data' });
-        }
-        
-        return { before, after, changes };
+    formatPreviewValue(value) {
+        if (value === null || value === undefined) return 'null';
+        if (typeof value === 'number' && !Number.isInteger(value)) return value.toFixed(4);
+        return this.escapeHtml(String(value));
     }
     
-    showPreviewComparison(previewData, column) {
+    showPreviewComparison(result, operation, config) {
         const preview = document.getElementById('cleaningPreview');
         if (!preview) return;
         
-        const { before, after, changes } = previewData;
+        const column = this.escapeHtml(result.column);
+        const sampled = result.sample_rows < result.total_rows;
         
         let comparisonHTML = `
-            <h3>Preview: ${this.getOperationDescription(this.currentOperation, this.getOperationConfig())}</h3>
+            <h3>Preview: ${this.getOperationDescription(operation, config)}</h3>
             <div class="preview-summary">
                 <p><strong>Column:</strong> ${column}</p>
-                <p><strong>Changes:</strong> ${changes.length} modifications will be applied</p>
+                <p><strong>Sample:</strong> ${result.sample_rows.toLocaleString()} of ${result.total_rows.toLocaleString()} rows${sampled ? ' (counts below are estimated for all rows)' : ''}</p>
+                <p><strong>Changes:</strong> ${result.changed_rows} sampled rows will be modified or removed</p>
             </div>
         `;
         
-        // Show changes summary
-        if (changes.length > 0) {
+        // Stats of the operation, estimated for the whole dataset
+        const stats = Object.entries(result.stats);
+        if (stats.length > 0) {
             comparisonHTML += `
                 <div class="changes-summary">
                     <h4>Changes Summary:</h4>
                     <div class="changes-list">
             `;
             
-            changes.forEach(change => {
-                const changeClass = change.type === 'error' ? 'error' : 
-                                  change.type === 'info' ? 'info' : 'change';
+            stats.forEach(([key, value]) => {
                 comparisonHTML += `
-                    <div class="change-item ${changeClass}">
-                        <span class="change-message">${change.message}</span>
+                    <div class="change-item info">
+                        <span class="change-message">${this.escapeHtml(key.replace(/_/g, ' '))}: ${this.formatPreviewValue(value)}</span>
                     </div>
                 `;
             });
@@ -737,11 +706,10 @@ class DataCleaningManager {
             `;
         }
         
-        // Show before/after comparison table
-        const columns = Object.keys(before[0] || {});
+        // Show before/after comparison table, changed rows first
         comparisonHTML += `
             <div class="comparison-table">
-                <h4>Before vs After Comparison (First 5 rows):</h4>
+                <h4>Before vs After Comparison (Sampled rows):</h4>
                 <table class="preview-table">
                     <thead>
                         <tr>
@@ -755,20 +723,16 @@ class DataCleaningManager {
                     <tbody>
         `;
         
-        const sampleRows = before.slice(0, 5);
-        sampleRows.forEach((row, rowIndex) => {
-            const beforeValue = row[column];
-            const afterValue = after[rowIndex] ? after[rowIndex][column] : 'REMOVED';
-            const hasChanged = beforeValue !== afterValue;
-            const status = hasChanged ? 'Modified' : 'Unchanged';
-            const statusClass = hasChanged ? 'modified' : 'unchanged';
+        result.rows.forEach(row => {
+            const statusClass = row.status === 'unchanged' ? 'unchanged' : 'modified';
+            const status = row.status.charAt(0).toUpperCase() + row.status.slice(1);
             
             comparisonHTML += `
                 <tr class="${statusClass}">
-                    <td>${rowIndex + 1}</td>
+                    <td>${row.row + 1}</td>
                     <td>${column}</td>
-                    <td>${beforeValue !== null && beforeValue !== undefined ? beforeValue : 'null'}</td>
-                    <td>${afterValue !== null && afterValue !== undefined ? afterValue : 'null'}</td>
+                    <td>${this.formatPreviewValue(row.before)}</td>
+                    <td>${row.status === 'removed' ? 'REMOVED' : this.formatPreviewValue(row.after)}</td>
                     <td><span class="status-badge ${statusClass}">${status}</span></td>
                 </tr>
             `;
@@ -789,21 +753,21 @@ class DataCleaningManager {
         preview.innerHTML = comparisonHTML;
     }
     
-    resetCleaning() {
-        // Restore original data
-        this.data = JSON.parse(JSON.stringify(this.originalData));
-        this.cleaningHistory = [];
-        this.updateHistoryDisplay();
-        this.clearPreview();
-        
+    async resetCleaning() {
         // Reset form
         document.getElementById('cleaningColumn').value = '';
         document.getElementById('cleaningOperation').value = '';
+        this.clearPreview();
         
-        // Update other components with original data
-        this.updateData(this.data);
-        
-        this.showSuccess('Data restored to original state');
+        // Check out the oldest kept version; the newer ones stay available to redo
+        const oldest = this.cleaningHistory[this.cleaningHistory.length - 1];
+        if (this.dataset && oldest && oldest.version !== this.dataset.version) {
+            await this.moveVersion('checkout', oldest.version);
+        } else if (!this.dataset) {
+            this.data = JSON.parse(JSON.stringify(this.originalData));
+            this.updateData(this.data);
+            this.showSuccess('Data restored to original state');
+        }
     }
     
     isNumericColumn(column) {
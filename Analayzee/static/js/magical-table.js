@@ -1,4 +1,6 @@
 // Magical Table functionality
+// Sorting, filtering, search and paging run on the server (/api/table/);
+// the browser only ever holds the current page.
 class MagicalTable {
     constructor() {
         const tableData = parseDjangoJSON('tableData');
@@ -9,17 +11,21 @@ class MagicalTable {
             this.data = [];
             this.columns = [];
         } else {
+            // Preview rows rendered into the page, still used by column analysis
             this.data = tableData;
             this.columns = tableColumns;
         }
         
         this.currentPage = 1;
         this.rowsPerPage = 25;
-        this.sortColumn = null;
-        this.sortDirection = 'asc';
+        this.sortColumns = []; // [{column, direction}], first entry is the primary sort
+        this.columnFilters = {}; // column -> text the column must contain
         this.searchTerm = '';
         this.visibleColumns = [...this.columns];
-        this.filteredData = [...this.data];
+        this.pageData = [];
+        this.matchedRows = this.data.length;
+        this.requestCounter = 0;
+        this.searchTimer = null;
         
         this.initializeEventListeners();
         this.render();
@@ -28,7 +34,8 @@ class MagicalTable {
     initializeEventListeners() {
         // Rows per page
         document.getElementById('rowsPerPage').addEventListener('change', (e) => {
-            this.rowsPerPage = e.target.value === 'all' ? this.data.length : parseInt(e.target.value);
+            // 'all' asks for as many rows as the server allows in one page
+            this.rowsPerPage = e.target.value === 'all' ? null : parseInt(e.target.value);
             this.currentPage = 1;
             this.render();
         });
@@ -37,8 +44,7 @@ class MagicalTable {
         document.getElementById('searchBox').addEventListener('input', (e) => {
             this.searchTerm = e.target.value.toLowerCase();
             this.currentPage = 1;
-            this.filterData();
-            this.render();
+            this.scheduleRender();
         });
         
         // Column customization
@@ -81,50 +87,82 @@ class MagicalTable {
         }, 3000);
     }
     
-    filterData() {
-        this.filteredData = this.data.filter(row => {
-            if (!this.searchTerm) return true;
-            
-            return this.visibleColumns.some(column => {
-                const value = row[column];
-                return value && value.toString().toLowerCase().includes(this.searchTerm);
+    // Wait for typing to pause before querying the server
+    scheduleRender() {
+        clearTimeout(this.searchTimer);
+        this.searchTimer = setTimeout(() => this.render(), 250);
+    }
+    
+    buildQuery(offset, limit, columns) {
+        const params = new URLSearchParams({ offset: offset, limit: limit });
+        columns.forEach(column => params.append('columns', column));
+        
+        if (this.sortColumns.length > 0) {
+            params.set('sort', JSON.stringify(this.sortColumns));
+        }
+        
+        const filters = Object.entries(this.columnFilters)
+            .filter(([column, value]) => value && this.columns.includes(column))
+            .map(([column, value]) => ({ column: column, op: 'contains', value: value }));
+        if (filters.length > 0) {
+            params.set('filters', JSON.stringify(filters));
+        }
+        
+        if (this.searchTerm) {
+            params.set('search', this.searchTerm);
+            this.visibleColumns.forEach(column => params.append('search_columns', column));
+        }
+        return params;
+    }
+    
+    async fetchPage(offset, limit, columns) {
+        const response = await fetch(`/api/table/?${this.buildQuery(offset, limit, columns).toString()}`);
+        const result = await response.json();
+        if (!response.ok || !result.success) {
+            throw new Error(result.error || 'Failed to load table rows');
+        }
+        
+        const rows = [];
+        for (let i = 0; i < result.row_ids.length; i++) {
+            const row = {};
+            result.columns.forEach(column => {
+                row[column] = result.data[column][i];
             });
-        });
+            rows.push(row);
+        }
+        return { rows: rows, matchedRows: result.matched_rows, limit: result.limit };
     }
     
-    sort(column) {
-        if (this.sortColumn === column) {
-            this.sortDirection = this.sortDirection === 'asc' ? 'desc' : 'asc';
-        } else {
-            this.sortColumn = column;
-            this.sortDirection = 'asc';
+    // Every row matching the current sort, filters and search (used for export)
+    async fetchAllRows(pageSize = 10000) {
+        const rows = [];
+        let offset = 0;
+        while (true) {
+            const page = await this.fetchPage(offset, pageSize, this.visibleColumns);
+            rows.push(...page.rows);
+            offset += page.rows.length;
+            if (page.rows.length === 0 || offset >= page.matchedRows) break;
         }
+        return rows;
+    }
+    
+    sort(column, addToSort = false) {
+        const existing = this.sortColumns.find(item => item.column === column);
         
-        this.filteredData.sort((a, b) => {
-            let aVal = a[column];
-            let bVal = b[column];
-            
-            // Handle null/undefined values
-            if (aVal === null || aVal === undefined) aVal = '';
-            if (bVal === null || bVal === undefined) bVal = '';
-            
-            // Try to convert to numbers for numeric sorting
-            const aNum = parseFloat(aVal);
-            const bNum = parseFloat(bVal);
-            
-            if (!isNaN(aNum) && !isNaN(bNum)) {
-                aVal = aNum;
-                bVal = bNum;
+        if (addToSort) {
+            // Shift+click adds a secondary sort or flips the direction of an existing one
+            if (existing) {
+                existing.direction = existing.direction === 'asc' ? 'desc' : 'asc';
             } else {
-                aVal = aVal.toString().toLowerCase();
-                bVal = bVal.toString().toLowerCase();
+                this.sortColumns.push({ column: column, direction: 'asc' });
             }
-            
-            if (aVal < bVal) return this.sortDirection === 'asc' ? -1 : 1;
-            if (aVal > bVal) return this.sortDirection === 'asc' ? 1 : -1;
-            return 0;
-        });
+        } else if (existing && this.sortColumns.length === 1) {
+            existing.direction = existing.direction === 'asc' ? 'desc' : 'asc';
+        } else {
+            this.sortColumns = [{ column: column, direction: 'asc' }];
+        }
         
+        this.currentPage = 1;
         this.render();
     }
     
@@ -157,11 +195,10 @@ class MagicalTable {
     reset() {
         this.currentPage = 1;
         this.rowsPerPage = 25;
-        this.sortColumn = null;
-        this.sortDirection = 'asc';
+        this.sortColumns = [];
+        this.columnFilters = {};
         this.searchTerm = '';
         this.visibleColumns = [...this.columns];
-        this.filteredData = [...this.data];
         
         document.getElementById('rowsPerPage').value = '25';
         document.getElementById('searchBox').value = '';
@@ -175,10 +212,33 @@ class MagicalTable {
         this.render();
     }
     
-    render() {
-        // Update table headers
-        const thead = document.querySelector('.magical-table thead tr');
-        thead.innerHTML = '';
+    async render() {
+        // Only the newest request may update the table
+        const requestId = ++this.requestCounter;
+        const pageSize = this.rowsPerPage || 10000;
+        
+        try {
+            const page = await this.fetchPage((this.currentPage - 1) * pageSize, pageSize, this.visibleColumns);
+            if (requestId !== this.requestCounter) return;
+            this.pageData = page.rows;
+            this.matchedRows = page.matchedRows;
+            this.pageSize = this.rowsPerPage || page.limit;
+        } catch (error) {
+            if (requestId !== this.requestCounter) return;
+            console.error('Error loading table page:', error);
+            // Fall back to the preview rows embedded in the page
+            this.pageData = this.data.slice(0, pageSize);
+            this.matchedRows = this.pageData.length;
+            this.pageSize = pageSize;
+        }
+        
+        this.renderTable();
+    }
+    
+    renderHeaders() {
+        const thead = document.querySelector('.magical-table thead');
+        const headerRow = thead.querySelector('tr');
+        headerRow.innerHTML = '';
         
         this.visibleColumns.forEach(column => {
             const th = document.createElement('th');
@@ -186,19 +246,56 @@ class MagicalTable {
             th.setAttribute('data-column', column);
             th.textContent = column;
             
-            if (this.sortColumn === column) {
-                th.classList.add(this.sortDirection === 'asc' ? 'sort-asc' : 'sort-desc');
+            const sortIndex = this.sortColumns.findIndex(item => item.column === column);
+            if (sortIndex > -1) {
+                th.classList.add(this.sortColumns[sortIndex].direction === 'asc' ? 'sort-asc' : 'sort-desc');
+                if (this.sortColumns.length > 1) {
+                    th.textContent = `${column} (${sortIndex + 1})`;
+                }
             }
             
-            th.addEventListener('click', () => this.sort(column));
-            thead.appendChild(th);
+            th.title = 'Click to sort, Shift+click to add a secondary sort';
+            th.addEventListener('click', (e) => this.sort(column, e.shiftKey));
+            headerRow.appendChild(th);
         });
         
+        // Per-column filter inputs; rebuilt only when the columns change so typing keeps focus
+        let filterRow = thead.querySelector('tr.filter-row');
+        const columnsKey = this.visibleColumns.join('\u0000');
+        if (filterRow && filterRow.dataset.columns === columnsKey) return;
+        
+        if (!filterRow) {
+            filterRow = document.createElement('tr');
+            filterRow.className = 'filter-row';
+            thead.appendChild(filterRow);
+        }
+        filterRow.dataset.columns = columnsKey;
+        filterRow.innerHTML = '';
+        
+        this.visibleColumns.forEach(column => {
+            const th = document.createElement('th');
+            const input = document.createElement('input');
+            input.type = 'text';
+            input.placeholder = 'Filter...';
+            input.value = this.columnFilters[column] || '';
+            input.style.width = '100%';
+            input.addEventListener('input', (e) => {
+                this.columnFilters[column] = e.target.value;
+                this.currentPage = 1;
+                this.scheduleRender();
+            });
+            th.appendChild(input);
+            filterRow.appendChild(th);
+        });
+    }
+    
+    renderTable() {
+        this.renderHeaders();
+        
         // Calculate pagination
-        const totalPages = Math.ceil(this.filteredData.length / this.rowsPerPage);
-        const startIndex = (this.currentPage - 1) * this.rowsPerPage;
-        const endIndex = startIndex + this.rowsPerPage;
-        const pageData = this.rowsPerPage === this.data.length ? this.filteredData : this.filteredData.slice(startIndex, endIndex);
+        const totalPages = Math.ceil(this.matchedRows / this.pageSize);
+        const startIndex = (this.currentPage - 1) * this.pageSize;
+        const pageData = this.pageData;
         
         // Update table body
         const tbody = document.querySelector('.magical-table tbody');
@@ -246,9 +343,9 @@ class MagicalTable {
         // Update info
         const infoElement = document.getElementById('tableInfo');
         if (infoElement) {
-            const totalRows = this.filteredData.length;
+            const totalRows = this.matchedRows;
             const startRow = totalRows === 0 ? 0 : startIndex + 1;
-            const endRow = Math.min(endIndex, totalRows);
+            const endRow = Math.min(startIndex + pageData.length, totalRows);
             infoElement.textContent = `Showing ${startRow} to ${endRow} of ${totalRows} entries`;
         }
     }
@@ -363,6 +460,68 @@ function parseDjangoJSON(elementId) {
     }
 }
 
+// Fetch a window of rows from /api/rows/ as column-oriented arrays
+async function fetchRows(columns, offset = 0, limit = 100) {
+    const params = new URLSearchParams({ offset: offset, limit: limit });
+    (columns || []).forEach(column => params.append('columns', column));
+    
+    const response = await fetch(`/api/rows/?${params.toString()}`);
+    const result = await response.json();
+    if (!response.ok || !result.success) {
+        throw new Error(result.error || 'Failed to load rows');
+    }
+    return result;
+}
+
+// Fetch complete columns page by page and return them as row objects
+async function fetchColumnRows(columns, pageSize = 10000) {
+    const rows = [];
+    let offset = 0;
+    let totalRows = null;
+    
+    while (totalRows === null || offset < totalRows) {
+        const page = await fetchRows(columns, offset, pageSize);
+        totalRows = page.total_rows;
+        for (let i = 0; i < page.returned_rows; i++) {
+            const row = {};
+            page.columns.forEach(column => {
+                row[column] = page.data[column][i];
+            });
+            rows.push(row);
+        }
+        if (page.returned_rows === 0) break;
+        offset += page.returned_rows;
+    }
+    return rows;
+}
+
+// Fetch the per-column profile from /api/profile/; shared by the statistics and column analysis tabs
+let datasetProfilePromise = null;
+
+function fetchProfile() {
+    if (!datasetProfilePromise) {
+        datasetProfilePromise = fetch('/api/profile/')
+            .then(async response => {
+                const result = await response.json();
+                if (!response.ok) {
+                    throw new Error(result.error || 'Failed to load profile');
+                }
+                return result;
+            })
+            .catch(error => {
+                // Let the next caller try again
+                datasetProfilePromise = null;
+                throw error;
+            });
+    }
+    return datasetProfilePromise;
+}
+
+// Forget the cached profile once the dataset has changed
+function resetProfile() {
+    datasetProfilePromise = null;
+}
+
 // Flag to prevent multiple initializations
 let columnCustomizerInitialized = false;
 
@@ -592,18 +751,25 @@ function showExportOptions() {
     });
 }
 
-function exportTableData(format) {
+async function exportTableData(format) {
     if (!window.magicalTable) return;
 
     // Get visible data based on current state
     const visibleColumns = window.magicalTable.visibleColumns;
-    const filteredData = window.magicalTable.filteredData;
     
     if (!visibleColumns || visibleColumns.length === 0) {
         alert('No visible columns to export');
         return;
     }
 
+    let filteredData;
+    try {
+        filteredData = await window.magicalTable.fetchAllRows();
+    } catch (error) {
+        console.error('Error loading rows for export:', error);
+        filteredData = window.magicalTable.pageData;
+    }
+
     // Prepare data for export
     const exportData = filteredData.map(row => {
         const exportRow = {};
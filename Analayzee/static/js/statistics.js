@@ -1,4 +1,9 @@
 // Statistics functionality for Analayzee
+
+// Above this many numeric columns the correlation card lists the strongest pairs instead of the matrix
+const CORRELATION_MATRIX_MAX_COLUMNS = 15;
+const CORRELATION_TOP_PAIRS = 20;
+
 class StatisticsManager {
     constructor() {
         this.data = null;
@@ -72,7 +77,9 @@ class StatisticsManager {
             const result = await response.json();
             
             if (result.success) {
-                this.data = result.data;
+                // Column values are fetched on demand by loadColumns()
+                this.data = null;
+                this.loadedColumns = new Set();
                 this.columns = result.columns;
                 this.numericColumns = result.numeric_columns || [];
                 this.categoricalColumns = result.categorical_columns || [];
@@ -182,6 +189,22 @@ class StatisticsManager {
         }
     }
     
+    async loadColumns(columns) {
+        // Template data already holds every column (for the preview rows only)
+        if (!this.loadedColumns) return;
+        
+        const missing = columns.filter(column => !this.loadedColumns.has(column));
+        if (missing.length === 0) return;
+        
+        const rows = await fetchColumnRows(missing);
+        if (!this.data) {
+            this.data = rows;
+        } else {
+            rows.forEach((row, index) => Object.assign(this.data[index], row));
+        }
+        missing.forEach(column => this.loadedColumns.add(column));
+    }
+    
     isNumericColumn(column) {
         if (!this.data || this.data.length === 0) return false;
         
@@ -192,7 +215,7 @@ class StatisticsManager {
         });
     }
     
-    generateStatistics() {
+    async generateStatistics() {
         const analysisType = document.getElementById('analysisType')?.value || 'descriptive';
         const column = document.getElementById('statisticsColumn')?.value;
         
@@ -204,14 +227,23 @@ class StatisticsManager {
         this.currentAnalysis = { type: analysisType, column: column };
         
         try {
+            // Only fetch the columns this analysis reads; descriptive statistics and correlations come from the server
+            if (analysisType === 'descriptive' || analysisType === 'correlation') {
+                // Computed on the server
+            } else if (analysisType === 'insights') {
+                await this.loadColumns(this.columns);
+            } else {
+                await this.loadColumns([column]);
+            }
+            
             let analysisData = null;
             
             switch (analysisType) {
                 case 'descriptive':
-                    analysisData = this.generateDescriptiveStatistics(column);
+                    analysisData = await this.generateDescriptiveStatistics(column);
                     break;
                 case 'correlation':
-                    analysisData = this.generateCorrelationMatrix();
+                    analysisData = await this.generateCorrelationMatrix();
                     break;
                 case 'outliers':
                     analysisData = this.generateOutlierAnalysis(column);
@@ -220,10 +252,10 @@ class StatisticsManager {
                     analysisData = this.generateDistributionAnalysis(column);
                     break;
                 case 'insights':
-                    analysisData = this.generateDataInsights();
+                    analysisData = await this.generateDataInsights();
                     break;
                 default:
-                    analysisData = this.generateDescriptiveStatistics(column);
+                    analysisData = await this.generateDescriptiveStatistics(column);
             }
             
             // Store the analysis data
@@ -243,14 +275,28 @@ class StatisticsManager {
         }
     }
     
-    generateDescriptiveStatistics(column) {
-        const values = this.getNumericValues(column);
-        if (values.length === 0) {
-            this.showError('No numeric data available for this column');
-            return null;
+    async generateDescriptiveStatistics(column) {
+        let stats = null;
+        try {
+            const profile = await fetchProfile();
+            const analysis = profile.columns[column];
+            if (!analysis || analysis.type !== 'numeric') {
+                this.showError('No numeric data available for this column');
+                return null;
+            }
+            stats = this.profileToDescriptiveStats(analysis);
+        } catch (error) {
+            // Fall back to computing over the column's rows
+            console.error('Error loading profile:', error);
+            await this.loadColumns([column]);
+            const values = this.getNumericValues(column);
+            if (values.length === 0) {
+                this.showError('No numeric data available for this column');
+                return null;
+            }
+            stats = this.calculateDescriptiveStats(values);
         }
         
-        const stats = this.calculateDescriptiveStats(values);
         const cardId = `descriptive-${Date.now()}`;
         
         this.renderDescriptiveStatistics(column, stats, cardId);
@@ -263,15 +309,49 @@ class StatisticsManager {
         };
     }
     
-    generateCorrelationMatrix() {
+    // Fetch correlations from /api/correlation/ (the whole matrix, or pairs with top/min_abs)
+    async fetchCorrelation(options = {}) {
+        const params = new URLSearchParams({ method: options.method || 'pearson' });
+        if (options.top) params.append('top', options.top);
+        if (options.minAbs) params.append('min_abs', options.minAbs);
+        
+        const response = await fetch(`/api/correlation/?${params.toString()}`);
+        const result = await response.json();
+        if (!response.ok || !result.success) {
+            throw new Error(result.error || 'Failed to load correlations');
+        }
+        return result;
+    }
+    
+    async generateCorrelationMatrix() {
         if (this.numericColumns.length < 2) {
             this.showError('Need at least 2 numeric columns for correlation analysis');
             return null;
         }
         
-        const correlationMatrix = this.calculateCorrelationMatrix();
         const cardId = `correlation-${Date.now()}`;
         
+        // Wide data gets the strongest pairs instead of a matrix nobody can read
+        if (this.numericColumns.length > CORRELATION_MATRIX_MAX_COLUMNS) {
+            const result = await this.fetchCorrelation({ top: CORRELATION_TOP_PAIRS });
+            this.renderCorrelationPairs(result.pairs, cardId);
+            return {
+                id: cardId,
+                data: result.pairs,
+                title: 'Strongest Correlations',
+                subtitle: `Top ${result.pairs.length} Pearson correlations between numeric variables`
+            };
+        }
+        
+        let correlationMatrix;
+        try {
+            correlationMatrix = (await this.fetchCorrelation()).matrix;
+        } catch (error) {
+            console.error('Error loading correlations, computing them locally:', error);
+            await this.loadColumns(this.numericColumns);
+            correlationMatrix = this.calculateCorrelationMatrix();
+        }
+        
         this.renderCorrelationMatrix(correlationMatrix, cardId);
         
         return {
@@ -322,8 +402,8 @@ class StatisticsManager {
         };
     }
     
-    generateDataInsights() {
-        const insights = this.generateInsights();
+    async generateDataInsights() {
+        const insights = await this.generateInsights();
         const cardId = `insights-${Date.now()}`;
         
         this.renderDataInsights(insights, cardId);
@@ -344,6 +424,27 @@ class StatisticsManager {
             .filter(value => !isNaN(value));
     }
     
+    // Descriptive statistics from a column profile of /api/profile/
+    profileToDescriptiveStats(analysis) {
+        const format = value => (value === null || value === undefined) ? 'N/A' : value.toFixed(4);
+        return {
+            count: analysis.basic.count,
+            mean: format(analysis.basic.mean),
+            median: format(analysis.basic.median),
+            mode: analysis.basic.mode.length === 1 ? format(analysis.basic.mode[0]) : 'Multiple',
+            stdDev: format(analysis.dispersion.stdDev),
+            variance: format(analysis.dispersion.variance),
+            min: format(analysis.basic.min),
+            max: format(analysis.basic.max),
+            range: format(analysis.basic.range),
+            q1: format(analysis.dispersion.q1),
+            q3: format(analysis.dispersion.q3),
+            iqr: format(analysis.dispersion.iqr),
+            skewness: format(analysis.shape.skewness),
+            kurtosis: format(analysis.shape.kurtosis)
+        };
+    }
+    
     calculateDescriptiveStats(values) {
         const sorted = values.sort((a, b) => a - b);
         const n = values.length;
@@ -499,7 +600,7 @@ class StatisticsManager {
         return { bins, labels, binSize };
     }
     
-    generateInsights() {
+    async generateInsights() {
         const insights = [];
         
         // Data quality insights
@@ -535,7 +636,7 @@ class StatisticsManager {
         
         // Correlation insights
         if (this.numericColumns.length >= 2) {
-            const correlationInsights = this.analyzeCorrelations();
+            const correlationInsights = await this.analyzeCorrelations();
             if (correlationInsights.strongCorrelations.length > 0) {
                 insights.push({
                     title: 'Strong Correlations',
@@ -581,7 +682,20 @@ class StatisticsManager {
         return { hasOutliers, columnsWithOutliers };
     }
     
-    analyzeCorrelations() {
+    async analyzeCorrelations() {
+        try {
+            const result = await this.fetchCorrelation({ minAbs: 0.7 });
+            return {
+                strongCorrelations: result.pairs.map(pair => ({
+                    col1: pair.x,
+                    col2: pair.y,
+                    correlation: pair.r
+                }))
+            };
+        } catch (error) {
+            console.error('Error loading correlations, computing them locally:', error);
+        }
+        
         const strongCorrelations = [];
         const matrix = this.calculateCorrelationMatrix();
         
@@ -665,6 +779,11 @@ class StatisticsManager {
             matrixHTML += `<div class="correlation-cell correlation-header">${col1}</div>`;
             this.numericColumns.forEach(col2 => {
                 const value = matrix[col1][col2];
+                // null: the columns share fewer than two rows, or one is constant
+                if (value === null || value === undefined) {
+                    matrixHTML += '<div class="correlation-cell correlation-value correlation-neutral">–</div>';
+                    return;
+                }
                 const className = this.getCorrelationClass(value);
                 matrixHTML += `<div class="correlation-cell correlation-value ${className}">${value.toFixed(3)}</div>`;
             });
@@ -686,6 +805,43 @@ class StatisticsManager {
         statisticsGrid.appendChild(card);
     }
     
+    renderCorrelationPairs(pairs, cardId) {
+        const statisticsGrid = document.getElementById('statisticsGrid');
+        if (!statisticsGrid) return;
+        
+        const card = document.createElement('div');
+        card.className = 'statistics-card';
+        card.setAttribute('data-stat-type', 'correlation');
+        card.id = cardId;
+        
+        const rows = pairs.map(pair => `
+            <tr>
+                <td>${pair.x}</td>
+                <td>${pair.y}</td>
+                <td class="statistics-value"><span class="correlation-value ${this.getCorrelationClass(pair.r)}">${pair.r.toFixed(3)}</span></td>
+                <td class="statistics-value">${pair.n}</td>
+            </tr>
+        `).join('');
+        
+        card.innerHTML = `
+            <div class="statistics-card-header">
+                <h3 class="statistics-card-title">Strongest Correlations</h3>
+                <p class="statistics-card-subtitle">Top ${pairs.length} Pearson correlations among ${this.numericColumns.length} numeric variables</p>
+                <button class="delete-analysis-btn" onclick="window.statisticsManager.deleteAnalysis('${cardId}')" title="Delete this analysis">×</button>
+            </div>
+            <div class="statistics-card-body">
+                <table class="statistics-table">
+                    <thead>
+                        <tr><th>Variable</th><th>Variable</th><th>r</th><th>Rows</th></tr>
+                    </thead>
+                    <tbody>${rows}</tbody>
+                </table>
+            </div>
+        `;
+        
+        statisticsGrid.appendChild(card);
+    }
+    
     getCorrelationClass(value) {
         if (value >= 0.7) return 'correlation-strong-positive';
         if (value >= 0.3) return 'correlation-positive';
@@ -912,6 +1068,15 @@ class StatisticsManager {
     }
     
     exportCorrelationDataFromStored(matrix) {
+        if (Array.isArray(matrix)) {
+            // Strongest pairs of a wide dataset
+            let output = `Strongest Correlations:\n`;
+            matrix.forEach(pair => {
+                output += `${pair.x}\t${pair.y}\t${pair.r.toFixed(3)}\t(${pair.n} rows)\n`;
+            });
+            return output;
+        }
+        
         let output = `Correlation Matrix:\n`;
         output += `Column\t`;
         this.numericColumns.forEach(col => {
@@ -923,7 +1088,7 @@ class StatisticsManager {
             output += `${col1}\t`;
             this.numericColumns.forEach(col2 => {
                 const value = matrix[col1][col2];
-                output += `${value.toFixed(3)}\t`;
+                output += (value === null || value === undefined) ? `\t` : `${value.toFixed(3)}\t`;
             });
             output += `\n`;
         });